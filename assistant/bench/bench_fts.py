@@ -0,0 +1,80 @@
+import os, sys, time, random, shutil, tempfile, argparse
+
+# 子串检索基准：LIKE '%foo%'（全表扫描）vs files_fts MATCH（trigram 全文索引）
+# 用法（在 assistant 目录下）:
+#   python -m bench.bench_fts                 # 合成 100 万行
+#   python -m bench.bench_fts --rows 100000
+# 在临时目录中建库，不影响 data/assistant.db
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sql.db_tools as db_tools
+
+WORDS = ["report", "invoice", "draft", "final", "budget", "photo", "backup", "notes", "summary", "scan",
+         "contract", "resume", "meeting", "design", "export", "data", "project", "archive", "todo", "plan"]
+EXTS = [".pdf", ".docx", ".xlsx", ".txt", ".jpg", ".png", ".py", ".csv", ".md", ".zip"]
+
+
+def synth_rows(n_rows: int, per_dir: int, seed: int = 1):
+    rnd = random.Random(seed)
+    now = int(time.time())
+    root = os.path.join(os.sep, "bench")
+    for i in range(n_rows):
+        d = os.path.join(root, f"{WORDS[i // per_dir % len(WORDS)]}_{i // per_dir}")
+        name = f"{rnd.choice(WORDS)}_{rnd.choice(WORDS)}_{i}{rnd.choice(EXTS)}"
+        note = rnd.choice(WORDS) + " " + rnd.choice(WORDS) if i % 20 == 0 else None
+        yield (os.path.join(d, name), name, name.lower(), os.path.splitext(name)[1], i % 4096,
+               now, now, 0, now, note)
+
+
+def timed(label: str, fn, repeat: int):
+    fn()        # 预热页缓存
+    t = time.perf_counter()
+    for _ in range(repeat):
+        n = len(fn())
+    dt = (time.perf_counter() - t) / repeat
+    print(f"  {label:<16} rows={n:<8} {dt * 1000:9.2f} ms")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--per-dir", type=int, default=500)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_fts_")
+    db_tools.DB_FILE = os.path.join(tmp, "bench.db")
+    try:
+        db = db_tools.DBTools()
+        t = time.perf_counter()
+        db.cur.execute("BEGIN")
+        db.cur.executemany("""
+        INSERT INTO files (path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+        """, synth_rows(args.rows, args.per_dir))
+        db.conn.commit()
+        print(f"synthetic table: {args.rows} rows, files_fts kept in sync by triggers "
+              f"({time.perf_counter() - t:.1f}s)")
+
+        cases = [
+            ("name", "ontrac", "case_key LIKE '%ontrac%'"),          # 常见片段
+            ("name", "_12345", "case_key LIKE '%\\_12345%' ESCAPE '\\'"),   # 稀有片段
+            ("name", "summary_todo", "case_key LIKE '%summary_todo%'"),
+            ("note", "budget", "note LIKE '%budget%'"),
+        ]
+        for col, term, like in cases:
+            print(f"[{col} ~ {term}]")
+            base = timed("LIKE", lambda: db.cur.execute(f"SELECT path FROM files WHERE {like}").fetchall(),
+                         args.repeat)
+            fts = timed("files_fts MATCH", lambda: db.cur.execute(
+                f"SELECT path FROM files WHERE id IN (SELECT rowid FROM files_fts WHERE {col} MATCH ?)",
+                (f'"{term}"',)).fetchall(), args.repeat)
+            print(f"  speedup x{base / fts:.1f}")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os, sys, time, fnmatch, tempfile, argparse
+from pathlib import Path
+
+# 忽略判定微基准：旧版 should_ignore（逐次 resolve + fnmatch 循环） vs sql.ignore.IgnoreMatcher
+# 用法（在 assistant 目录下）: python -m bench.bench_ignore --dirs 200 --files 500
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql.ignore import IgnoreMatcher, DEFAULT_IGNORE_DIRS, DEFAULT_IGNORE_FILE_SUFFIX
+
+PATTERNS = ["venv/", ".venv/", "**/Lib/**", "**/site-packages/**", "node_modules/",
+            "dist/", "build/", "*.tmp", "*.part", "*.crdownload", "docs/*.bak"]
+NEGS = ["src/", "data/raw/**", "keep/*.log"]
+
+
+def legacy_should_ignore(p: str, root: str, db_file: str, globs, negs) -> bool:
+    """改造前 sql/tracker.py 中 should_ignore 的逻辑（每次调用都 resolve 并读取监听根目录）"""
+    def _norm(x): return Path(x).resolve().as_posix().lower()
+    def _rel(x):
+        try:
+            return Path(x).resolve().relative_to(Path(root).resolve()).as_posix().lower()
+        except ValueError:
+            return _norm(x)
+    p_abs, p_rel = _norm(p), _rel(p)
+    base = os.path.basename(p_abs)
+    dbn = _norm(db_file)
+    if p_abs == dbn:
+        return True
+    if p_abs.startswith(dbn):
+        tail = p_abs[len(dbn):]
+        if any(s in tail for s in (".wal", "-wal", ".journal", "-journal")):
+            return True
+    if base in DEFAULT_IGNORE_FILE_SUFFIX or any(base.endswith(s) for s in DEFAULT_IGNORE_FILE_SUFFIX):
+        return True
+    parts = Path(p_abs).parts
+    def _hit(x, pats): return any(fnmatch.fnmatch(x, pat.lower()) for pat in pats)
+    if _hit(p_rel, globs) or _hit(p_abs, globs):
+        return not (_hit(p_rel, negs) or _hit(p_abs, negs))
+    if any(seg.lower() in DEFAULT_IGNORE_DIRS for seg in parts):
+        return not (_hit(p_rel, negs) or _hit(p_abs, negs))
+    return False
+
+
+def synth_paths(root: str, n_dirs: int, n_files: int) -> list:
+    names = ["src", "docs", "keep", "data", "lib", "node_modules", "pkg", "build", "notes"]
+    exts = [".py", ".txt", ".log", ".tmp", ".md", ".bak", ".csv", ".pyc"]
+    paths = []
+    for d in range(n_dirs):
+        dp = os.path.join(root, names[d % len(names)], f"sub{d}")
+        paths.append(dp)
+        for f in range(n_files):
+            paths.append(os.path.join(dp, f"file{f}{exts[f % len(exts)]}"))
+    return paths
+
+
+def run(fn, paths) -> tuple:
+    t = time.perf_counter()
+    out = [fn(p) for p in paths]
+    return time.perf_counter() - t, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dirs", type=int, default=200)
+    ap.add_argument("--files", type=int, default=500)
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_ignore_")
+    db_file = os.path.join(root, "assistant.db")
+    paths = synth_paths(root, args.dirs, args.files)
+
+    t_old, old = run(lambda p: legacy_should_ignore(p, root, db_file, PATTERNS, NEGS), paths)
+    matcher = IgnoreMatcher(root, PATTERNS, NEGS, db_file=db_file)
+    t_new, new = run(matcher.ignored, paths)
+    # 第二遍：目录上下文已全部命中缓存
+    t_warm, _ = run(matcher.ignored, paths)
+
+    diff = sum(1 for a, b in zip(old, new) if a != b)
+    n = len(paths)
+    print(f"paths={n} ignored={sum(new)} mismatches={diff}")
+    print(f"legacy : {t_old:8.3f}s  {t_old / n * 1e6:8.2f} us/path")
+    print(f"matcher: {t_new:8.3f}s  {t_new / n * 1e6:8.2f} us/path  (cold)")
+    print(f"matcher: {t_warm:8.3f}s  {t_warm / n * 1e6:8.2f} us/path  (warm)  speedup x{t_old / t_warm:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os, sys, time, shutil, tempfile, argparse
+from pathlib import Path
+
+# 目录扫描基准：旧版 os.walk + _file_meta vs sql.scanner.scan_tree（线程/进程）
+# 用法（在 assistant 目录下）:
+#   python -m bench.bench_scan --files 1000000            # 生成合成树并测试
+#   python -m bench.bench_scan --root D:\some\tree        # 直接测试已有目录
+# 生成 100 万文件需要较长时间与约 4GB inode 空间，可先用 --files 100000 试跑
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql.ignore import IgnoreMatcher
+from sql.scanner import scan_tree
+
+_MATCHER = None
+
+
+def _ignore(p: str) -> bool:
+    # 模块级函数，进程模式下可被 pickle；子进程按环境变量重建规则
+    global _MATCHER
+    if _MATCHER is None:
+        _MATCHER = IgnoreMatcher(os.environ["BENCH_SCAN_ROOT"], [], [])
+    return _MATCHER.ignored(p)
+
+
+def legacy_scan(root: str) -> int:
+    """改造前 sync_rebuild.scan_to_rows 的逻辑：os.walk + 每个条目 stat/is_dir/resolve"""
+    def meta(p: Path):
+        st = p.stat()
+        is_dir = p.is_dir()
+        return (str(p.resolve()), p.name, p.name.lower(), "" if is_dir else p.suffix,
+                0 if is_dir else int(st.st_size), int(st.st_mtime), int(st.st_ctime),
+                1 if is_dir else 0, int(time.time()), "")
+    n = 0
+    rootp = Path(root).resolve()
+    if not _ignore(str(rootp)):
+        meta(rootp); n += 1
+    for cur, dnames, fnames in os.walk(root):
+        dnames[:] = [d for d in dnames if not _ignore(os.path.join(cur, d))]
+        for d in dnames:
+            meta(Path(cur, d)); n += 1
+        for f in fnames:
+            fp = Path(cur, f)
+            if _ignore(str(fp)):
+                continue
+            meta(fp); n += 1
+    return n
+
+
+def make_tree(root: str, n_files: int, per_dir: int, fanout: int = 32):
+    """生成 fanout 个顶层目录，每个叶子目录 per_dir 个文件"""
+    exts = [".py", ".txt", ".csv", ".md", ".json", ".log"]
+    n_dirs = max(1, n_files // per_dir)
+    made = 0
+    for d in range(n_dirs):
+        dp = os.path.join(root, f"top{d % fanout}", f"mid{d // fanout % 16}", f"leaf{d}")
+        os.makedirs(dp, exist_ok=True)
+        for f in range(min(per_dir, n_files - made)):
+            with open(os.path.join(dp, f"f{f}{exts[f % len(exts)]}"), "wb") as fh:
+                fh.write(b"x" * (f % 64))
+        made += per_dir
+        if made >= n_files:
+            break
+
+
+def timed(label: str, fn, *args):
+    t = time.perf_counter()
+    n = fn(*args)
+    dt = time.perf_counter() - t
+    print(f"{label:<22} rows={n:<9} {dt:8.2f}s  {n / dt if dt else 0:10.0f} rows/s")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", help="已有目录；不指定则生成合成树")
+    ap.add_argument("--files", type=int, default=1_000_000)
+    ap.add_argument("--per-dir", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--keep", action="store_true", help="保留生成的合成树")
+    args = ap.parse_args()
+
+    root = args.root
+    tmp = None
+    if not root:
+        tmp = root = tempfile.mkdtemp(prefix="bench_scan_")
+        t = time.perf_counter()
+        make_tree(root, args.files, args.per_dir)
+        print(f"synthetic tree: {args.files} files under {root} ({time.perf_counter() - t:.1f}s)")
+    os.environ["BENCH_SCAN_ROOT"] = root
+
+    try:
+        base = timed("legacy os.walk", legacy_scan, root)
+        thr = timed(f"scandir threads x{args.workers}",
+                    lambda: sum(1 for _ in scan_tree(root, _ignore, workers=args.workers, processes=False)))
+        prc = timed(f"scandir procs x{args.workers}",
+                    lambda: sum(1 for _ in scan_tree(root, _ignore, workers=args.workers, processes=True)))
+        print(f"speedup: threads x{base / thr:.2f}  processes x{base / prc:.2f}")
+    finally:
+        if tmp and not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
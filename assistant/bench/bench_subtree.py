@@ -0,0 +1,112 @@
+import os, sys, time, shutil, tempfile, argparse
+
+# 子树查询基准：旧版 path LIKE 'dir/%' vs DBTools.subtree（沿 parent_id 递归）
+# 用法（在 assistant 目录下）:
+#   python -m bench.bench_subtree                 # 合成 100 万行
+#   python -m bench.bench_subtree --rows 100000
+# 在临时目录中建库，不影响 data/assistant.db
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sql.db_tools as db_tools
+from sql.sync_rebuild import _with_tree, _chunks
+
+
+def synth_rows(root: str, n_rows: int, per_dir: int, fanout: int = 32):
+    """合成扫描行（父目录先于子项）：root/top{i}/mid{j}/leaf{k}/f{n}"""
+    now = int(time.time())
+
+    def row(path, is_dir, size=0):
+        name = os.path.basename(path)
+        ext = "" if is_dir else os.path.splitext(name)[1]
+        return (path, name, name.lower(), ext, size, now, now, 1 if is_dir else 0, now, "")
+
+    yield row(root, True)
+    made = 1
+    n_leaf = max(1, n_rows // (per_dir + 1))
+    seen = set()
+    for leaf in range(n_leaf):
+        top = os.path.join(root, f"top{leaf % fanout}")
+        mid = os.path.join(top, f"mid{leaf // fanout % 16}")
+        for d in (top, mid):
+            if d not in seen:
+                seen.add(d)
+                yield row(d, True)
+                made += 1
+        dp = os.path.join(mid, f"leaf{leaf}")
+        yield row(dp, True)
+        made += 1
+        for i in range(min(per_dir, n_rows - made)):
+            yield row(os.path.join(dp, f"f{i}.txt"), False, i)
+            made += 1
+        if made >= n_rows:
+            return
+
+
+def timed(label: str, fn, repeat: int):
+    fn()        # 预热页缓存
+    t = time.perf_counter()
+    for _ in range(repeat):
+        n = len(fn())
+    dt = (time.perf_counter() - t) / repeat
+    print(f"  {label:<26} rows={n:<8} {dt * 1000:9.2f} ms")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--per-dir", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_subtree_")
+    db_tools.DB_FILE = os.path.join(tmp, "bench.db")
+    root = os.path.join(os.sep, "bench")
+    try:
+        db = db_tools.DBTools()
+        t = time.perf_counter()
+        db.cur.execute("BEGIN")
+        for chunk in _chunks(_with_tree(synth_rows(root, args.rows, args.per_dir), 1), 5000):
+            db.cur.executemany("""
+            INSERT INTO files (id,path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,
+                               root_id,parent_id,depth)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            """, chunk)
+        db.conn.commit()
+        db.cur.execute("ANALYZE")
+        total = db.cur.execute("SELECT count(*) FROM files").fetchone()[0]
+        print(f"synthetic table: {total} rows ({time.perf_counter() - t:.1f}s)")
+
+        def like(path):
+            # 改造前 list_file_and_dir_paths 的查询
+            return db.cur.execute("SELECT path FROM files WHERE path LIKE ?", (path + os.sep + "%",)).fetchall()
+
+        def children_like(path):
+            depth = db_tools.tree_pos(path)[1] + 1
+            return db.cur.execute("SELECT path FROM files WHERE path LIKE ? AND depth = ?",
+                                  (path + os.sep + "%", depth)).fetchall()
+
+        def children_parent(path):
+            return db.cur.execute("SELECT path FROM files WHERE parent_id = (SELECT id FROM files WHERE path = ?)",
+                                  (path,)).fetchall()
+
+        cases = [
+            ("leaf", os.path.join(root, "top0", "mid0", "leaf0")),
+            ("mid", os.path.join(root, "top0", "mid0")),
+            ("top", os.path.join(root, "top0")),
+        ]
+        for label, path in cases:
+            print(f"[{label}] {path}")
+            base = timed("before: path LIKE", lambda: like(path), args.repeat)
+            new = timed("after:  subtree()", lambda: db.subtree(path), args.repeat)
+            print(f"  speedup x{base / new:.1f}")
+            base = timed("before: children LIKE", lambda: children_like(path), args.repeat)
+            new = timed("after:  children parent_id", lambda: children_parent(path), args.repeat)
+            print(f"  speedup x{base / new:.1f}")
+        db.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
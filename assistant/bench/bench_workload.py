@@ -0,0 +1,222 @@
+import os, re, sys, time, math, random, shutil, tempfile, argparse
+
+# 查询负载基准：回放 bench/workload.sql 中模型生成的典型查询，比较改造前的单列索引与 db_tools.INDEXES 的复合覆盖索引
+# 用法（在 assistant 目录下）:
+#   python -m bench.bench_workload                          # 依次合成 10 万 / 100 万 / 500 万行
+#   python -m bench.bench_workload --rows 100000 --plan     # 只跑 10 万行，并打印每条查询的执行计划
+# 每条查询按界面的方式计时：ResultPager 取第一页 + count()（不走查询结果缓存、不设预算）
+# 在临时目录中建库，不影响 data/assistant.db
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sql.db_tools as db_tools
+from sql import rollup
+from sql.pager import ResultPager
+from sql.query_budget import QueryBudget
+from sql.sync_rebuild import _with_tree, _chunks
+
+WORKLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload.sql")
+
+# 改造前 _ensure_schema 建的索引
+BASELINE = [
+    ("idx_files_case_key", "files(case_key)"),
+    ("idx_files_ext", "files(ext)"),
+    ("idx_files_mtime", "files(mtime)"),
+    ("idx_files_deleted", "files(deleted)"),
+    ("idx_files_size", "files(size)"),
+    ("idx_files_root_id", "files(root_id)"),
+    ("idx_files_parent", "files(parent_id)"),
+]
+
+# 扩展名及权重（大致按个人电脑上的分布）
+EXTS = [(".jpg", 18), (".png", 10), (".pdf", 8), (".txt", 8), (".py", 8), (".js", 7), (".docx", 4),
+        (".xlsx", 3), (".md", 5), (".json", 6), (".zip", 2), (".mp4", 1), (".mp3", 2), ("", 6), (".log", 4),
+        (".csv", 3), (".html", 3), (".dll", 2)]
+WORDS = ["report", "invoice", "draft", "final", "budget", "photo", "backup", "notes", "summary", "scan",
+         "readme", "main", "index", "config", "data", "test", "utils", "image", "export", "plan"]
+YEAR = 365 * 86400
+
+
+def load_workload(path: str = WORKLOAD) -> list:
+    """[(名称, 问题, SQL), ...]"""
+    items = []
+    for block in re.split(r"^-- name:\s*", open(path, encoding="utf-8").read(), flags=re.M)[1:]:
+        lines = block.strip().splitlines()
+        question = lines[1].lstrip("- ").strip() if len(lines) > 1 and lines[1].startswith("--") else ""
+        sql = " ".join(l.strip() for l in lines[1:] if l.strip() and not l.strip().startswith("--"))
+        items.append((lines[0].strip(), question, sql))
+    return items
+
+
+def synth_rows(root: str, n_rows: int, per_dir: int, now: int, seed: int = 1):
+    """合成扫描行（父目录先于子项）：root/top{i}/mid{j}/leaf{k}/文件；大小对数正态，mtime 偏向近期"""
+    rnd = random.Random(seed)
+    exts = [e for e, _ in EXTS]
+    weights = [w for _, w in EXTS]
+
+    def row(path, is_dir, size=0, mtime=now):
+        name = os.path.basename(path)
+        ext = "" if is_dir else os.path.splitext(name)[1]
+        return (path, name, name.lower(), ext, size, mtime, mtime, 1 if is_dir else 0, now, None)
+
+    yield row(root, True)
+    made = 1
+    seen = set()
+    leaf = 0
+    while made < n_rows:
+        top = os.path.join(root, f"top{leaf % 32}")
+        mid = os.path.join(top, f"mid{leaf // 32 % 16}")
+        for d in (top, mid):
+            if d not in seen:
+                seen.add(d)
+                yield row(d, True)
+                made += 1
+        dp = os.path.join(mid, f"leaf{leaf}")
+        yield row(dp, True)
+        made += 1
+        for i in range(min(rnd.randint(per_dir // 2, per_dir * 3 // 2), n_rows - made)):
+            ext = rnd.choices(exts, weights)[0]
+            size = 0 if rnd.random() < 0.02 else int(math.exp(rnd.gauss(10, 2.5)))
+            mtime = now - int(YEAR * 3 * rnd.random() ** 2)
+            yield row(os.path.join(dp, f"{rnd.choice(WORDS)}_{i}{ext}"), False, size, mtime)
+            made += 1
+        leaf += 1
+
+
+def build(n_rows: int, per_dir: int, now: int) -> str:
+    """建库并批量写入（写入期间去掉全文索引与目录汇总的触发器，写完一次性重建），返回样例目录"""
+    db = db_tools.DBTools()
+    root = os.path.join(os.sep, "bench")
+    t = time.perf_counter()
+    for name in ("trg_files_fts_ai", "trg_files_fts_ad", "trg_files_fts_au",
+                 "trg_rollup_ai", "trg_rollup_ad", "trg_rollup_au"):
+        db.cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    db.cur.execute("DROP TABLE IF EXISTS files_fts")
+    for name in {n for n, _ in BASELINE + db_tools.INDEXES}:
+        db.cur.execute(f"DROP INDEX IF EXISTS {name}")
+    db.cur.execute("BEGIN")
+    for chunk in _chunks(_with_tree(synth_rows(root, n_rows, per_dir, now), 1), 5000):
+        db.cur.executemany("""
+        INSERT INTO files (id,path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,
+                           root_id,parent_id,depth)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, chunk)
+    db_tools.ensure_fts(db.cur)
+    rollup.ensure(db.cur)
+    rollup.recompute(db.cur)
+    db.conn.commit()
+    print(f"synthetic table: {n_rows} rows ({time.perf_counter() - t:.1f}s)")
+    db.close()
+    return os.path.join(root, "top0")
+
+
+def use_indexes(indexes: list, drop: list, analyze: bool):
+    db = db_tools.DBTools()
+    t = time.perf_counter()
+    for name in drop:
+        db.cur.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, target in indexes:
+        db.cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    db.cur.execute("DROP TABLE IF EXISTS sqlite_stat1")
+    if analyze:
+        db_tools.refresh_stats(db.cur, force=True)
+    db.conn.commit()
+    size = index_bytes(db, [n for n, _ in indexes])
+    print(f"  indexes: {len(indexes)} ({size / (1 << 20):.0f} MB) built in {time.perf_counter() - t:.1f}s")
+    db.close()
+
+
+def index_bytes(db, names: list) -> int:
+    try:
+        marks = ",".join("?" * len(names))
+        return db.cur.execute(f"SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name IN ({marks})",
+                              names).fetchone()[0]
+    except Exception:
+        return 0        # 未编译 DBSTAT 虚拟表
+
+
+def plan(sql: str) -> str:
+    db = db_tools.DBTools()
+    try:
+        steps = [r[3] for r in db.cur.execute("EXPLAIN QUERY PLAN " + sql)]
+    finally:
+        db.close()
+    return " | ".join(steps)
+
+
+def run(workload: list, repeat: int) -> dict:
+    """每条查询的 (第一页 + 计数 ms, 行数)"""
+    out = {}
+    for name, _, sql in workload:
+        def once():
+            p = ResultPager(sql, use_cache=False, budget=QueryBudget(seconds=0, steps=0))
+            try:
+                p.next_page()
+                return p.count()[0]
+            finally:
+                p.close()
+        once()      # 预热页缓存
+        t = time.perf_counter()
+        for _ in range(repeat):
+            n = once()
+        out[name] = ((time.perf_counter() - t) / repeat * 1000, n)
+    return out
+
+
+def write_cost(n: int, now: int) -> float:
+    """n 行 UPSERT（一个事务）的耗时 ms：索引越多写入越慢"""
+    db = db_tools.DBTools()
+    rows = [(os.path.join(os.sep, "bench", "top1", f"w{i}.txt"), f"w{i}.txt", f"w{i}.txt", ".txt", i, now, now, 0,
+             now, 1, os.path.join(os.sep, "bench", "top1"), 2) for i in range(n)]
+    t = time.perf_counter()
+    db.cur.execute("BEGIN")
+    db.cur.executemany(db_tools.UPSERT_SQL, rows)
+    db.conn.rollback()
+    db.close()
+    return (time.perf_counter() - t) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", default="100000,1000000,5000000")
+    ap.add_argument("--per-dir", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--plan", action="store_true", help="打印每条查询改造后的执行计划")
+    args = ap.parse_args()
+
+    workload = load_workload()
+    now = int(time.time())
+    for n_rows in (int(x) for x in args.rows.split(",")):
+        tmp = tempfile.mkdtemp(prefix="bench_workload_")
+        db_tools.DB_FILE = os.path.join(tmp, "bench.db")
+        try:
+            sample = build(n_rows, args.per_dir, now)
+            subst = {"dir": sample, "leaf": os.path.join(sample, "mid0", "leaf0"),
+                     "week_ago": now - 7 * 86400, "year_ago": now - YEAR}
+            queries = [(name, q, sql.format(**subst)) for name, q, sql in workload]
+
+            print("[before] single-column indexes, no ANALYZE")
+            use_indexes(BASELINE, [], analyze=False)
+            before = run(queries, args.repeat)
+            w_before = write_cost(10000, now)
+
+            print("[after]  db_tools.INDEXES + ANALYZE")
+            use_indexes(db_tools.INDEXES, [n for n, _ in BASELINE if n not in dict(db_tools.INDEXES)], analyze=True)
+            after = run(queries, args.repeat)
+            w_after = write_cost(10000, now)
+
+            print(f"  {'query':<22}{'rows':>9}{'before ms':>12}{'after ms':>11}{'speedup':>9}")
+            for name, _, sql in queries:
+                (b, n), (a, _) = before[name], after[name]
+                print(f"  {name:<22}{n:>9}{b:>12.2f}{a:>11.2f}{b / a if a else 0:>8.1f}x")
+                if args.plan:
+                    print(f"      {plan(sql)}")
+            tb, ta = sum(v[0] for v in before.values()), sum(v[0] for v in after.values())
+            print(f"  {'total':<22}{'':>9}{tb:>12.1f}{ta:>11.1f}{tb / ta:>8.1f}x")
+            print(f"  10k-row upsert: {w_before:.0f} ms -> {w_after:.0f} ms")
+        finally:
+            db_tools.get_pool().close_all()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
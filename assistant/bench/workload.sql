@@ -0,0 +1,79 @@
+-- 模型生成的典型查询（按提示词 data/prompt.txt 的写法整理，供 bench_workload.py 回放）
+-- 每条以 "-- name: 名称" 开头，下一行注释为用户的原始问题；{dir} {leaf} {week_ago} {year_ago} 由基准脚本替换
+-- 改动索引（sql/db_tools.py 的 INDEXES）前后都应回放一遍
+
+-- name: largest_of_ext
+-- 列出 .py 最大的 5 个文件
+select path, size from files where ext = '.py' and deleted = 0 order by size desc limit 5;
+
+-- name: count_ext
+-- 有多少个 pdf
+select count(*) from files where ext = '.pdf' and deleted = 0;
+
+-- name: total_size_ext
+-- 视频一共占了多大空间
+select count(*), sum(size) from files where ext = '.mp4' and deleted = 0;
+
+-- name: ext_breakdown
+-- 哪些类型的文件最多
+select ext, count(*), sum(size) from files where deleted = 0 group by ext order by count(*) desc limit 10;
+
+-- name: largest_files
+-- 最大的 10 个文件
+select path, size from files where deleted = 0 order by size desc limit 10;
+
+-- name: largest_any
+-- 最大的 10 个文件（没写 deleted = 0）
+select path, size from files order by size desc limit 10;
+
+-- name: recent_files
+-- 最近修改的 20 个文件
+select path, mtime from files where deleted = 0 order by mtime desc limit 20;
+
+-- name: recent_of_ext
+-- 这周改过的 word 文档
+select path, mtime from files where ext = '.docx' and deleted = 0 and mtime >= {week_ago} order by mtime desc;
+
+-- name: list_ext
+-- 列出所有 pdf
+select path, size from files where ext = '.pdf' and deleted = 0;
+
+-- name: list_ext_by_size
+-- 按大小列出所有 zip
+select path, size from files where ext = '.zip' and deleted = 0 order by size desc;
+
+-- name: big_files
+-- 超过 100MB 的文件
+select path, size from files where deleted = 0 and size > 104857600 order by size desc;
+
+-- name: old_files
+-- 一年以上没动过的文件
+select path, mtime from files where deleted = 0 and mtime < {year_ago} order by mtime;
+
+-- name: empty_files
+-- 空文件有哪些
+select path from files where deleted = 0 and size = 0;
+
+-- name: by_name
+-- 找 readme.md
+select path from files where case_key = 'readme.md';
+
+-- name: children
+-- 某个目录下有什么
+select name, size from files where parent_id = (select id from files where path = '{leaf}') order by name;
+
+-- name: subtree_ext
+-- 某个目录下有多少 py 文件（子树范围条件）
+select count(*) from files where path >= '{dir}/' and path < '{dir}0' and ext = '.py' and deleted = 0;
+
+-- name: fts_name_ext
+-- 名字里带 report 的 pdf
+select path, size from files where id in (select rowid from files_fts where name match '"report"') and ext = '.pdf' and deleted = 0;
+
+-- name: rollup_biggest_dirs
+-- 哪些文件夹最大
+select (select path from files where id = dir_id) as path, size from dir_stats order by size desc limit 10;
+
+-- name: rollup_ext_under
+-- 某个目录下有多少 pdf（目录汇总）
+select files, size from dir_ext_stats where dir_id = (select id from files where path = '{dir}') and ext = '.pdf';
@@ -4,13 +4,71 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 JSON_FILE = os.path.join(DATA_DIR, 'file_index2.json')
 DB_FILE = os.path.join(DATA_DIR, 'assistant.db')
-HISTORY_RECORD = os.path.join(DATA_DIR, 'history_record.json')
+METRICS_FILE = os.path.join(DATA_DIR, 'metrics.json')
 
 
 _CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
 _DEFAULTS = {
     "WATCH_PATH": r"C:\Users\default_user",  # 你的默认目录
-    "API_KEY":""
+    # 监听根目录注册表 [{"id": 1, "path": ..., "mode": "poll"(可选)}, ...]；未配置(None)时由 WATCH_PATH 充当 1 号根目录
+    "WATCH_ROOTS": None,
+    "API_KEY":"",
+    # 监听事件队列：最长合并等待(毫秒) 与 单批最大事件数
+    "TRACKER_FLUSH_MS": 200,
+    "TRACKER_BATCH_SIZE": 1000,
+    # 目录扫描：并行线程数；慢盘/网络盘可改用进程池（每个顶层目录一个进程）
+    "SCAN_WORKERS": 16,
+    "SCAN_PROCESSES": False,
+    # 监听器指标快照写入 data/metrics.json 的周期(秒)，0 为不写
+    "METRICS_DUMP_SECONDS": 10,
+    # 后台内容哈希：开关、线程数、读块大小(KB)、前台有负载后暂停的秒数
+    "HASH_ENABLED": True,
+    "HASH_WORKERS": 2,
+    "HASH_CHUNK_KB": 1024,
+    "HASH_PAUSE_SECONDS": 2,
+    # 后台正文抽取（按内容检索）：开关、只抽取不超过多大的文件(KB)、读取速率上限(MB/s，0 为不限)；
+    # 前台有负载时与哈希一起暂停
+    "EXTRACT_ENABLED": True,
+    "EXTRACT_MAX_KB": 1024,
+    "EXTRACT_MB_PER_S": 4,
+    # 监听方式：native 为系统通知（inotify/ReadDirectoryChangesW），poll 为快照对比轮询（网络盘）
+    # 根目录注册表中的 "mode" 优先；轮询间隔(秒)、CPU 预算(单核比例)、每多少轮做一次完整校验
+    "WATCH_MODE": "native",
+    "POLL_INTERVAL_SECONDS": 5,
+    "POLL_CPU_BUDGET": 0.25,
+    "POLL_FULL_EVERY": 12,
+    # 数据库连接池：最多同时借出的连接数、最多保留的空闲连接数、每个连接的预编译语句缓存、借用等待上限(秒)
+    "POOL_MAX_CONNECTIONS": 16,
+    "POOL_MAX_IDLE": 8,
+    "POOL_CACHED_STATEMENTS": 256,
+    "POOL_WAIT_SECONDS": 5,
+    # SQL 查询结果分页：每页行数、总行数最多数到多少（超过显示为 N+）
+    "PAGE_SIZE": 50,
+    "PAGE_COUNT_LIMIT": 100000,
+    # 模型生成 SQL 的执行预算：每次执行的时间上限(秒)、VM 指令数上限（0 为不限）、每多少条指令检查一次；
+    # files 不少于多少行时预检全表扫描，发现全表扫描时 warn（提示后执行）/ block（拒绝执行）
+    "QUERY_TIMEOUT_SECONDS": 10,
+    "QUERY_MAX_STEPS": 200000000,
+    "QUERY_CHECK_EVERY": 10000,
+    "QUERY_SCAN_WARN_ROWS": 100000,
+    "QUERY_FULL_SCAN": "warn",
+    # 查询结果缓存：总容量与单条结果上限（字节，按结果估算），总容量为 0 时关闭
+    "CACHE_MAX_BYTES": 32 * 1024 * 1024,
+    "CACHE_MAX_ENTRY_BYTES": 4 * 1024 * 1024,
+    # 数据库后台维护（空闲时执行）：开关、最近多少秒无提交算空闲；检查点周期(秒)与 -wal 超过多少 MB 时截断；
+    # PRAGMA optimize 与缓存调整周期(秒)；incremental_vacuum 周期(秒)、空闲页超过多少 MB 才回收、每步回收多少 MB；
+    # 旧库（auto_vacuum 未开启）是否自动执行一次完整 VACUUM 转换；cache_size（全部连接合计，均分到各连接）与 mmap_size 的上限(MB)
+    "MAINT_ENABLED": True,
+    "MAINT_IDLE_SECONDS": 30,
+    "MAINT_CHECKPOINT_SECONDS": 60,
+    "MAINT_WAL_TRUNCATE_MB": 64,
+    "MAINT_OPTIMIZE_SECONDS": 3600,
+    "MAINT_VACUUM_SECONDS": 600,
+    "MAINT_VACUUM_MIN_MB": 16,
+    "MAINT_VACUUM_STEP_MB": 8,
+    "MAINT_CONVERT_VACUUM": False,
+    "MAINT_CACHE_MAX_MB": 64,
+    "MAINT_MMAP_MAX_MB": 1024,
 }
 _lock = threading.RLock()
 _cache = None  # 进程内缓存
@@ -61,6 +119,45 @@ def set_watch_path(path: str) -> None:
     cfg["WATCH_PATH"] = path
     save(cfg)
 
+def _same_or_nested(a: str, b: str) -> bool:
+    a, b = os.path.normcase(a), os.path.normcase(b)
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+def get_watch_roots() -> list[dict]:
+    """全部监听根目录 [{"id": int, "path": str}]"""
+    roots = load().get("WATCH_ROOTS")
+    if roots is None:
+        return [{"id": 1, "path": get_watch_path()}]
+    return [dict(r) for r in roots]
+
+def add_watch_root(path: str, mode: str = None) -> int:
+    """
+    注册一个根目录并返回其 id；已注册则返回原 id，与已有根目录互相嵌套时抛 ValueError
+    mode: 该根目录的监听方式（native/poll），None 为使用 WATCH_MODE
+    """
+    path = os.path.normpath(os.path.abspath(path))
+    with _lock:
+        cfg = load()
+        roots = get_watch_roots()
+        if cfg.get("WATCH_ROOTS") is None and not os.path.isdir(roots[0]["path"]):
+            roots = []      # 默认的 WATCH_PATH 不存在，不必保留
+        for r in roots:
+            if os.path.normcase(r["path"]) == os.path.normcase(path):
+                return r["id"]
+            if _same_or_nested(r["path"], path):
+                raise ValueError(f"与已有根目录重叠: {r['path']}")
+        root_id = max((r["id"] for r in roots), default=0) + 1
+        roots.append({"id": root_id, "path": path, **({"mode": mode} if mode else {})})
+        cfg["WATCH_ROOTS"] = roots
+        save(cfg)
+        return root_id
+
+def remove_watch_root(root_id: int) -> None:
+    with _lock:
+        cfg = load()
+        cfg["WATCH_ROOTS"] = [r for r in get_watch_roots() if r["id"] != root_id]
+        save(cfg)
+
 def get_api() -> str:
     return load().get("API_KEY", _DEFAULTS["API_KEY"])
 
@@ -68,3 +165,7 @@ def set_api(api:str) -> None:
     cfg = load()
     cfg["API_KEY"] = api
     save(cfg)
+
+def get_option(key: str):
+    """读取任意配置项，未配置时回落到 _DEFAULTS"""
+    return load().get(key, _DEFAULTS.get(key))
@@ -1,7 +1,7 @@
 import os.path
 import sys,json
-from PyQt5.QtWidgets import QStackedWidget,QLabel,QApplication, QMainWindow,QHBoxLayout, QToolBar, QAction, QSplitter, QListWidget, QSizePolicy, QTextEdit, QLineEdit, QPushButton, QWidget, QVBoxLayout
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QStackedWidget,QLabel,QApplication, QMainWindow,QHBoxLayout, QToolBar, QAction, QSplitter, QListWidget, QListWidgetItem, QSizePolicy, QTextEdit, QLineEdit, QPushButton, QWidget, QVBoxLayout, QCheckBox
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
 from PyQt5 import QtGui, QtCore
 from data.meta_data import DATA_DIR
 from core.test_claud import ClaudClient
@@ -9,13 +9,18 @@ from core.memory_pipe import Memory_Pipe
 from core.ai_parse import parse_response,merge_response
 from sql.sql_filter import SQL_Filter
 from sql.db_tools import DBTools
+from sql.pager import ResultPager, format_count
+from sql.query_budget import QueryBudget, QueryAborted, check_plan, full_scan_policy
 from analyse.analyse import analyze
 from visualization.interface import visualization
 from generate.create_file import createFile
-from sql.tracker import start_watching,stop_watching, should_ignore,initialize
+from sql.tracker import start_watching,stop_watching,list_roots,add_root,remove_root
 from cmd.cmd_executor import executor
 from core.error_handler import error
-from sql.sync_rebuild import rebuild_files_table
+from sql.sync_rebuild import reconcile_files_table
+from sql import metrics
+from sql.hasher import foreground
+from sql.duplicates import find_duplicates, format_duplicates
 import data.meta_data as meta_data
 
 class AIWorker(QThread):
@@ -31,11 +36,81 @@ class AIWorker(QThread):
         filter_reply = parse_response(reply)
         self.finished.emit(filter_reply)
 
+class SQLWorker(QThread):
+    # 线程类,用于执行 SQL：在预算内执行（超时/超出计算量时中止），界面可通过 budget.cancel() 取消
+    # 给定 pager 时取它的下一页；否则先做全表扫描预检，查询只取第一页与总行数
+    finished = pyqtSignal(object)
+
+    def __init__(self, sql:str = None, pager:ResultPager = None):
+        super().__init__()
+        self.sql = sql
+        self.pager = pager
+        self.budget = pager.budget if pager is not None else QueryBudget()
+
+    def run(self):
+        result = {"rows": None, "count": None, "pager": self.pager, "scans": [], "error": None}
+        try:
+            if self.pager is None:
+                is_select = self.sql.lstrip().lower().startswith("select")
+                with DBTools() as db:
+                    result["scans"] = check_plan(db.conn, self.sql)
+                    if not full_scan_policy(result["scans"]):
+                        result["error"] = "blocked"
+                    elif not is_select:
+                        result["rows"] = db.custom_instruction(self.sql, self.budget)
+                if is_select and result["error"] is None:
+                    result["pager"] = ResultPager(self.sql, budget=self.budget)
+            if result["pager"] is not None:
+                result["rows"] = result["pager"].next_page()
+                result["count"] = result["pager"].count()
+        except QueryAborted as e:
+            result["error"] = e
+        except Exception as e:
+            error("main.py", "SQLWorker", e)
+            result["error"] = e
+        self.finished.emit(result)
+
+class DupWorker(QThread):
+    # 线程类,用于查找重复文件（首次查找可能要读取大量文件算哈希，不能放在界面线程）
+    # 结果为格式化后的文本，失败时为异常
+    finished = pyqtSignal(object)
+
+    def __init__(self, scope:str = None):
+        super().__init__()
+        self.scope = scope
+
+    def run(self):
+        try:
+            result = format_duplicates(find_duplicates(scope=self.scope))
+        except Exception as e:
+            error("main.py", "DupWorker", e)
+            result = e
+        self.finished.emit(result)
+
 class WatchThread(QThread):
     def run(self):
-        rebuild_files_table(meta_data.get_watch_path(), should_ignore)
+        # 启动时逐个根目录增量对账；需要彻底修复索引时改用 sync_rebuild.rebuild_files_table
+        for root in list_roots():
+            if os.path.isdir(root.path):
+                reconcile_files_table(root.path, root.matcher.ignored, root.root_id)
         start_watching()
 
+class RootThread(QThread):
+    # 线程类,用于添加/移除监听根目录（只扫描或删除该根目录的记录）
+    finished = pyqtSignal(object)
+
+    def __init__(self, action:str, arg):
+        super().__init__()
+        self.action = action
+        self.arg = arg
+
+    def run(self):
+        try:
+            result = add_root(*self.arg) if self.action == "add" else remove_root(self.arg)
+        except Exception as e:
+            result = e
+        self.finished.emit(result)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -43,6 +118,11 @@ class MainWindow(QMainWindow):
         # 记忆管道
         self.memory_pipe = Memory_Pipe(5)
 
+        # 当前 SQL 查询的分页器（“更多结果”按需取下一页）与执行中的 SQL 线程（“取消”中止它）
+        self.pager = None
+        self.sql_worker = None
+        self.dup_worker = None
+
         # 布局代码 #
         # 设置窗口标题和大小
         self.setWindowTitle("Assistant")
@@ -63,7 +143,7 @@ class MainWindow(QMainWindow):
 
         # 左侧侧栏
         side = QListWidget()
-        side.addItems(["会话", "设置", "API"])  # 占位
+        side.addItems(["会话", "设置", "API", "监控"])  # 占位
         side.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
         side.setObjectName("SideList")
 
@@ -80,8 +160,17 @@ class MainWindow(QMainWindow):
         self.send_button.setObjectName("PrimaryButton")
         self.send_button.clicked.connect(self.send_message)
 
+        self.more_button = QPushButton("更多结果")
+        self.more_button.clicked.connect(self.show_more)
+        self.more_button.setVisible(False)
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel_sql)
+        self.cancel_button.setVisible(False)
+
         h = QHBoxLayout()
         h.addWidget(self.input_box, 1)
+        h.addWidget(self.more_button)
+        h.addWidget(self.cancel_button)
         h.addWidget(self.send_button)
 
         chat_layout.addWidget(self.chat_area)
@@ -91,40 +180,63 @@ class MainWindow(QMainWindow):
         settings_page = QWidget()
         settings_layout = QVBoxLayout(settings_page)
 
-        # 显示当前路径
-        self.watch_path_label = QLabel(f"当前 WATCH_PATH: {meta_data.get_watch_path()}")
+        # 当前监听的根目录
+        self.roots_label = QLabel("监听根目录:")
+        self.roots_list = QListWidget()
+        self.refresh_roots()
 
-        # 输入新路径
+        # 输入新根目录
         self.watch_path_edit = QLineEdit()
-        self.watch_path_edit.setPlaceholderText("输入新的 WATCH_PATH")
+        self.watch_path_edit.setPlaceholderText("输入要添加的根目录")
+        self.poll_check = QCheckBox("轮询模式（网络盘等系统通知不可靠的目录）")
 
-        save_btn = QPushButton("保存")
+        add_root_btn = QPushButton("添加")
+        remove_root_btn = QPushButton("移除选中")
 
-        def save_path():
+        def on_root_done(result):
+            if isinstance(result, Exception):
+                self.statusBar().showMessage(f"操作失败: {result}")
+            else:
+                self.statusBar().showMessage("根目录已更新")
+            self.refresh_roots()
+
+        def add_path():
             new_path = self.watch_path_edit.text().strip()
 
             if not new_path:
-                self.statusBar().showMessage("WATCH_PATH 为空")
+                self.statusBar().showMessage("路径为空")
                 return
             if not os.path.isdir(new_path):
                 self.statusBar().showMessage("路径不存在或不是目录")
                 return
 
-            # 重启监控
-            print(f"修改前:{meta_data.get_watch_path()}")
-            stop_watching()
-            meta_data.set_watch_path(new_path)
-            print(f"修改后:{meta_data.get_watch_path()}")
-            initialize()
-            start_watching()
-            self.watch_path_label.setText(f"当前 WATCH_PATH: {meta_data.get_watch_path()}")
-            self.statusBar().showMessage(f"WATCH_PATH 修改为: {meta_data.get_watch_path()}")
+            # 只扫描新根目录，其他根目录的索引与监听不受影响
+            self.statusBar().showMessage(f"正在索引: {new_path}")
+            mode = "poll" if self.poll_check.isChecked() else None
+            self.root_thread = RootThread("add", (new_path, mode))
+            self.root_thread.finished.connect(on_root_done)
+            self.root_thread.start()
+
+        def remove_path():
+            item = self.roots_list.currentItem()
+            if item is None:
+                self.statusBar().showMessage("请先选中一个根目录")
+                return
+            root_id = item.data(QtCore.Qt.UserRole)
+            self.statusBar().showMessage(f"正在移除: {item.text()}")
+            self.root_thread = RootThread("remove", root_id)
+            self.root_thread.finished.connect(on_root_done)
+            self.root_thread.start()
 
-        save_btn.clicked.connect(save_path)
+        add_root_btn.clicked.connect(add_path)
+        remove_root_btn.clicked.connect(remove_path)
 
-        settings_layout.addWidget(self.watch_path_label)
+        settings_layout.addWidget(self.roots_label)
+        settings_layout.addWidget(self.roots_list)
         settings_layout.addWidget(self.watch_path_edit)
-        settings_layout.addWidget(save_btn)
+        settings_layout.addWidget(self.poll_check)
+        settings_layout.addWidget(add_root_btn)
+        settings_layout.addWidget(remove_root_btn)
 
         # --- 页面3：API ---
         api_page = QWidget()
@@ -146,28 +258,42 @@ class MainWindow(QMainWindow):
                 self.statusBar().showMessage("API 为空")
                 return
 
-            # 重启监控
             print(f"修改前:{meta_data.get_api()}")
-            stop_watching()
             meta_data.set_api(new_api)
             print(f"修改后:{meta_data.get_api()}")
-            initialize()
-            start_watching()
             self.api_label.setText(f"当前 API: {meta_data.get_api()}")
             self.statusBar().showMessage(f"API 修改为: {meta_data.get_api()}")
 
-        save_btn.clicked.connect(save_api)
+        save_api_btn.clicked.connect(save_api)
 
         api_layout.addWidget(self.api_label)
         api_layout.addWidget(self.api_edit)
         api_layout.addWidget(save_api_btn)
 
 
+        # --- 页面4：监控 ---
+        metrics_page = QWidget()
+        metrics_layout = QVBoxLayout(metrics_page)
+
+        # 监听器指标，页面可见时每 2 秒刷新一次
+        self.metrics_area = QTextEdit(readOnly=True)
+        metrics_layout.addWidget(self.metrics_area)
+
+        def refresh_metrics():
+            if metrics_page.isVisible():
+                self.metrics_area.setPlainText(metrics.format_snapshot(metrics.snapshot()))
+
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(refresh_metrics)
+        self.metrics_timer.start(2000)
+
+
         # --- 右侧堆叠页面 ---
         stacked = QStackedWidget()
         stacked.addWidget(chat_page)  # index 0
         stacked.addWidget(settings_page)  # index 1
         stacked.addWidget(api_page) # index 2
+        stacked.addWidget(metrics_page) # index 3
 
         # 绑定切换逻辑
         side.currentRowChanged.connect(stacked.setCurrentIndex)
@@ -184,6 +310,14 @@ class MainWindow(QMainWindow):
         self.watch_thread = WatchThread()
         self.watch_thread.start()
 
+    def refresh_roots(self):
+        self.roots_list.clear()
+        for root in meta_data.get_watch_roots():
+            mode = "（轮询）" if root.get("mode") == "poll" else ""
+            item = QListWidgetItem(f"{root['id']}: {root['path']}{mode}")
+            item.setData(QtCore.Qt.UserRole, root["id"])
+            self.roots_list.addItem(item)
+
     def closeEvent(self, event):
         # 窗口关闭时调用
         try:
@@ -191,9 +325,13 @@ class MainWindow(QMainWindow):
             stop_watching()
         except Exception as e:
             error("main.py","main.py",e)
+        self.stop_sql()
+        self.close_pager()
         if hasattr(self, "watch_thread"):
             self.watch_thread.quit()
             self.watch_thread.wait()
+        if self.dup_worker is not None:
+            self.dup_worker.wait()
         event.accept()
 
 
@@ -225,18 +363,23 @@ class MainWindow(QMainWindow):
         # print(self.memory_pipe.get_pipe())
 
         ### 指令分流 ###
-        sql_output = None
+        sql_started = False
         analyze_output = None
         cmd_output = None
+        dup_started = False
         # 当指令是sql，意味着这条信息的目的是查询sql。并且有实际存在的sql语句
         if filter_reply["sql"] and filter_reply["instruction"].strip() == "sql":
             judge = SQL_Filter(filter_reply["sql"])
             if judge["status"]:
                 # 合法sql,可以执行
-                # 连接数据库, 执行sql
-                db = DBTools()
-                sql_output = db.custom_instruction(str(judge['sql']))
-                db.close()
+                # 连接数据库, 执行sql（期间后台哈希让路）
+                # 在 SQLWorker 线程中按预算执行，查询只取第一页和总行数，结果由 on_sql_done 显示
+                foreground()
+                self.stop_sql()
+                self.close_pager()
+                self.start_sql(SQLWorker(sql=str(judge['sql'])),
+                               lambda result: self.on_sql_done(result, merge, str(judge['sql'])))
+                sql_started = True
             else:
                 # 未授权sql, 禁止执行
                 pass
@@ -271,6 +414,22 @@ class MainWindow(QMainWindow):
                     self.chat_area.append("命令执行失败")
             else:
                 self.chat_area.append("未找到要执行的命令")
+        elif filter_reply["instruction"].strip() == "duplicates":
+            # 当指令为duplicates，意味着这条信息的目的是查找重复文件，文件路径(可为空)为查找范围
+            self.chat_area.append("调用重复文件查找模块")
+            scope = filter_reply["file_path"].strip() or None
+            if scope and not os.path.isdir(scope):
+                self.chat_area.append("查找范围不是目录，改为在全部根目录中查找")
+                scope = None
+            if self.dup_worker is not None:
+                self.chat_area.append("上一次查找尚未完成，请稍后再试")
+            else:
+                # 在 DupWorker 线程中查找（期间后台哈希让路），结果由 on_dup_done 显示
+                foreground()
+                self.dup_worker = DupWorker(scope)
+                self.dup_worker.finished.connect(lambda result: self.on_dup_done(result, merge))
+                self.dup_worker.start()
+                dup_started = True
         elif filter_reply["instruction"].strip() == "无":
             # 当指令为无，意味着用户的目的是咨询信息，不需要调用任何模块
             pass
@@ -278,13 +437,11 @@ class MainWindow(QMainWindow):
         output = "回答: " + filter_reply["answer"]
         self.chat_area.append(output)
         sql_input = SQL_Filter(filter_reply['sql'])['sql']
-        if sql_output:
+        if sql_started:
             self.chat_area.append(f"执行sql:{sql_input}")
-            self.chat_area.append("执行结果:")
-            for out in sql_output:
-                self.chat_area.append(str(out))
-            # 将sql执行的结果塞进记忆管道
-            self.memory_pipe.process({"role": "reply", "content": merge + " 执行结果:" + str(sql_output)})
+            self.chat_area.append("查询中...（可点“取消”中止）")
+            # 执行结果与记忆管道由 on_sql_done 处理
+            return
         elif sql_input:
             self.chat_area.append(f"执行sql:{sql_input}")
             self.chat_area.append("数据库中没有相关记录")
@@ -294,6 +451,10 @@ class MainWindow(QMainWindow):
             self.chat_area.append(analyze_output)
             # 将分析的结果塞进记忆管道
             self.memory_pipe.process({"role": "reply", "content": merge + " 分析结果:" + str(analyze_output)})
+        elif dup_started:
+            self.chat_area.append("查找中...")
+            # 查找结果与记忆管道由 on_dup_done 处理
+            return
         elif cmd_output:
             self.chat_area.append("命令执行结果:")
             self.chat_area.append(cmd_output)
@@ -303,6 +464,116 @@ class MainWindow(QMainWindow):
             self.memory_pipe.process({"role": "reply", "content": merge})
         self.chat_area.append("")
 
+    def on_dup_done(self, result, merge:str):
+        self.dup_worker = None
+        if isinstance(result, Exception):
+            self.chat_area.append(f"查找失败: {result}")
+            self.memory_pipe.process({"role": "reply", "content": merge + f" 查找失败: {result}"})
+        else:
+            self.chat_area.append("重复文件:")
+            self.chat_area.append(result)
+            # 将查找结果(只保留汇总行)塞进记忆管道
+            self.memory_pipe.process({"role": "reply", "content": merge + " 查找结果:" + result.split("\n", 1)[0]})
+        self.chat_area.append("")
+
+    def start_sql(self, worker:SQLWorker, on_done):
+        self.sql_worker = worker
+        # 只处理当前线程的结果（被新查询取代的线程的结果直接丢弃）
+        worker.finished.connect(lambda result, w=worker: on_done(result) if w is self.sql_worker
+                                else result["pager"] and result["pager"].close())
+        self.more_button.setEnabled(False)
+        self.cancel_button.setVisible(True)
+        worker.start()
+
+    def cancel_sql(self):
+        # “取消”：中止执行中的 SQL（进度回调在下一次检查时中止语句）
+        if self.sql_worker is not None:
+            self.sql_worker.budget.cancel()
+
+    def stop_sql(self):
+        # 取消并等待执行中的 SQL 线程结束
+        worker, self.sql_worker = self.sql_worker, None
+        if worker is not None and worker.isRunning():
+            worker.budget.cancel()
+            worker.wait()
+
+    def _sql_finished(self):
+        self.sql_worker = None
+        self.cancel_button.setVisible(False)
+        self.more_button.setEnabled(True)
+
+    def _sql_problem(self, result) -> str:
+        # 全表扫描提示与失败原因（显示在聊天窗口），返回写入记忆管道的说明（无则为空）
+        if result["scans"]:
+            self.chat_area.append("注意：该查询需要全表扫描（" + "；".join(result["scans"]) + "），"
+                                  + ("按配置已拒绝执行" if result["error"] == "blocked" else "已限时执行"))
+        err = result["error"]
+        if err == "blocked":
+            return "查询需要全表扫描，已拒绝执行"
+        if isinstance(err, QueryAborted):
+            reason = {"timeout": "超时", "steps": "超出计算量上限", "cancelled": "被取消"}[err.reason]
+            msg = f"查询{reason}，已中止（{err.seconds:.1f}s）"
+            self.chat_area.append(msg)
+            return msg
+        if err is not None:
+            self.chat_area.append(f"执行失败: {err}")
+            return f"执行失败: {err}"
+        return ""
+
+    def on_sql_done(self, result, merge:str, sql_input:str):
+        self._sql_finished()
+        problem = self._sql_problem(result)
+        rows, count = result["rows"], result["count"]
+        if problem:
+            self.memory_pipe.process({"role": "reply", "content": merge + " 执行结果:" + problem})
+        elif rows and count:
+            # 查询：只显示第一页，只把第一页和总行数塞进记忆管道
+            total = format_count(count)
+            cached = "，缓存" if result["pager"].cached else ""
+            self.chat_area.append(f"执行结果（共 {total} 行，显示 1-{len(rows)} 行{cached}）:")
+            for out in rows:
+                self.chat_area.append(str(out))
+            if result["pager"].has_more:
+                self.pager = result["pager"]
+                self.more_button.setVisible(True)
+            self.memory_pipe.process({"role": "reply", "content": merge + f" 执行结果(共 {total} 行，前 {len(rows)} 行):"
+                                                              + str(rows)})
+        elif rows:
+            self.chat_area.append("执行结果:")
+            self.chat_area.append(str(rows))
+            # 将sql执行的结果塞进记忆管道
+            self.memory_pipe.process({"role": "reply", "content": merge + " 执行结果:" + str(rows)})
+        else:
+            self.chat_area.append("数据库中没有相关记录")
+            self.memory_pipe.process({"role": "reply", "content": merge})
+        self.chat_area.append("")
+
+    def show_more(self):
+        # “更多结果”：在 SQLWorker 线程中取当前查询的下一页
+        if self.pager is None or self.sql_worker is not None:
+            return
+        start = self.pager.fetched + 1
+        self.start_sql(SQLWorker(pager=self.pager), lambda result: self.on_more_done(result, start))
+
+    def on_more_done(self, result, start:int):
+        self._sql_finished()
+        self._sql_problem(result)
+        rows = result["rows"]
+        if rows:
+            self.chat_area.append(f"执行结果（共 {format_count(result['count'])} 行，"
+                                  f"显示 {start}-{start + len(rows) - 1} 行）:")
+            for out in rows:
+                self.chat_area.append(str(out))
+        self.chat_area.append("")
+        if self.pager is None or not self.pager.has_more:
+            self.close_pager()
+
+    def close_pager(self):
+        if self.pager is not None:
+            self.pager.close()
+            self.pager = None
+        self.more_button.setVisible(False)
+
     def load_qss(self,path: str) -> str:
         try:
             with open(path, "r", encoding="utf-8") as f:
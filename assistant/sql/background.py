@@ -0,0 +1,183 @@
+import sqlite3, threading
+from typing import Callable, Dict, List, Optional
+from core.error_handler import error
+from sql import metrics
+from sql.db_tools import get_pool
+
+# 后台文件队列：hasher.HashPool 与 extractor.ContentExtractor 的公共部分
+# - 入队只记路径（有序去重），监听器落库后把 新建/修改 的文件交给这里，不在落库路径上读文件
+# - 补处理：队列空闲时按 id 顺序每次从库中取 STALE_PAGE 行过期记录，内存占用与库大小无关
+# - busy() 为真时暂停取任务；_delay() 返回正数时先等待（限速）
+# - 只在取补处理页、处理单个文件时借用只读连接，用完即还，等待任务时不占用连接池；处理结果由子类经写线程写回
+# 子类提供 STALE_SQL 与 _process(conn, path)；指标 {metric}.queue / paused / failed
+
+STALE_PAGE = 1000           # 补处理时每次从库中取出的行数
+
+_REFILL = object()          # _take() 的返回值：由本线程取下一页补处理行
+
+
+class BackgroundQueue:
+    """
+    submit:  写任务提交函数（sql.writer.DBWriter.submit）
+    workers: 工作线程数
+    busy:    返回 True 时暂停取任务
+    """
+    f_name = "background.py"
+    thread_name = "background"      # 工作线程名前缀
+    metric = "background"           # 指标名前缀
+    # 补处理查询，参数为上次取到的 id，结果为 (f.id, f.path)；按根目录补处理时追加 AND f.root_id = ?
+    STALE_SQL = ""
+
+    def __init__(self, submit: Callable, workers: int, busy: Callable[[], bool]):
+        self.submit_write = submit
+        self.workers = workers
+        self.busy = busy
+        self._pending: Dict[str, None] = {}    # 有序去重的待处理路径
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads: List[threading.Thread] = []
+        self._stale: Optional[list] = None      # 补处理游标 [root_id, 上次取到的 id]，None 为未开启
+        self._refilling = False                 # 有线程正在取补处理页（同一时刻只有一个）
+        self._m_queue = metrics.gauge(f"{self.metric}.queue")
+        self._m_paused = metrics.counter(f"{self.metric}.paused")
+        self._m_failed = metrics.counter(f"{self.metric}.failed")
+
+    # ---------- 子类实现 ---------- #
+    def _process(self, conn: sqlite3.Connection, path: str):
+        raise NotImplementedError
+
+    def _delay(self) -> float:
+        """持锁调用：距离下一个任务可以开始还需等待的秒数（限速用，默认不等待）"""
+        return 0.0
+
+    # ---------- 生产端 ---------- #
+    def submit(self, path: str):
+        with self._cond:
+            if path not in self._pending:
+                self._pending[path] = None
+                self._m_queue.set(len(self._pending))
+                self._cond.notify()
+
+    def submit_stale(self, root_id: Optional[int] = None):
+        """补处理库中尚未处理、或 (size, mtime) 已变化的文件（root_id 为 None 时全部根目录）"""
+        with self._cond:
+            self._stale = [root_id, 0]
+            self._cond.notify_all()
+
+    def _refill(self):
+        # 不持锁调用：借用连接从补处理游标处取下一页，期间其他工作线程等待
+        with self._cond:
+            stale = self._stale
+            root_id, last_id = stale
+        rows = []
+        try:
+            sql, args = self.STALE_SQL, (last_id,)
+            if root_id is not None:
+                sql += " AND f.root_id = ?"
+                args += (root_id,)
+            with get_pool().connection() as conn:
+                rows = conn.execute(sql + " ORDER BY f.id LIMIT ?", args + (STALE_PAGE,)).fetchall()
+        except Exception as e:
+            error(self.f_name, "_refill", e)
+        finally:
+            with self._cond:
+                self._refilling = False
+                if self._stale is stale:        # 期间 submit_stale() 重新开启时以新游标为准
+                    if rows:
+                        stale[1] = rows[-1][0]
+                    else:
+                        self._stale = None
+                for _, p in rows:
+                    self._pending.setdefault(p, None)
+                self._m_queue.set(len(self._pending))
+                self._cond.notify_all()
+
+    # ---------- 工作线程 ---------- #
+    def _take(self):
+        """下一个待处理路径；需要取补处理页时返回 _REFILL，停止时返回 None"""
+        with self._cond:
+            while not self._stopped:
+                if self.busy():
+                    self._m_paused.inc()
+                    self._cond.wait(0.2)
+                    continue
+                wait = self._delay()
+                if wait > 0:
+                    self._cond.wait(wait)       # stop() 可提前唤醒
+                    continue
+                if self._pending:
+                    break
+                if self._stale is not None and not self._refilling:
+                    self._refilling = True
+                    return _REFILL
+                self._cond.wait()
+            if self._stopped:
+                return None
+            path = next(iter(self._pending))
+            del self._pending[path]
+            self._m_queue.set(len(self._pending))
+            return path
+
+    def _run(self):
+        pool = get_pool()
+        while True:
+            path = self._take()
+            if path is None:
+                return
+            if path is _REFILL:
+                self._refill()
+                continue
+            try:
+                with pool.connection() as conn:     # 每个文件借用一次，处理完即归还
+                    self._process(conn, path)
+            except OSError:
+                self._m_failed.inc()    # 文件已消失/无权限：由监听器负责删除记录
+            except Exception as e:
+                self._m_failed.inc()
+                error(self.f_name, "_process", e)
+
+    # ---------- 启停 ---------- #
+    def start(self):
+        self._stopped = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.thread_name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """停止工作线程，未处理的路径丢弃（下次启动由 submit_stale 补上）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def pending(self) -> int:
+        """队列中的路径数（不含尚未取出的补处理行）"""
+        return len(self._pending)
+
+
+class Singleton:
+    """进程内唯一的后台队列：get() 按需创建并启动（factory 返回 None 表示不启用），stop() 停止并丢弃"""
+
+    def __init__(self, factory: Callable[[], Optional[BackgroundQueue]]):
+        self._factory = factory
+        self._instance: Optional[BackgroundQueue] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[BackgroundQueue]:
+        with self._lock:
+            if self._instance is None:
+                instance = self._factory()
+                if instance is None:
+                    return None
+                instance.start()
+                self._instance = instance
+            return self._instance
+
+    def stop(self):
+        with self._lock:
+            if self._instance:
+                self._instance.stop()
+                self._instance = None
@@ -1,7 +1,11 @@
-import sqlite3,os,time
+import sqlite3,os,re,time,threading
+from contextlib import nullcontext
 import sys
 from core.error_handler import error
-from data.meta_data import DB_FILE,JSON_FILE,HISTORY_RECORD,get_watch_path
+from data.meta_data import DB_FILE,JSON_FILE,get_watch_path
+from sql.pool import ConnectionPool
+from sql import generation, rollup
+from sql.result_cache import ResultCache, get_cache
 from pathlib import Path
 
 # 数据表结构（简要）
@@ -18,6 +22,27 @@ from pathlib import Path
 # - deleted    INTEGER DEFAULT 0        # 是否为目录项，0为文件，1为目录
 # - updated_at INTEGER NOT NULL         # 记录最近变更时间戳（秒）
 # - note       TEXT                     # 备注/标签（便于检索）
+# - root_id    INTEGER                  # 所属监听根目录（data.meta_data 根目录注册表的 id）
+# - content_hash TEXT                   # 内容 blake2b（后台计算，见 sql/hasher.py；未计算为 NULL）
+# - hash_size  INTEGER                  # 计算 content_hash 时的 size
+# - hash_mtime INTEGER                  # 计算 content_hash 时的 mtime（与 size/mtime 不一致说明哈希已过期）
+# - parent_id  INTEGER                  # 父目录记录的 id（父目录不在库中时为 NULL）
+# - depth      INTEGER                  # 路径深度：分隔符个数（"/" 与 "C:\" 为 0）
+#
+# 表：files_fts（FTS5 全文索引，trigram 分词，外部内容表 = files，rowid = files.id）
+# - name / path / note                  # 与 files 同名列一致，由触发器同步
+#
+# 表：dir_stats（目录汇总，递归，由触发器 + 提交前 flush 增量维护，见 sql/rollup.py）
+# - dir_id     INTEGER PRIMARY KEY      # 目录记录的 files.id
+# - files / dirs / size                # 子树内的文件数、目录数（不含自身）、文件总大小
+#
+# 表：dir_ext_stats（目录汇总按扩展名，主键 (dir_id, ext)）
+# - dir_id / ext / files / size        # 子树内该扩展名的文件数与总大小
+#
+# 表：content_text（文本文件的正文，后台抽取，见 sql/extractor.py；file_id = files.id）
+# - size / mtime / encoding / text     # 抽取时的 size、mtime，判定的编码（非文本为 NULL），规范化后的正文
+#
+# 表：content_fts（FTS5 全文索引，trigram 分词，外部内容表 = content_text，rowid = files.id）
 #
 # 关键约定
 # --------
@@ -37,6 +62,9 @@ from pathlib import Path
 # # 新增或更新（UPSERT）
 # db.create(r"C:\Users\me\Docs\report.pdf", note="季度报告")
 #
+# # 批量新增或更新（一个事务），返回 {'inserted','updated','unchanged','skipped','seconds'}
+# db.upsert_many([r"C:\Users\me\Docs\a.pdf", r"C:\Users\me\Docs\b.pdf"])
+#
 # # 逻辑删除
 # db.delete(r"C:\Users\me\Docs\report.pdf")
 #
@@ -48,7 +76,7 @@ from pathlib import Path
 # print(rows)
 #
 #
-# # 关闭连接
+# # 归还连接（连接来自连接池，见 sql/pool.py）；也可以写成 with DBTools() as db: ...
 # db.close()
 #
 #
@@ -57,11 +85,195 @@ from pathlib import Path
 # - 参数化查询：单参数需要元组写法 (value,)；避免 f-string 拼接引发注入或转义问题。
 # - fetchall 时机：仅对 SELECT 使用；UPDATE/INSERT/DELETE 取 rowcount 并 commit。
 # - 文件不存在：严格模式下 create()/update() 依赖 os.stat，若文件已被移动或删除会报错。
-# - LIKE 与大小写：对 name 的不区分大小写检索请使用 case_key（已建 idx_case_key）。
-# - 备注检索：note 字段已建 idx_note，适合 “按备注模糊搜索”。
+# - LIKE 与大小写：对 name 的不区分大小写检索请使用 case_key（已建 idx_files_case_key）。
+# - 索引：见 INDEXES；按 ext/deleted 过滤、按 size/mtime 排序的查询都能在复合索引内完成。
+# - 子串检索：LIKE '%foo%' 只能全表扫描；名称/路径/备注的子串用 files_fts（≥3 个字符），如
+#   SELECT path FROM files WHERE id IN (SELECT rowid FROM files_fts WHERE name MATCH '"foo"')
+#   文件内容里的片段用 content_fts：... WHERE id IN (SELECT rowid FROM content_fts WHERE content_fts MATCH '"foo"')
+# - 子树查询：不要用 path LIKE 'dir/%'（LIKE 默认不区分大小写，用不上 path 索引，全表扫描），
+#   用 subtree()（沿 parent_id 递归）或 path 范围条件 path >= 'dir/' AND path < 'dir0'。
 
 f_name = "db_tools.py"
 
+# 建表之后新增的列：旧库在 _ensure_schema 中 ALTER TABLE 补齐
+ADDED_COLUMNS = [
+    ("root_id", "INTEGER"),
+    ("content_hash", "TEXT"),
+    ("hash_size", "INTEGER"),
+    ("hash_mtime", "INTEGER"),
+    ("parent_id", "INTEGER"),
+    ("depth", "INTEGER"),
+]
+
+# 一次性数据迁移的版本号，记在 PRAGMA user_version：建表检查只执行编号大于该值的迁移
+# 1: 旧版全量扫描写入的 ext 统一改为小写
+SCHEMA_VERSION = 1
+
+# 取父目录 id 的子查询（参数为父目录路径；为 NULL 或父目录不在库中时得到 NULL）
+PARENT_ID = "(SELECT id FROM files WHERE path = ?)"
+
+# 新增或更新一条记录，参数：path, name, case_key, ext, size, mtime, ctime, deleted, updated_at, root_id, 父目录路径, depth
+# 冲突时只在元数据真正变化时改写（未变化的行不产生写入，也不计入 rowcount）；note 与内容哈希保留
+UPSERT_SQL = f"""
+INSERT INTO files (path, name, case_key, ext, size, mtime, ctime, deleted, updated_at, root_id,
+                   parent_id, depth)
+VALUES (?,?,?,?,?,?,?,?,?,?,{PARENT_ID},?)
+ON CONFLICT(path) DO UPDATE SET
+    name = excluded.name, case_key = excluded.case_key, ext = excluded.ext,
+    size = excluded.size, mtime = excluded.mtime, ctime = excluded.ctime,
+    deleted = excluded.deleted, updated_at = excluded.updated_at,
+    root_id = COALESCE(excluded.root_id, root_id),
+    parent_id = excluded.parent_id, depth = excluded.depth
+WHERE name IS NOT excluded.name OR size IS NOT excluded.size OR mtime IS NOT excluded.mtime
+   OR ctime IS NOT excluded.ctime OR deleted IS NOT excluded.deleted OR ext IS NOT excluded.ext
+   OR parent_id IS NOT excluded.parent_id OR depth IS NOT excluded.depth
+   OR (excluded.root_id IS NOT NULL AND root_id IS NOT excluded.root_id)
+"""
+
+BULK_CHUNK = 5000       # 批量接口每次 executemany 的行数
+
+# files 的二级索引，按模型实际生成的查询选定（bench/workload.sql，python -m bench.bench_workload 回放对比）：
+# 查询几乎都是 ext = ? AND deleted = 0 过滤、按 size/mtime 排序或求和，复合索引让过滤、排序、count/sum 都在索引内完成，
+# 分页取第一页时只需回表取几十行；deleted 在前，“各类文件有多少”（deleted = 0 GROUP BY ext）也按索引顺序分组；
+# 不带 ext 的 “最大/最近/空的文件” 走 (size|mtime, deleted)：size/mtime 在前，漏写 deleted = 0 的排序也能用上，
+# deleted 在后，过滤不必回表；只按 ext 过滤时由 ANALYZE 统计启用 skip-scan
+INDEXES = [
+    ("idx_files_case_key",      "files(case_key)"),
+    ("idx_files_del_ext_size",  "files(deleted, ext, size)"),
+    ("idx_files_del_ext_mtime", "files(deleted, ext, mtime)"),
+    ("idx_files_size_del",      "files(size, deleted)"),
+    ("idx_files_mtime_del",     "files(mtime, deleted)"),
+    ("idx_files_root_id",       "files(root_id)"),
+    ("idx_files_parent",        "files(parent_id)"),
+]
+
+# 被上面的复合索引取代的旧单列索引（前缀相同或可由 skip-scan 代替），旧库建表检查时删除
+RETIRED_INDEXES = ("idx_files_ext", "idx_files_mtime", "idx_files_deleted", "idx_files_size")
+
+# 全量重建时索引预先建在 files_new 上，名字不能与旧表上的重复：INDEXES 中的名字已被占用就改用加了该后缀的名字，
+# 换表后两种名字交替出现，建表检查按列判断索引是否已存在
+INDEX_ALT = "_b"
+
+def create_indexes(cur, table:str = "files"):
+    """在 table 上建 INDEXES 中的索引（不提交）；已有相同列的索引（不论名字）则跳过"""
+    have = {re.sub(r"\s+", "", sql[sql.index("("):]).lower() for (sql,) in cur.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))}
+    for name, target in INDEXES:
+        cols = target[target.index("("):]
+        if re.sub(r"\s+", "", cols).lower() in have:
+            continue
+        if cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone():
+            name += INDEX_ALT
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}{cols}")
+
+STATS_DRIFT = 0.25      # files 行数与上次 ANALYZE 时相差超过该比例时重新收集统计信息
+
+# 名称/路径/备注的全文索引：trigram 分词，任意 ≥3 个字符的子串都走索引（不区分大小写）
+# 外部内容表只存索引不存原文；触发器只在 name/path/note 真正变化时改写索引
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+      name, path, note, content='files', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_ai AFTER INSERT ON files BEGIN
+      INSERT INTO files_fts(rowid, name, path, note) VALUES (new.id, new.name, new.path, new.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_ad AFTER DELETE ON files BEGIN
+      INSERT INTO files_fts(files_fts, rowid, name, path, note) VALUES ('delete', old.id, old.name, old.path, old.note);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_fts_au AFTER UPDATE OF name, path, note ON files
+    WHEN old.name IS NOT new.name OR old.path IS NOT new.path OR old.note IS NOT new.note BEGIN
+      INSERT INTO files_fts(files_fts, rowid, name, path, note) VALUES ('delete', old.id, old.name, old.path, old.note);
+      INSERT INTO files_fts(rowid, name, path, note) VALUES (new.id, new.name, new.path, new.note);
+    END
+    """,
+]
+
+def ensure_fts(cur) -> bool:
+    """
+    建 files_fts 与同步触发器（逐条执行，不提交，可在调用方的事务内使用）
+    索引表是新建的则从 files 全量填充，返回 True
+    """
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone()
+    for stmt in FTS_DDL:
+        cur.execute(stmt)
+    if not exists:
+        cur.execute("INSERT INTO files_fts(files_fts) VALUES ('rebuild')")
+    return not exists
+
+# 正文表与其全文索引（sql/extractor.py 后台填充），rowid = files.id
+CONTENT_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS content_text (
+      file_id  INTEGER PRIMARY KEY,         -- files.id
+      size     INTEGER,                     -- 抽取时的 size
+      mtime    INTEGER,                     -- 抽取时的 mtime
+      encoding TEXT,                        -- 判定的编码；NULL 为非文本或超过大小上限（未抽取）
+      text     TEXT                         -- 规范化后的正文
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+      text, content='content_text', content_rowid='file_id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_content_fts_ai AFTER INSERT ON content_text BEGIN
+      INSERT INTO content_fts(rowid, text) VALUES (new.file_id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_content_fts_ad AFTER DELETE ON content_text BEGIN
+      INSERT INTO content_fts(content_fts, rowid, text) VALUES ('delete', old.file_id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_content_fts_au AFTER UPDATE ON content_text BEGIN
+      INSERT INTO content_fts(content_fts, rowid, text) VALUES ('delete', old.file_id, old.text);
+      INSERT INTO content_fts(rowid, text) VALUES (new.file_id, new.text);
+    END
+    """,
+    # files 上的触发器随全量重建的旧表一起删除，换表后由 ensure_content() 重新建立
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_files_content_ad AFTER DELETE ON files BEGIN
+      DELETE FROM content_text WHERE file_id = old.id;
+    END
+    """,
+]
+
+def ensure_content(cur):
+    """建正文表、全文索引与触发器（逐条执行，不提交）；没有 trigram 分词器时抛出 sqlite3.OperationalError"""
+    for stmt in CONTENT_DDL:
+        cur.execute(stmt)
+
+def refresh_stats(cur, force:bool = False) -> bool:
+    """
+    files 的统计信息（sqlite_stat1）缺失、或行数与统计时相差超过 STATS_DRIFT 时执行 ANALYZE files，返回是否执行
+    有了统计信息规划器才能在几个复合索引之间按选择性挑选，并对 deleted 这类低基数前导列使用 skip-scan
+    不用 analysis_limit 抽样：抽样得到的行数与分布偏差很大（100 万行估成 179 万），规划器仍会选全表扫描
+    """
+    if not force:
+        has_stat = cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        row = cur.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = 'files' LIMIT 1").fetchone() if has_stat else None
+        if row is not None:
+            then = int(row[0].split()[0])
+            now = cur.execute("SELECT count(*) FROM files").fetchone()[0]
+            if abs(now - then) <= STATS_DRIFT * max(then, 1000):
+                return False
+    cur.execute("ANALYZE files")
+    return True
+
+def tree_pos(path:str) -> tuple:
+    """(父目录路径, 深度)；path 须已 normpath，根（"/"、"C:\\"）的父目录为 None"""
+    parent = os.path.dirname(path)
+    return (None if parent == path else parent), path.rstrip(os.sep).count(os.sep)
+
 def cracker(path:str):
     path = os.path.normpath(path)
     if not os.path.exists(path):  # JSON里可能有已不存在的路径
@@ -73,16 +285,36 @@ def cracker(path:str):
     return path, name, case_key, ext, st.st_size, int(st.st_mtime), int(st.st_ctime)
 
 
+_pools: dict = {}      # DB_FILE -> ConnectionPool
+_pools_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """当前 DB_FILE 的连接池；建表检查在池中第一个连接上执行，每进程一次"""
+    pool = _pools.get(DB_FILE)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(DB_FILE)
+            if pool is None:
+                pool = _pools[DB_FILE] = ConnectionPool(DB_FILE, init=lambda conn: DBTools(conn)._ensure_schema())
+    return pool
+
+
 class DBTools:
     """工具类"""
-    def __init__(self):
-        # 连接本地数据库
-        self.conn = sqlite3.connect(DB_FILE)
+    def __init__(self, conn:sqlite3.Connection = None):
+        # 从连接池借出连接（pragma 与建表检查不再每次执行）；传入 conn 时直接使用，close() 不关闭它
+        self._pool = None
+        if conn is None:
+            self._pool = get_pool()
+            conn = self._pool.checkout()
+        self.conn = conn
         self.cur = self.conn.cursor()
-        self.cur.execute("PRAGMA journal_mode=WAL")
-        self.cur.execute("PRAGMA synchronous=NORMAL")
 
-        self._ensure_schema()
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def _ensure_schema(self):
         self.cur.executescript("""
@@ -100,14 +332,15 @@ class DBTools:
           deleted    INTEGER DEFAULT 0,           -- 软删除标记：0=在库，1=已删除（如你要表示“是否目录”，建议改列名为 is_dir）
           is_dir     INTEGER DEFAULT 0,           -- 是否为目录：0=文件，1=目录（如不需要可删）
           updated_at INTEGER NOT NULL DEFAULT (strftime('%s','now')), -- 最近变更时间戳（秒）
-          note       TEXT                         -- 备注/标签
+          note       TEXT,                        -- 备注/标签
+          root_id    INTEGER,                     -- 所属监听根目录
+          content_hash TEXT,                      -- 内容哈希（blake2b）
+          hash_size  INTEGER,                     -- 计算哈希时的 size
+          hash_mtime INTEGER,                     -- 计算哈希时的 mtime
+          parent_id  INTEGER,                     -- 父目录记录的 id
+          depth      INTEGER                      -- 路径深度（分隔符个数）
         );
 
-        CREATE INDEX IF NOT EXISTS idx_files_case_key ON files(case_key);
-        CREATE INDEX IF NOT EXISTS idx_files_ext      ON files(ext);
-        CREATE INDEX IF NOT EXISTS idx_files_mtime    ON files(mtime);
-        CREATE INDEX IF NOT EXISTS idx_files_deleted  ON files(deleted);
-
         -- 自动维护 updated_at
         CREATE TRIGGER IF NOT EXISTS trg_files_updated_at
         AFTER UPDATE ON files
@@ -117,27 +350,100 @@ class DBTools:
           UPDATE files SET updated_at = strftime('%s','now') WHERE id = NEW.id;
         END;
         """)
+        # 旧库迁移：补新增的列（root_id 旧记录为 NULL，由 claim_root 按路径认领）
+        cols = {r[1] for r in self.cur.execute("PRAGMA table_info(files)")}
+        for col, decl in ADDED_COLUMNS:
+            if col not in cols:
+                self.cur.execute(f"ALTER TABLE files ADD COLUMN {col} {decl}")
+        # 二级索引（新增列之后建，root_id/parent_id 在旧库上是刚补的列）
+        for name in RETIRED_INDEXES:
+            self.cur.execute(f"DROP INDEX IF EXISTS {name}")
+        create_indexes(self.cur)
+        version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # 旧版全量扫描写入的 ext 保留了原始大小写（.PDF），与监听器写入的小写不一致：统一改为小写
+            # （只在旧库上全表扫描一次；改写由汇总触发器计入 dir_ext_stats）
+            self.cur.execute("UPDATE files SET ext = lower(ext) WHERE ext != lower(ext)")
+        if version < SCHEMA_VERSION:
+            self.cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")     # 与迁移在同一事务中提交
+        # 中断的全量重建留在 files 上的变更记录触发器（见 sql/sync_rebuild.py），不删会一直记下去
+        for (name,) in self.cur.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rebuild_%'").fetchall():
+            self.cur.execute(f"DROP TRIGGER {name}")
+        new_rollup = rollup.ensure(self.cur)
+        self._commit()
+        try:
+            if ensure_fts(self.cur):
+                print("[schema] files_fts 全文索引已建立")
+            self._commit()
+        except sqlite3.OperationalError as e:
+            # SQLite 低于 3.34 或未编译 FTS5：没有 trigram 分词器，名称检索退回 LIKE
+            self.conn.rollback()
+            error(f_name, "ensure_fts", e)
+        try:
+            ensure_content(self.cur)
+            self._commit()
+        except sqlite3.OperationalError as e:
+            # 同上：没有 trigram 分词器时不建正文索引，按内容检索不可用（get_extractor() 返回 None）
+            self.conn.rollback()
+            error(f_name, "ensure_content", e)
+        if "parent_id" not in cols:
+            self.backfill_tree()        # 其中重算目录汇总
+        elif new_rollup:
+            self.rebuild_rollup()
+        self.analyze()
+
+    def backfill_tree(self) -> int:
+        """
+        按 path 重新计算全部记录的 parent_id/depth（旧库补列后执行一次）
+        按 path 排序读出时父目录总在子项之前，只需在内存中保留目录的 path -> id
+        """
+        dir_ids = {}
+        updates = []
+        for row_id, path, is_dir in self.cur.execute("SELECT id, path, deleted FROM files ORDER BY path").fetchall():
+            parent, depth = tree_pos(path)
+            updates.append((dir_ids.get(parent), depth, row_id))
+            if is_dir:
+                dir_ids[path] = row_id
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.executemany("UPDATE files SET parent_id = ?, depth = ? WHERE id = ?", updates)
+            rollup.recompute(self.cur)
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "backfill_tree", e)
+            return 0
+        print(f"[schema] parent_id/depth 已补齐: {len(updates)} 行")
+        return len(updates)
+
+    def _commit(self):
+        """把目录汇总的增量累加到祖先后提交，并推进索引代数（查询结果缓存随之失效）"""
+        rollup.flush(self.cur)
         self.conn.commit()
+        generation.bump()
 
     def close(self):
+        """归还连接（未提交的事务回滚）；重复调用无副作用"""
         try:
             self.cur.close()
-            self.conn.close()
         except Exception:
             pass
+        if self._pool is not None:
+            self._pool.release(self.conn)
+            self._pool = None
 
-    def create(self,path:str) -> bool:
+    def create(self,path:str,root_id:int = None) -> bool:
+        """新增或更新一个文件（UPSERT）；批量请用 upsert_many"""
         try:
             path,name,case_key,ext,size,mtime,ctime = cracker(path)
             now = int(time.time())
 
             # 开始
             self.cur.execute("BEGIN")
-            self.cur.execute("""
-            INSERT INTO files (path, name, case_key, ext, size, mtime, ctime, deleted, updated_at)
-            VALUES (?,?,?,?,?,?,?,0,?)
-            """,(path, name, case_key, ext, size, int(mtime), int(ctime), now))
-            self.conn.commit()
+            self.cur.execute(UPSERT_SQL, (path, name, case_key, ext, size, int(mtime), int(ctime), 0, now, root_id,
+                                          *tree_pos(path)))
+            self._commit()
             print("Inserted file finish")
             return True
         except Exception as e:
@@ -145,7 +451,7 @@ class DBTools:
             error(f_name,"create",e)
             return False
 
-    def create_dir(self,dir_path:str) -> bool:
+    def create_dir(self,dir_path:str,root_id:int = None) -> bool:
         try:
             p = Path(dir_path).resolve()
             if not p.exists() or not p.is_dir():
@@ -161,15 +467,16 @@ class DBTools:
             mtime = int(st.st_mtime)
             ctime = int(st.st_ctime)
             updated_at = int(time.time())
+            is_new = self.cur.execute("SELECT 1 FROM files WHERE path = ?", (path_norm,)).fetchone() is None
 
-            # 目录入库
+            # 目录入库（UPSERT）
             self.cur.execute("BEGIN")
-            self.cur.execute("""
-            INSERT INTO files (path, name, case_key, ext, size, mtime, ctime, deleted, updated_at)
-            VALUES (?,?,?,?,?,?,?,1,?)
-            """,(path_norm, name, case_key, ext, size, mtime, ctime, updated_at))
-            self.conn.commit()
-            print(f"[create_dir] inserted/ignored: {path_norm}")
+            self.cur.execute(UPSERT_SQL, (path_norm, name, case_key, ext, size, mtime, ctime, 1, updated_at, root_id,
+                                          *tree_pos(path_norm)))
+            if is_new:
+                self._link_children(path_norm)
+            self._commit()
+            print(f"[create_dir] inserted/updated: {path_norm}")
             return True
         except Exception as e:
             try:
@@ -183,7 +490,7 @@ class DBTools:
         try:
             norm = os.path.normpath(path)
             self.cur.execute("DELETE FROM files WHERE path = ?",(norm,))
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
             error(f_name,"delete",e)
@@ -198,10 +505,11 @@ class DBTools:
 
             # 定位需要改变的记录
             old_norm = os.path.normpath(old_path)
+            parent, depth = tree_pos(path)
 
             # 开始
             self.cur.execute("BEGIN")
-            self.cur.execute("""
+            self.cur.execute(f"""
                         UPDATE files SET
                             path = ?,
                             name = ?,
@@ -211,10 +519,12 @@ class DBTools:
                             mtime = ?,
                             ctime = ?,
                             deleted = 0,
-                            updated_at = ?
+                            updated_at = ?,
+                            parent_id = {PARENT_ID},
+                            depth = ?
                         WHERE path = ?
-                    """, (path, name, case_key, ext, size, int(mtime), int(ctime), now, old_norm))
-            self.conn.commit()
+                    """, (path, name, case_key, ext, size, int(mtime), int(ctime), now, parent, depth, old_norm))
+            self._commit()
 
             if self.cur.rowcount:
                 print(f"✅ updated: {old_norm} -> {path}  (rows: {self.cur.rowcount})")
@@ -231,37 +541,8 @@ class DBTools:
 
         try:
             self.cur.execute("BEGIN")
-
-            # 创建临时表
-            self.cur.execute("""
-            CREATE TEMP TABLE IF NOT EXISTS temp_dirs(
-            dir     TEXT PRIMARY KEY,
-            new_dir TEXT NOT NULL
-            )
-            """)
-
-            # 保证临时表里没有缓存
-            self.cur.execute("""
-            DELETE FROM temp_dirs
-            """)
-
-            # 对临时表批量插入更新路径
-            self.cur.executemany("""
-            INSERT OR REPLACE INTO temp_dirs(dir,new_dir) VALUES (?,?)""",pairs)
-
-            # 根据临时表更改正式表
-            self.cur.execute("""
-            UPDATE files
-            SET path = (SELECT new_dir FROM temp_dirs WHERE dir = files.path),
-                updated_at = ?
-            WHERE EXISTS (SELECT 1 FROM temp_dirs WHERE dir = files.path)
-            """,(now,))
-
-            # 清空临时表
-            self.cur.execute("""
-            DELETE FROM temp_dirs""")
-
-            self.conn.commit()
+            self._update_pairs(pairs, now)
+            self._commit()
             print("修改成功")
             return True
         except Exception as e:
@@ -269,32 +550,430 @@ class DBTools:
             print("Error from update tool update_many function in db_tools: ",e)
             return False
 
-    def custom_instruction(self,instruction:str):
+    def _update_pairs(self, pairs:list[tuple[str,str]], now:int):
+        """按 (旧路径, 新路径) 批量改写 path，不负责事务"""
+        # 创建临时表
+        self.cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS temp_dirs(
+        dir     TEXT PRIMARY KEY,
+        new_dir TEXT NOT NULL
+        )
+        """)
+
+        # 保证临时表里没有缓存
+        self.cur.execute("""
+        DELETE FROM temp_dirs
+        """)
+
+        # 对临时表批量插入更新路径
+        self.cur.executemany("""
+        INSERT OR REPLACE INTO temp_dirs(dir,new_dir) VALUES (?,?)""",pairs)
+
+        # 根据临时表更改正式表
+        self.cur.execute("""
+        UPDATE files
+        SET path = (SELECT new_dir FROM temp_dirs WHERE dir = files.path),
+            updated_at = ?
+        WHERE EXISTS (SELECT 1 FROM temp_dirs WHERE dir = files.path)
+        """,(now,))
+
+        # 新位置的父目录与深度（按路径排序，父目录先于子项改写）
+        self.cur.executemany(f"""
+        UPDATE files SET parent_id = {PARENT_ID}, depth = ? WHERE path = ?
+        """, [(*tree_pos(new), new) for _, new in sorted(pairs, key=lambda p: p[1])])
+
+        # 清空临时表
+        self.cur.execute("""
+        DELETE FROM temp_dirs""")
+
+    # ---------- 批量增删改（一个事务） ---------- #
+    def upsert_many(self, items, root_id:int = None, chunk_size:int = BULK_CHUNK) -> dict:
+        """
+        批量新增或更新，一个事务，每 chunk_size 行一次 executemany（ON CONFLICT(path) DO UPDATE）
+        items:   路径（从磁盘读取元数据）或扫描器格式的行（sql.scanner.scan_tree 产出的 10 元组），可为生成器
+                 父目录应先于子项（扫描器的产出顺序即满足），否则子项的 parent_id 在父目录入库后补挂
+        root_id: 新入库的记录归属的根目录
+        返回: {'inserted', 'updated', 'unchanged', 'skipped'（磁盘上已不存在）, 'seconds'}
+        """
+        t0 = time.perf_counter()
+        try:
+            self.cur.execute("BEGIN")
+            stats = self._upsert_many(items, root_id, chunk_size)
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "upsert_many", e)
+            stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        return stats
+
+    def _upsert_many(self, items, root_id:int = None, chunk_size:int = BULK_CHUNK) -> dict:
+        """upsert_many 的实现，不负责事务（可在写线程的事务内使用）"""
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+        now = int(time.time())
+        parents_seen = set()        # 已写入行的父目录：目录晚于其子项出现时需要补挂子项
+        it = iter(items)
+        while True:
+            rows, relink = [], []
+            for item in it:
+                try:
+                    row = self._row(item, now) if isinstance(item, str) else tuple(item[:9])
+                except FileNotFoundError:
+                    stats["skipped"] += 1
+                    continue
+                parent, depth = tree_pos(row[0])
+                if row[7] and row[0] in parents_seen:
+                    relink.append(row[0])
+                parents_seen.add(parent)
+                rows.append(row + (root_id, parent, depth))
+                if len(rows) >= chunk_size:
+                    break
+            if not rows:
+                return stats
+            # 新行的 id 总大于写入前的 max(id)，据此区分新增与更新
+            max_id = self.cur.execute("SELECT coalesce(max(id), 0) FROM files").fetchone()[0]
+            self.cur.executemany(UPSERT_SQL, rows)
+            changed = self.cur.rowcount
+            inserted = self.cur.execute("SELECT count(*) FROM files WHERE id > ?", (max_id,)).fetchone()[0]
+            stats["inserted"] += inserted
+            stats["updated"] += changed - inserted
+            stats["unchanged"] += len(rows) - changed
+            for d in relink:
+                self._link_children(d)
+
+    def delete_many(self, paths) -> dict:
+        """
+        批量删除记录（只删给定路径本身，不含目录子项），一个事务
+        返回: {'deleted', 'missing'（库中本来没有）, 'seconds'}
+        """
+        t0 = time.perf_counter()
+        try:
+            self.cur.execute("BEGIN")
+            stats = self._delete_many(paths)
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "delete_many", e)
+            stats = {"deleted": 0, "missing": 0}
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        return stats
+
+    def _delete_many(self, paths) -> dict:
+        rows = [(os.path.normpath(p),) for p in paths]
+        self.cur.executemany("DELETE FROM files WHERE path = ?", rows)
+        return {"deleted": self.cur.rowcount, "missing": len(rows) - self.cur.rowcount}
+
+    def touch_many(self, paths) -> dict:
+        """
+        批量刷新已有记录的 size/mtime/ctime（重新 stat），一个事务；不新增记录，元数据未变的行不写入
+        返回: {'touched', 'unchanged'（未变化或库中没有）, 'missing'（磁盘上已不存在）, 'seconds'}
+        """
+        t0 = time.perf_counter()
+        try:
+            self.cur.execute("BEGIN")
+            stats = self._touch_many(paths)
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "touch_many", e)
+            stats = {"touched": 0, "unchanged": 0, "missing": 0}
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        return stats
+
+    def _touch_many(self, paths) -> dict:
+        now = int(time.time())
+        rows, missing = [], 0
+        for p in paths:
+            p = os.path.normpath(p)
+            try:
+                st = os.stat(p)
+            except OSError:
+                missing += 1
+                continue
+            size = 0 if os.path.isdir(p) else st.st_size
+            mtime, ctime = int(st.st_mtime), int(st.st_ctime)
+            rows.append((size, mtime, ctime, now, p, size, mtime, ctime))
+        self.cur.executemany("""
+        UPDATE files SET size = ?, mtime = ?, ctime = ?, updated_at = ?
+        WHERE path = ? AND (size IS NOT ? OR mtime IS NOT ? OR ctime IS NOT ?)
+        """, rows)
+        return {"touched": self.cur.rowcount, "unchanged": len(rows) - self.cur.rowcount, "missing": missing}
+
+    # ---------- 批量应用监听事件（一个事务） ---------- #
+    def apply_events(self, events, root_id:int = None) -> dict:
+        """
+        在一个事务内应用一批已合并的监听事件（sql.event_queue.FileEvent）
+        root_id: 事件所属的监听根目录，新入库的记录归属于它
+        返回: {'applied': n, 'skipped': m, 'moved_children': 随目录改名改写的子项数}
+        """
+        try:
+            self.cur.execute("BEGIN")
+            stats = self._apply_events(events, root_id)
+            self._commit()
+            return stats
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "apply_events", e)
+            return {"applied": 0, "skipped": len(events), "moved_children": 0}
+
+    def _apply_events(self, events, root_id:int = None) -> dict:
+        """
+        应用一批已合并的事件，不负责事务（由 apply_events 或 sql.writer 的写线程包裹）
+        顺序：删除 → 移动（目录优先）→ 新建/修改
+        单条事件失败只计入 skipped，不影响整批：每条事件一个 SAVEPOINT，失败时撤销它已做的改写
+        （目录移动先范围改写子项路径、再移动目录本身，目标已消失时不回滚会留下一半）。
+        文件已消失（FileNotFoundError）是常态，不记日志；其他异常（目录移到已有记录上的 IntegrityError、
+        stat 无权限等）记录错误后同样跳过
+        """
+        order = {"deleted": 0, "moved": 1, "created": 2, "modified": 2}
+        events = sorted(events, key=lambda ev: (order[ev.kind], not ev.is_directory))
+        stats = {"applied": 0, "skipped": 0, "moved_children": 0}
+        now = int(time.time())
+
+        for ev in events:
+            self.cur.execute("SAVEPOINT apply_event")
+            try:
+                if ev.kind == "deleted":
+                    self._delete_subtree(os.path.normpath(ev.src))
+                elif ev.kind == "moved":
+                    if ev.replaces:
+                        self._delete_subtree(os.path.normpath(ev.dest))
+                    if ev.is_directory:
+                        stats["moved_children"] += self._move_dir(ev.src, ev.dest, now, root_id)
+                    else:
+                        self._move_file(ev.src, ev.dest, now, root_id)
+                else:
+                    if ev.replaces:
+                        # 原记录保留（id、备注、哈希不变），只清掉它原有的子树（目录被删除后换成文件/新目录）
+                        self._delete_subtree(os.path.normpath(ev.src), keep_self=True)
+                    self._upsert(ev.src, now, root_id)
+                self.cur.execute("RELEASE apply_event")
+                stats["applied"] += 1
+            except Exception as e:
+                self.cur.execute("ROLLBACK TO apply_event")
+                self.cur.execute("RELEASE apply_event")
+                if not isinstance(e, FileNotFoundError):
+                    error(f_name, "_apply_events", e)
+                stats["skipped"] += 1
+        return stats
+
+    def _row(self, path:str, now:int) -> tuple:
+        """从磁盘读取一条 files 记录（目录: size=0, ext="", deleted=1）"""
+        path, name, case_key, ext, size, mtime, ctime = cracker(path)
+        if os.path.isdir(path):
+            return path, name, case_key, "", 0, mtime, ctime, 1, now
+        return path, name, case_key, ext, size, mtime, ctime, 0, now
+
+    def _upsert(self, path:str, now:int, root_id:int = None):
+        row = self._row(path, now)
+        is_new_dir = row[7] and self.cur.execute(
+            "SELECT 1 FROM files WHERE path = ?", (row[0],)).fetchone() is None
+        self.cur.execute(UPSERT_SQL, row + (root_id, *tree_pos(row[0])))
+        if is_new_dir:
+            self._link_children(row[0])
+
+    def _link_children(self, dir_path:str):
+        # 新入库的目录：子项可能先于它入库（如跨批次），把直接子项挂到它下面
+        _, depth = tree_pos(dir_path)
+        self.cur.execute(f"""
+        UPDATE files SET parent_id = {PARENT_ID}
+        WHERE path >= ? AND path < ? AND depth = ? AND parent_id IS NOT {PARENT_ID}
+        """, (dir_path, dir_path.rstrip(os.sep) + os.sep, dir_path.rstrip(os.sep) + chr(ord(os.sep) + 1),
+              depth + 1, dir_path))
+
+    def _move_file(self, old_path:str, new_path:str, now:int, root_id:int = None):
+        row = self._row(new_path, now)
+        old_norm = os.path.normpath(old_path)
+        self.cur.execute("SELECT 1 FROM files WHERE path = ?", (old_norm,))
+        if self.cur.fetchone() is None:
+            # 旧记录不存在（如已随目录改名）：按新路径补录
+            self._upsert(new_path, now, root_id)
+            return
+        if row[0] != old_norm:
+            # 目标路径上的旧记录已被覆盖
+            self.cur.execute("DELETE FROM files WHERE path = ?", (row[0],))
+        self.cur.execute(f"""
+        UPDATE files SET path = ?, name = ?, case_key = ?, ext = ?, size = ?,
+            mtime = ?, ctime = ?, deleted = ?, updated_at = ?, parent_id = {PARENT_ID}, depth = ?
+        WHERE path = ?
+        """, row + tree_pos(row[0]) + (old_norm,))
+
+    def _move_dir(self, old_dir:str, new_dir:str, now:int, root_id:int = None) -> int:
+        """目录改名：子树一条范围 UPDATE 改写前缀，返回改写的子项数"""
+        old_dir = os.path.normpath(old_dir)
+        new_dir = os.path.normpath(new_dir)
+        n = self._rename_subtree(old_dir, new_dir, now)
+        self._move_file(old_dir, new_dir, now, root_id)
+        return n
+
+    def _rename_subtree(self, old_dir:str, new_dir:str, now:int) -> int:
+        # path >= 'old/' AND path < 'old0'：'0' 是分隔符 '/' 的下一个字符（'\\' 则为 ']'），
+        # 走 path 唯一索引的范围扫描；substr 取出分隔符及其后的相对部分接到新前缀后
+        # 子项的 parent_id 不变（目录记录原地改名，id 不变），深度整体平移
+        lo = old_dir + os.sep
+        hi = old_dir + chr(ord(os.sep) + 1)
+        shift = tree_pos(new_dir)[1] - tree_pos(old_dir)[1]
+        self.cur.execute("""
+        UPDATE files SET path = ? || substr(path, ?), updated_at = ?, depth = depth + ?
+        WHERE path >= ? AND path < ?
+        """, (new_dir, len(old_dir) + 1, now, shift, lo, hi))
+        return self.cur.rowcount
+
+    def _delete_subtree(self, path:str, keep_self:bool = False) -> int:
+        # 删除 path 本身（keep_self 时保留）及其子树（范围条件同 _rename_subtree）：原生监听删除目录时
+        # 不为子项补发事件，只删目录本身会留下 parent_id 指向已删记录的子项，目录汇总也与 files 不一致
+        self.cur.execute("DELETE FROM files WHERE (path = ? AND NOT ?) OR (path >= ? AND path < ?)",
+                         (path, keep_self, path + os.sep, path + chr(ord(os.sep) + 1)))
+        return self.cur.rowcount
+
+    def rename_dir(self, old_dir:str, new_dir:str) -> bool:
+        """目录改名/移动：目录本身 + 整个子树，一个事务"""
+        try:
+            self.cur.execute("BEGIN")
+            n = self._move_dir(old_dir, new_dir, int(time.time()))
+            self._commit()
+            print(f"✅ renamed: {old_dir} -> {new_dir}  (children: {n})")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "rename_dir", e)
+            return False
+
+    # ---------- 监听根目录 ---------- #
+    def _delete_root(self, root_id:int) -> int:
+        self.cur.execute("DELETE FROM files WHERE root_id = ?", (root_id,))
+        return self.cur.rowcount
+
+    def delete_root(self, root_id:int) -> int:
+        """删除某个根目录的全部记录（其他根目录不受影响），返回删除行数"""
+        try:
+            self.cur.execute("BEGIN")
+            n = self._delete_root(root_id)
+            self._commit()
+            return n
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "delete_root", e)
+            return 0
+
+    def _claim_root(self, root_id:int, root_path:str) -> int:
+        root = os.path.normpath(root_path)
+        self.cur.execute("""
+        UPDATE files SET root_id = ?
+        WHERE root_id IS NULL AND (path = ? OR (path >= ? AND path < ?))
+        """, (root_id, root, root + os.sep, root + chr(ord(os.sep) + 1)))
+        return self.cur.rowcount
+
+    def claim_root(self, root_id:int, root_path:str) -> int:
+        """把根目录范围内尚未归属（root_id 为 NULL，旧版本遗留）的记录认领到 root_id"""
+        try:
+            self.cur.execute("BEGIN")
+            n = self._claim_root(root_id, root_path)
+            self._commit()
+            return n
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "claim_root", e)
+            return 0
+
+    def custom_instruction(self,instruction:str,budget = None,use_cache:bool = True):
+        """
+        budget:    sql.query_budget.QueryBudget，给定时在预算内执行，超出时回滚并抛出 QueryAborted
+        use_cache: SELECT 结果走查询结果缓存（sql/result_cache.py，按规范化 SQL + 索引代数）
+        """
         try:
             instruction = instruction.replace("\\\\", "\\")
-            self.cur.execute(instruction)
-            if instruction.lower().startswith("select"):
-                print("接受到的指令:",instruction)
-                output = self.cur.fetchall()
+            is_select = instruction.lower().startswith("select")
+            key = ResultCache.key(instruction, DB_FILE, "all") if is_select and use_cache else None
+            if key is not None:
+                hit = get_cache().get(key)
+                if hit is not None:
+                    return list(hit)
+            gen = generation.current()      # 执行前取得：执行期间有提交时不写缓存
+            with (budget.guard(self.conn) if budget is not None else nullcontext()):
+                self.cur.execute(instruction)
+                if is_select:
+                    print("接受到的指令:",instruction)
+                    output = self.cur.fetchall()
+                else:
+                    output = f"Affected rows: {self.cur.rowcount}"
+            if is_select:
                 self.conn.commit()
+                if key is not None:
+                    get_cache().put(key, output, gen)
             else:
-                self.conn.commit()
-                output = f"Affected rows: {self.cur.rowcount}"
+                self._commit()
             return output
         except Exception as e:
+            if budget is not None and budget.reason:
+                self.conn.rollback()
+                raise
             print("Error from custom instruction in db_tools: ",e)
 
-    def list_file_and_dir_paths(self,path: str) -> list[str]:
+    def subtree(self, path:str, max_depth:int = None) -> list[str]:
+        """
+        目录 path 及其全部子项的 path（path 本身在首位；不在库中时返回空列表）
+        沿 parent_id 递归（走 idx_files_parent），只展开目录
+        max_depth: 只取到相对 path 的第几层（1 为直接子项），None 为不限
+        """
         path = os.path.normpath(path)
-        like_pattern = path + os.sep + "%"
-        self.cur.execute("BEGIN")
         self.cur.execute("""
-        SELECT path FROM files WHERE path LIKE?""",(like_pattern,))
+        WITH RECURSIVE sub(id, is_dir, level) AS (
+          SELECT id, deleted, 0 FROM files WHERE path = ?1
+          UNION ALL
+          SELECT f.id, f.deleted, sub.level + 1 FROM sub JOIN files f ON f.parent_id = sub.id
+          WHERE sub.is_dir = 1 AND (?2 IS NULL OR sub.level < ?2)
+        )
+        SELECT f.path FROM sub JOIN files f ON f.id = sub.id
+        """, (path, max_depth))
+        return [r[0] for r in self.cur.fetchall()]
+
+    def dir_stats(self, path:str, top:int = 5) -> dict:
+        """
+        目录 path 的递归汇总（读 dir_stats / dir_ext_stats，不扫描子树）；不在库中或不是目录时返回 None
+        返回: {'files', 'dirs', 'size', 'exts': [(ext, 文件数, 大小), ...]（按文件数取前 top 个）}
+        """
+        row = self.cur.execute("""
+        SELECT s.dir_id, s.files, s.dirs, s.size FROM files f JOIN dir_stats s ON s.dir_id = f.id WHERE f.path = ?
+        """, (os.path.normpath(path),)).fetchone()
+        if row is None:
+            return None
+        exts = self.cur.execute("""
+        SELECT ext, files, size FROM dir_ext_stats WHERE dir_id = ? ORDER BY files DESC, size DESC LIMIT ?
+        """, (row[0], top)).fetchall()
+        return {"files": row[1], "dirs": row[2], "size": row[3], "exts": exts}
+
+    def rebuild_rollup(self) -> int:
+        """从 files 全量重算目录汇总（一个事务），返回目录数"""
+        t0 = time.perf_counter()
+        try:
+            self.cur.execute("BEGIN")
+            n = rollup.recompute(self.cur)
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "rebuild_rollup", e)
+            return 0
+        print(f"[schema] dir_stats 目录汇总已重算: {n} 个目录 {time.perf_counter() - t0:.1f}s")
+        return n
 
-        row = self.cur.fetchall()
-        output = [each[0] for each in row]
+    def analyze(self, force:bool = False) -> bool:
+        """统计信息缺失或过期时收集（见 refresh_stats）；建表检查、初始化扫描、对账、重建之后调用"""
+        try:
+            t0 = time.perf_counter()
+            if refresh_stats(self.cur, force):
+                self.conn.commit()
+                print(f"[schema] ANALYZE {time.perf_counter() - t0:.2f}s")
+                return True
+        except Exception as e:
+            self.conn.rollback()
+            error(f_name, "analyze", e)
+        return False
+
+    def list_file_and_dir_paths(self,path: str) -> list[str]:
+        path = os.path.normpath(path)
+        output = [p for p in self.subtree(path) if p != path]
         output.append(path)
-        self.conn.commit()
         return output
 
     def reset_db(self) -> bool:
@@ -305,7 +984,7 @@ class DBTools:
         try:
             self.cur.execute("BEGIN")
             self.cur.execute("DELETE FROM files")
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
             self.conn.rollback()
@@ -0,0 +1,270 @@
+import os, json, time, hashlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+from sql.db_tools import DBTools
+from sql.hasher import hash_file
+from sql.writer import get_writer
+from core.error_handler import error
+
+# 重复文件查找（分层筛选，绝大多数文件不会被读取）
+# 1) SQL 按 size 分组，只保留大小相同的文件（大小唯一的文件不可能重复）
+# 2) 对候选文件计算局部哈希：首尾各 PARTIAL_BYTES（不超过 2*PARTIAL_BYTES 的文件即整个内容）
+#    结果按 (path, size, mtime) 缓存在 dup_partial 表，文件未变化时不再读取
+# 3) 局部哈希仍相同的组才做全量哈希；files.content_hash 未过期时直接使用，新算出的顺带写回
+# 结果存入 dup_groups，库中文件未变化时重复查询直接读缓存
+# 建表与缓存、哈希的写入都经由写线程（sql.writer），本模块的连接只读
+
+f_name = "duplicates.py"
+
+PARTIAL_BYTES = 64 * 1024
+READ_WORKERS = 8            # 并行读取文件的线程数
+STORE_WAIT = 10.0           # 等待写线程写完缓存的秒数；超时不影响本次结果，写入仍会完成
+
+DDL = """
+CREATE TABLE IF NOT EXISTS dup_partial (
+  path         TEXT PRIMARY KEY,
+  size         INTEGER,
+  mtime        INTEGER,
+  partial_hash TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS dup_groups (
+  group_id     INTEGER NOT NULL,
+  content_hash TEXT,
+  size         INTEGER,
+  path         TEXT NOT NULL,
+  mtime        INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_dup_groups_group ON dup_groups(group_id);
+
+CREATE TABLE IF NOT EXISTS dup_state (
+  id          INTEGER PRIMARY KEY CHECK (id = 1),
+  signature   TEXT,
+  computed_at INTEGER,
+  stats       TEXT
+);
+"""
+
+
+def _ensure_tables(db: DBTools):
+    # 缓存表不存在时交给写线程建表并等待完成
+    if db.cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'dup_state'").fetchone() is None:
+        get_writer().submit(lambda w: [w.cur.execute(s) for s in DDL.split(";") if s.strip()]).result()
+
+
+def partial_hash(path: str, size: int) -> str:
+    """首尾各 PARTIAL_BYTES 的 blake2b；小文件即整个内容"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 2 * PARTIAL_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_BYTES))
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def _scope_sql(scope: Optional[str]) -> Tuple[str, tuple]:
+    if not scope:
+        return "", ()
+    d = os.path.normpath(scope)
+    return " AND path >= ? AND path < ?", (d + os.sep, d + chr(ord(os.sep) + 1))
+
+
+def _signature(db: DBTools, min_size: int, scope: Optional[str]) -> str:
+    # 新增（count/max id）、删除（count）、修改（max mtime/total size）都会改变签名；
+    # 缓存组内文件的改名/删除在读缓存时逐一核对
+    where, args = _scope_sql(scope)
+    row = db.cur.execute(
+        f"SELECT count(*), max(id), max(mtime), total(size) FROM files WHERE deleted = 0 AND size >= ?{where}",
+        (min_size,) + args).fetchone()
+    return json.dumps([scope or "", min_size] + list(row))
+
+
+def _load_cached(db: DBTools, signature: str) -> Optional[Dict]:
+    state = db.cur.execute("SELECT signature, stats FROM dup_state WHERE id = 1").fetchone()
+    if state is None or state[0] != signature:
+        return None
+    # 缓存中的文件必须仍在库中且 size/mtime 未变
+    stale = db.cur.execute("""
+    SELECT 1 FROM dup_groups g LEFT JOIN files f ON f.path = g.path
+    WHERE f.path IS NULL OR f.size != g.size OR f.mtime != g.mtime LIMIT 1
+    """).fetchone()
+    if stale:
+        return None
+    groups: Dict[int, Dict] = {}
+    for gid, h, size, path in db.cur.execute(
+            "SELECT group_id, content_hash, size, path FROM dup_groups ORDER BY group_id, path"):
+        groups.setdefault(gid, {"content_hash": h, "size": size, "paths": []})["paths"].append(path)
+    stats = json.loads(state[1])
+    stats["cached"] = True
+    return {"groups": list(groups.values()), "stats": stats}
+
+
+def find_duplicates(scope: Optional[str] = None, min_size: int = 1, refresh: bool = False) -> Dict:
+    """
+    scope:    只在该目录下查找（None 为全部根目录）
+    min_size: 忽略小于该字节数的文件（默认跳过空文件）
+    refresh:  忽略缓存重新计算
+    返回 {'groups': [{'content_hash', 'size', 'paths'}...]（按浪费空间降序）,
+          'stats': {'candidates','partial_read','full_read','bytes_read','groups','duplicate_files',
+                    'wasted_bytes','seconds','cached'}}
+    """
+    t0 = time.perf_counter()
+    stats = {"candidates": 0, "partial_read": 0, "full_read": 0, "bytes_read": 0,
+             "groups": 0, "duplicate_files": 0, "wasted_bytes": 0, "seconds": 0.0, "cached": False}
+    db = DBTools()
+    try:
+        _ensure_tables(db)
+        signature = _signature(db, min_size, scope)
+        if not refresh:
+            cached = _load_cached(db, signature)
+            if cached is not None:
+                return cached
+
+        # 1) 大小相同的候选文件
+        where, args = _scope_sql(scope)
+        rows = db.cur.execute(f"""
+        SELECT f.path, f.size, f.mtime, f.content_hash, f.hash_size, f.hash_mtime, p.partial_hash,
+               p.size, p.mtime
+        FROM files f
+        JOIN (SELECT size FROM files WHERE deleted = 0 AND size >= ?{where}
+              GROUP BY size HAVING count(*) > 1) s ON s.size = f.size
+        LEFT JOIN dup_partial p ON p.path = f.path
+        WHERE f.deleted = 0{where.replace('path', 'f.path')}
+        """, (min_size,) + args + args).fetchall()
+        stats["candidates"] = len(rows)
+
+        # 2) 局部哈希（缓存命中则不读文件）
+        partial: Dict[str, str] = {}
+        todo = []
+        for path, size, mtime, _, _, _, ph, p_size, p_mtime in rows:
+            if ph is not None and p_size == size and p_mtime == mtime:
+                partial[path] = ph
+            else:
+                todo.append((path, size))
+
+        def _partial(item):
+            try:
+                return item, partial_hash(item[0], item[1])
+            except OSError:
+                return item, None
+
+        with ThreadPoolExecutor(READ_WORKERS) as pool:
+            for (path, size), ph in pool.map(_partial, todo):
+                if ph is not None:
+                    partial[path] = ph
+                    stats["partial_read"] += 1
+                    stats["bytes_read"] += min(size, 2 * PARTIAL_BYTES)
+
+        buckets: Dict[Tuple[int, str], List[tuple]] = {}
+        for row in rows:
+            ph = partial.get(row[0])
+            if ph is not None:
+                buckets.setdefault((row[1], ph), []).append(row)
+
+        # 3) 局部哈希相同的组才做全量哈希
+        full: Dict[str, str] = {}
+        need_full = []
+        for (size, ph), members in buckets.items():
+            if len(members) < 2:
+                continue
+            for path, _, mtime, h, h_size, h_mtime, *_ in members:
+                if size <= 2 * PARTIAL_BYTES:
+                    full[path] = "p:" + ph                   # 局部哈希已覆盖全部内容
+                elif h is not None and h_size == size and h_mtime == mtime:
+                    full[path] = h
+                else:
+                    need_full.append((path, size, mtime))
+
+        def _full(item):
+            try:
+                return item, hash_file(item[0])
+            except OSError:
+                return item, None
+
+        hash_updates = []
+        with ThreadPoolExecutor(READ_WORKERS) as pool:
+            for (path, size, mtime), h in pool.map(_full, need_full):
+                if h is not None:
+                    full[path] = h
+                    hash_updates.append((h, size, mtime, path, size, mtime))
+                    stats["full_read"] += 1
+                    stats["bytes_read"] += size
+
+        groups: Dict[Tuple[int, str], List[tuple]] = {}
+        for (size, _), members in buckets.items():
+            for m in members:
+                h = full.get(m[0])
+                if h is not None:
+                    groups.setdefault((size, h), []).append(m)
+        result = [{"content_hash": None if h.startswith("p:") else h, "size": size,
+                   "paths": sorted(m[0] for m in members), "_rows": members}
+                  for (size, h), members in groups.items() if len(members) > 1]
+        result.sort(key=lambda g: g["size"] * (len(g["paths"]) - 1), reverse=True)
+
+        stats["groups"] = len(result)
+        stats["duplicate_files"] = sum(len(g["paths"]) for g in result)
+        stats["wasted_bytes"] = sum(g["size"] * (len(g["paths"]) - 1) for g in result)
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+
+        # 写入缓存（局部哈希只保留当前候选，表大小随候选数而不是库大小增长）
+        partial_rows = [(r[0], r[1], r[2], partial[r[0]]) for r in rows if r[0] in partial]
+        group_rows = [(gid, g["content_hash"], g["size"], m[0], m[2])
+                      for gid, g in enumerate(result, 1) for m in g.pop("_rows")]
+        state = (signature, int(time.time()), json.dumps(stats))
+
+        def store(w: DBTools):
+            # 在写线程的事务内执行（单独一个 SAVEPOINT，失败只回滚自己）
+            if not scope:
+                w.cur.execute("DELETE FROM dup_partial")
+            w.cur.executemany(
+                "INSERT OR REPLACE INTO dup_partial (path, size, mtime, partial_hash) VALUES (?,?,?,?)", partial_rows)
+            w.cur.execute("DELETE FROM dup_groups")
+            w.cur.executemany(
+                "INSERT INTO dup_groups (group_id, content_hash, size, path, mtime) VALUES (?,?,?,?,?)", group_rows)
+            w.cur.execute("INSERT OR REPLACE INTO dup_state (id, signature, computed_at, stats) VALUES (1,?,?,?)", state)
+            # 新算出的全量哈希顺带写回 files（与后台哈希同一规则：size/mtime 未变才写）
+            w.cur.executemany("""
+            UPDATE files SET content_hash = ?, hash_size = ?, hash_mtime = ?
+            WHERE path = ? AND size = ? AND mtime = ?
+            """, hash_updates)
+
+        # 缓存写入失败或写线程繁忙只影响下次能否命中缓存，本次结果照常返回
+        try:
+            get_writer().submit(store).result(STORE_WAIT)
+        except FutureTimeout:
+            print("[duplicates] 写线程繁忙，缓存稍后写入")
+        except Exception as e:
+            error(f_name, "find_duplicates.store", e)
+        print(f"[duplicates] candidates={stats['candidates']} partial={stats['partial_read']} "
+              f"full={stats['full_read']} groups={stats['groups']} {stats['seconds']}s")
+        return {"groups": result, "stats": stats}
+
+    except Exception as e:
+        error(f_name, "find_duplicates", e)
+        return {"groups": [], "stats": stats}
+    finally:
+        db.close()
+
+
+def _fmt_size(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+def format_duplicates(result: Dict, limit: int = 20) -> str:
+    """格式化为聊天窗口显示的文本：汇总 + 浪费空间最多的前 limit 组"""
+    s = result["stats"]
+    lines = [f"重复文件 {s['groups']} 组，共 {s['duplicate_files']} 个文件，可释放 {_fmt_size(s['wasted_bytes'])}"
+             + ("（缓存）" if s.get("cached") else f"（候选 {s['candidates']}，读取 {_fmt_size(s['bytes_read'])}）")]
+    for i, g in enumerate(result["groups"][:limit], 1):
+        lines.append(f"[{i}] {_fmt_size(g['size'])} × {len(g['paths'])}")
+        lines += [f"    {p}" for p in g["paths"]]
+    if len(result["groups"]) > limit:
+        lines.append(f"... 其余 {len(result['groups']) - limit} 组未显示")
+    return "\n".join(lines)
@@ -0,0 +1,225 @@
+import os, time, threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from core.error_handler import error
+from data.meta_data import get_option
+from sql import metrics
+
+# 监听事件合并队列
+# watchdog 回调只负责 put()，后台线程在短窗口内合并事件后整批交给 apply 回调：
+# - 新建 + 删除 相互抵消；删除后又新建的路径原记录仍在库中，新建带 replaces 标记，之后再删除/移走时不抵消
+# - 重复的修改只保留一次
+# - 连续移动串联为一次 (a→b→c 记为 a→c)
+# - 目录移动时，窗口内其子路径的待处理事件一起改写到新前缀下；
+#   watchdog 随后为每个子项补发的移动事件在内存中去重（保留 MOVE_DEDUPE_SECONDS 秒，可跨批次）
+
+f_name = "event_queue.py"
+MOVE_DEDUPE_SECONDS = 10.0
+
+CREATED = "created"
+DELETED = "deleted"
+MOVED = "moved"
+MODIFIED = "modified"
+
+
+@dataclass
+class FileEvent:
+    """一条待落库的文件事件。MOVED 时 src 为旧路径、dest 为新路径"""
+    kind: str
+    src: str
+    is_directory: bool = False
+    dest: str = ""
+    ts: float = 0.0             # 进入队列的时间戳（time.time()）
+    replaces: bool = False      # CREATED/MOVED 的目标路径上原有记录已在窗口内被删除：落库时先清掉它的子树
+
+    @property
+    def path(self) -> str:
+        """事件作用后的当前路径，用作合并的键"""
+        return self.dest if self.kind == MOVED else self.src
+
+
+_m_pending = metrics.gauge("queue.pending")
+_m_batch = metrics.histogram("queue.batch_size", metrics.SIZE_BUCKETS)
+_m_coalesced = metrics.counter("queue.coalesced")      # 合并/抵消掉的事件数
+
+
+def _under(path: str, prefix: str) -> bool:
+    return path.startswith(prefix + os.sep)
+
+
+class EventQueue:
+    """
+    合并事件队列
+    apply_batch: 接收一批已合并的 FileEvent，负责在一个事务内落库
+    flush_ms:    事件在队列中最长等待时间（毫秒）
+    batch_size:  待处理事件数达到该值时立即刷新
+    """
+
+    def __init__(self, apply_batch: Callable[[List[FileEvent]], None],
+                 flush_ms: Optional[int] = None, batch_size: Optional[int] = None):
+        self.apply_batch = apply_batch
+        self.flush_ms = int(flush_ms if flush_ms is not None else get_option("TRACKER_FLUSH_MS"))
+        self.batch_size = int(batch_size if batch_size is not None else get_option("TRACKER_BATCH_SIZE"))
+        self._pending: Dict[str, FileEvent] = {}
+        self._dir_moves: List[FileEvent] = []   # 近期的目录移动，用于丢弃子项移动事件
+        self._oldest = 0.0
+        self._puts = 0                          # 自上次取批以来 put 的事件数（用于统计合并掉的事件）
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 生产端 ---------- #
+    def put(self, event: FileEvent):
+        if not event.ts:
+            event.ts = time.time()
+        with self._cond:
+            was_empty = not self._pending
+            if was_empty:
+                self._oldest = event.ts
+            self._merge(event)
+            self._puts += 1
+            _m_pending.set(len(self._pending))
+            # 首个事件需唤醒消费线程开始计时；达到批量上限则立即刷新
+            if was_empty or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _merge(self, ev: FileEvent):
+        pending = self._pending
+        if ev.kind == CREATED:
+            old = pending.get(ev.src)
+            if old is None:
+                pending[ev.src] = ev
+            elif old.kind == DELETED:
+                # 删除后又新建：原记录仍在库中，不能当作全新的路径（之后再删除/移走时要删掉原记录）
+                pending[ev.src] = FileEvent(CREATED, ev.src, ev.is_directory, ts=old.ts, replaces=True)
+            # 已有 新建/修改/移入 时，落库时都会重新读取元数据，无需再记
+
+        elif ev.kind == MODIFIED:
+            if ev.src not in pending:
+                pending[ev.src] = ev
+
+        elif ev.kind == DELETED:
+            old = pending.pop(ev.src, None)
+            if old is not None and old.kind == CREATED and not old.replaces:
+                return      # 新建后又删除：抵消
+            if old is not None and old.kind == MOVED:
+                # 移动后又删除：等价于删除原路径（目标路径上被覆盖的原记录也要删除）
+                if old.replaces:
+                    pending[ev.src] = FileEvent(DELETED, ev.src, ev.is_directory, ts=old.ts)
+                prior = pending.get(old.src)
+                if prior is not None and prior.kind == CREATED:
+                    prior.replaces = True   # 原路径上又新建了：原记录由新建替换
+                    return
+                ev = FileEvent(DELETED, old.src, ev.is_directory, ts=old.ts)
+            pending[ev.src] = ev
+
+        elif ev.kind == MOVED:
+            # 目录移动产生的子项移动事件，已被目录移动覆盖
+            if self._covered_by_dir_move(ev):
+                return
+            old = pending.pop(ev.src, None)
+            if old is None or old.kind == MODIFIED:
+                merged = ev
+            elif old.kind == CREATED:
+                merged = FileEvent(CREATED, ev.dest, ev.is_directory, ts=old.ts)
+                if old.replaces:
+                    pending[ev.src] = FileEvent(DELETED, ev.src, ev.is_directory, ts=old.ts)    # 原记录
+            elif old.kind == MOVED:
+                if old.replaces:
+                    pending[ev.src] = FileEvent(DELETED, ev.src, ev.is_directory, ts=old.ts)    # 被覆盖的原记录
+                if old.src == ev.dest:
+                    merged = FileEvent(MODIFIED, ev.dest, ev.is_directory, ts=old.ts)
+                else:
+                    merged = FileEvent(MOVED, old.src, ev.is_directory, ev.dest, ts=old.ts)
+            else:
+                merged = ev
+            target = pending.get(merged.path)
+            if merged.kind != MODIFIED and target is not None and (target.kind == DELETED or target.replaces):
+                merged.replaces = True      # 移到窗口内刚删除的路径上：原记录落库时先清掉
+            pending[merged.path] = merged
+            if ev.is_directory:
+                self._rekey_children(ev.src, ev.dest)
+                if merged.kind == MOVED:
+                    self._dir_moves.append(FileEvent(MOVED, ev.src, True, ev.dest, ts=ev.ts))
+
+    def _covered_by_dir_move(self, ev: FileEvent) -> bool:
+        if not self._dir_moves:
+            return False
+        horizon = ev.ts - MOVE_DEDUPE_SECONDS
+        self._dir_moves = [d for d in self._dir_moves if d.ts >= horizon]
+        for d in self._dir_moves:
+            if _under(ev.src, d.src) and ev.dest == d.dest + ev.src[len(d.src):]:
+                return True
+        return False
+
+    def _rekey_children(self, old_dir: str, new_dir: str):
+        # 目录移走后，窗口内其子路径上的待处理事件跟随到新路径
+        moved = [k for k in self._pending if _under(k, old_dir)]
+        for k in moved:
+            ev = self._pending.pop(k)
+            new_key = new_dir + k[len(old_dir):]
+            if ev.kind == MOVED:
+                ev.dest = new_key
+            else:
+                ev.src = new_key
+            self._pending[new_key] = ev
+
+    def requeue(self, batch: List[FileEvent]):
+        """落库失败的批次放回队列：按发生顺序排在之后到达的事件之前重新合并，下次刷新时重试"""
+        with self._cond:
+            later = list(self._pending.values())
+            self._pending = {}
+            for ev in batch + later:
+                self._merge(ev)
+            self._oldest = min([ev.ts for ev in batch] + ([self._oldest] if later else []))
+            self._puts += len(batch)
+            _m_pending.set(len(self._pending))
+            self._cond.notify()
+
+    # ---------- 消费端 ---------- #
+    def _take(self) -> List[FileEvent]:
+        batch = list(self._pending.values())
+        self._pending = {}
+        if batch:
+            _m_batch.observe(len(batch))
+            _m_coalesced.inc(self._puts - len(batch))
+        self._puts = 0
+        _m_pending.set(0)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        if len(self._pending) >= self.batch_size:
+                            break
+                        remain = self._oldest + self.flush_ms / 1000 - time.time()
+                        if remain <= 0:
+                            break
+                        self._cond.wait(remain)
+                    else:
+                        self._cond.wait()
+                batch = self._take()
+                stopped = self._stopped
+            if batch:
+                try:
+                    self.apply_batch(batch)
+                except Exception as e:
+                    error(f_name, "apply_batch", e)
+            if stopped:
+                return
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="tracker-event-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止并把剩余事件刷入数据库"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
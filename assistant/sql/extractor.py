@@ -0,0 +1,165 @@
+import os, re, time, codecs, sqlite3, unicodedata
+from typing import Callable, Optional
+from data.meta_data import get_option
+from sql import metrics
+from sql.writer import get_writer
+from sql.db_tools import get_pool
+from sql.hasher import foreground_busy
+from sql.background import BackgroundQueue, Singleton
+
+# 后台正文抽取（按内容检索）
+# 文本类文件的正文规范化后存入 content_text，content_fts 为其 trigram 全文索引（rowid = files.id）：
+# - 只读不超过 EXTRACT_MAX_KB 的文件；先读开头 SNIFF_BYTES 字节判断是否文本、用什么编码，二进制文件不往下读
+# - 每个处理过的文件都记一行 (size, mtime)（二进制/过大的文件 text 为 NULL），两者不变就不再读
+# - 写回经由写线程，且只在 (size, mtime) 仍与库中一致时生效（同 hasher）；入队与按页补抽见 sql/background.py
+# - 单线程，按 EXTRACT_MB_PER_S 限速；前台有负载时与哈希一起暂停（hasher.foreground）
+# - 移动/改名 id 不变，正文沿用；files 删除记录时触发器删除正文；全量重建按 path 把正文迁移到新 id
+# 表结构见 sql/db_tools.py 的 CONTENT_DDL；检索：id in (select rowid from content_fts where content_fts match '"invoice 4471"')
+
+f_name = "extractor.py"
+
+_m_files = metrics.counter("extract.files")
+_m_binary = metrics.counter("extract.binary")        # 判定为非文本、或超过大小上限
+_m_skipped = metrics.counter("extract.skipped")      # (size, mtime) 未变
+_m_bytes = metrics.counter("extract.bytes")
+_m_throttled = metrics.counter("extract.throttled_ms")
+_m_file_ms = metrics.histogram("extract.file_ms")
+
+SNIFF_BYTES = 4096          # 判断文本/编码时读取的字节数
+CTRL_RATIO = 0.05           # 开头样本中控制字符超过该比例视为二进制
+
+_UPSERT = """
+INSERT INTO content_text(file_id, size, mtime, encoding, text)
+SELECT id, ?, ?, ?, ? FROM files WHERE path = ? AND size = ? AND mtime = ? AND deleted = 0
+ON CONFLICT(file_id) DO UPDATE SET
+  size = excluded.size, mtime = excluded.mtime, encoding = excluded.encoding, text = excluded.text
+"""
+
+_BOMS = [(codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+_TEXT_CTRL = set(b"\t\n\r\f\b\x1b")
+_SPACES = re.compile(r"\s+")
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """由文件开头的字节判断编码；不像文本返回 None"""
+    for bom, enc in _BOMS:
+        if head.startswith(bom):
+            return enc
+    if b"\x00" in head:
+        return None
+    if head and sum(1 for b in head if b < 0x20 and b not in _TEXT_CTRL) > len(head) * CTRL_RATIO:
+        return None
+    for enc in ("utf-8", "gb18030"):
+        try:
+            codecs.getincrementaldecoder(enc)().decode(head, final=False)   # 样本末尾可能截断在多字节字符中间
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def normalize(text: str) -> str:
+    """NFKC（全角转半角等）并把连续空白合并为一个空格"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def extract_text(path: str, max_bytes: int):
+    """(编码, 规范化正文)；非文本或超过 max_bytes 时为 (None, None)"""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+        enc = sniff(head)
+        if enc is None:
+            return None, None
+        data = head + f.read(max_bytes + 1 - len(head))
+    if len(data) > max_bytes:
+        return None, None       # stat 之后文件又变大
+    return enc, normalize(data.decode(enc, errors="replace"))
+
+
+class ContentExtractor(BackgroundQueue):
+    """
+    正文抽取线程（单线程；队列、补抽与启停见 sql/background.py）
+    submit:     写任务提交函数（sql.writer.DBWriter.submit）
+    max_bytes:  只抽取不超过该大小的文件，默认读取配置 EXTRACT_MAX_KB
+    mb_per_s:   读取速率上限（MB/s，0 为不限），默认读取配置 EXTRACT_MB_PER_S
+    busy:       返回 True 时暂停取任务，默认 hasher.foreground_busy
+    """
+    f_name = "extractor.py"
+    thread_name = "extractor"
+    metric = "extract"
+    # 补抽尚未处理、或 (size, mtime) 已与上次抽取不一致的文件（超过大小上限的文件也要记一行，不按 size 过滤）
+    STALE_SQL = """
+    SELECT f.id, f.path FROM files f LEFT JOIN content_text c ON c.file_id = f.id
+    WHERE f.id > ? AND f.deleted = 0
+      AND (c.file_id IS NULL OR c.size IS NOT f.size OR c.mtime IS NOT f.mtime)
+    """
+
+    def __init__(self, submit: Callable, max_bytes: Optional[int] = None, mb_per_s: Optional[float] = None,
+                 busy: Callable[[], bool] = foreground_busy):
+        super().__init__(submit, 1, busy)
+        self.max_bytes = int(max_bytes if max_bytes is not None else int(get_option("EXTRACT_MAX_KB")) * 1024)
+        self.mb_per_s = float(mb_per_s if mb_per_s is not None else get_option("EXTRACT_MB_PER_S") or 0)
+        self._ready_at = 0.0                    # 限速：下一个文件最早开始读取的时间点（time.monotonic()）
+
+    def _delay(self) -> float:
+        wait = self._ready_at - time.monotonic()
+        if wait > 0:
+            _m_throttled.inc(int(wait * 1000))
+        return wait
+
+    def _process(self, conn: sqlite3.Connection, path: str):
+        st = os.stat(path)
+        size, mtime = int(st.st_size), int(st.st_mtime)
+        row = conn.execute("""
+        SELECT f.id, c.size, c.mtime FROM files f LEFT JOIN content_text c ON c.file_id = f.id
+        WHERE f.path = ? AND f.deleted = 0
+        """, (path,)).fetchone()
+        if row is None:
+            return                      # 不在索引中（已删除、被忽略或是目录）
+        if row[1] == size and row[2] == mtime:
+            _m_skipped.inc()
+            return
+
+        t0 = time.perf_counter()
+        if size > self.max_bytes:
+            enc, text, nbytes = None, None, 0
+        else:
+            enc, text = extract_text(path, self.max_bytes)
+            nbytes = size if enc else min(size, SNIFF_BYTES)
+        _m_file_ms.observe((time.perf_counter() - t0) * 1000)
+        if enc is None:
+            _m_binary.inc()
+        else:
+            _m_files.inc()
+            _m_bytes.inc(size)
+        if self.mb_per_s > 0:
+            start = max(self._ready_at, time.monotonic())
+            self._ready_at = start + nbytes / (self.mb_per_s * (1 << 20))
+
+        self.submit_write(lambda db: db.cur.execute(_UPSERT, (size, mtime, enc, text, path, size, mtime)))
+
+
+def _make() -> Optional[ContentExtractor]:
+    pool = get_pool()
+    conn = pool.checkout()
+    try:
+        ok = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'content_fts'").fetchone()
+    finally:
+        pool.release(conn)
+    if not ok:
+        return None     # SQLite 没有 trigram 分词器，建表时已记录错误
+    return ContentExtractor(lambda fn: get_writer().submit(fn))
+
+
+_service = Singleton(_make)     # 进程内唯一的正文抽取线程
+
+
+def get_extractor() -> Optional[ContentExtractor]:
+    """取得（必要时启动）正文抽取线程；配置 EXTRACT_ENABLED 为 false、或库中没有 content_fts 时返回 None"""
+    if not get_option("EXTRACT_ENABLED"):
+        return None
+    return _service.get()
+
+
+def stop_extractor():
+    _service.stop()
@@ -0,0 +1,33 @@
+import time, threading
+from sql import metrics
+
+# 索引代数：files 表每提交一批写入就加一（单调递增，只在本进程内有效）
+# 写入方（写线程、DBTools 的写方法、对账、重建、重复文件查找）提交后调用 bump()；
+# 查询结果缓存（sql/result_cache.py）记下查询开始前的代数，代数变化即失效
+
+f_name = "generation.py"
+
+_m_generation = metrics.gauge("index.generation")
+
+_gen = 0
+_last = time.monotonic()    # 最近一次推进的时间点（维护线程据此判断是否空闲）
+_lock = threading.Lock()
+
+
+def current() -> int:
+    return _gen
+
+
+def idle_seconds() -> float:
+    """距最近一次提交的秒数"""
+    return time.monotonic() - _last
+
+
+def bump() -> int:
+    """提交了一批写入：代数加一，返回新代数"""
+    global _gen, _last
+    with _lock:
+        _gen += 1
+        _last = time.monotonic()
+        _m_generation.set(_gen)
+        return _gen
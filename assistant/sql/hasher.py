@@ -0,0 +1,125 @@
+import os, time, sqlite3, hashlib
+from typing import Callable, Optional
+from data.meta_data import get_option
+from sql import metrics
+from sql.writer import get_writer
+from sql.background import BackgroundQueue, Singleton
+
+# 后台内容哈希
+# 文件内容以 blake2b 分块流式计算，结果写入 files.content_hash，同时记下计算时的 (size, mtime)：
+# - 入队、去重、按页补算与启停见 sql/background.py（与 extractor 共用）
+# - 计算前先 stat：(size, mtime) 与上次计算时一致则跳过
+# - 写回经由写线程，且只在 (size, mtime) 仍与库中一致时生效，避免计算期间文件又变化写入过期结果
+# - 前台有负载（事件风暴、用户查询）时暂停，见 foreground()
+# 吞吐量（MB/s）等见 sql/metrics.py 中的 hash.* 指标
+
+f_name = "hasher.py"
+
+_m_files = metrics.counter("hash.files")
+_m_skipped = metrics.counter("hash.skipped")
+_m_bytes = metrics.counter("hash.bytes")
+_m_file_ms = metrics.histogram("hash.file_ms")
+_m_rate = metrics.gauge("hash.mb_per_s")
+
+RATE_WINDOW = 2.0           # 秒；吞吐量（MB/s）按该窗口滚动更新
+
+_fg_until = 0.0             # 前台负载持续到的时间点（time.monotonic()）
+
+
+def foreground(seconds: Optional[float] = None):
+    """通知前台有负载：在接下来 seconds 秒内（默认 HASH_PAUSE_SECONDS）暂停哈希"""
+    global _fg_until
+    seconds = float(get_option("HASH_PAUSE_SECONDS") if seconds is None else seconds)
+    _fg_until = max(_fg_until, time.monotonic() + seconds)
+
+
+def foreground_busy() -> bool:
+    return time.monotonic() < _fg_until
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """流式计算整个文件的 blake2b（十六进制）"""
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+class HashPool(BackgroundQueue):
+    """
+    哈希线程池（队列、补算与启停见 sql/background.py）
+    submit:  写任务提交函数（sql.writer.DBWriter.submit）
+    workers: 线程数，默认读取配置 HASH_WORKERS
+    busy:    返回 True 时暂停取任务，默认 foreground_busy
+    """
+    f_name = "hasher.py"
+    thread_name = "hasher"
+    metric = "hash"
+    # 补算尚未哈希、或 (size, mtime) 已与上次哈希不一致的文件
+    STALE_SQL = """
+    SELECT f.id, f.path FROM files f
+    WHERE f.id > ? AND f.deleted = 0
+      AND (f.content_hash IS NULL OR f.hash_size IS NOT f.size OR f.hash_mtime IS NOT f.mtime)
+    """
+
+    def __init__(self, submit: Callable, workers: Optional[int] = None,
+                 busy: Callable[[], bool] = foreground_busy):
+        super().__init__(submit, int(workers or get_option("HASH_WORKERS") or 2), busy)
+        self.chunk_size = int(get_option("HASH_CHUNK_KB") or 1024) * 1024
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_secs = 0.0
+
+    def _process(self, conn: sqlite3.Connection, path: str):
+        st = os.stat(path)
+        size, mtime = int(st.st_size), int(st.st_mtime)
+        row = conn.execute("SELECT content_hash, hash_size, hash_mtime FROM files WHERE path = ?",
+                           (path,)).fetchone()
+        if row is None:
+            return                      # 不在索引中（已删除或被忽略）
+        if row[0] is not None and row[1] == size and row[2] == mtime:
+            _m_skipped.inc()
+            return
+
+        t0 = time.perf_counter()
+        digest = hash_file(path, self.chunk_size)
+        secs = time.perf_counter() - t0
+        _m_file_ms.observe(secs * 1000)
+        _m_files.inc()
+        _m_bytes.inc(size)
+        self._account(size, secs)
+
+        self.submit_write(lambda db: db.cur.execute("""
+        UPDATE files SET content_hash = ?, hash_size = ?, hash_mtime = ?
+        WHERE path = ? AND size = ? AND mtime = ?
+        """, (digest, size, mtime, path, size, mtime)))
+
+    def _account(self, nbytes: int, secs: float):
+        # 吞吐量 = 窗口内哈希的字节数 / 各线程哈希耗时之和 × 线程数（不计暂停与空闲）
+        with self._cond:
+            self._window_bytes += nbytes
+            self._window_secs += secs
+            if time.monotonic() - self._window_start >= RATE_WINDOW and self._window_secs > 0:
+                rate = self._window_bytes / self._window_secs * min(self.workers, len(self._threads) or 1)
+                _m_rate.set(round(rate / (1 << 20), 2))
+                self._window_start = time.monotonic()
+                self._window_bytes = 0
+                self._window_secs = 0.0
+
+
+_service = Singleton(lambda: HashPool(lambda fn: get_writer().submit(fn)))     # 进程内唯一的哈希线程池
+
+
+def get_hasher() -> Optional[HashPool]:
+    """取得（必要时启动）哈希线程池；配置 HASH_ENABLED 为 false 时返回 None"""
+    if not get_option("HASH_ENABLED"):
+        return None
+    return _service.get()
+
+
+def stop_hasher():
+    _service.stop()
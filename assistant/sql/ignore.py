@@ -0,0 +1,157 @@
+import os, re, fnmatch
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from data.meta_data import DB_FILE
+
+# 忽略规则引擎
+# 默认目录/后缀/文件名集合 与 .trackerignore 的 glob/否定规则在构造时一次性编译：
+# - 所有 glob 合并成一个正则，否定规则合并成另一个
+# - 监听根目录预先规范化，路径只做字符串处理，不再 resolve()
+# - 按目录缓存判定上下文（规范化后的绝对/相对前缀、是否已被忽略），
+#   同一目录下的文件只需拼接字符串 + 一次正则匹配
+# 目录被忽略时其下所有路径一律忽略（与扫描时剪枝的行为一致）
+
+f_name = "ignore.py"
+
+# 默认忽略目录/文件/后缀（可按需增删）
+DEFAULT_IGNORE_DIRS = {
+    ".git", ".hg", ".svn", ".idea", ".vscode",
+    "__pycache__", ".mypy_cache", ".pytest_cache",
+    "dist", "build", ".cache", ".local",
+    "node_modules", ".pnpm-store", ".yarn", ".parcel-cache",
+    "venv", ".venv", "env",
+    "Lib", "site-packages",  # Windows venv 常见
+}
+DEFAULT_IGNORE_FILE_SUFFIX = {
+    ".pyc", ".pyo", ".pyd", ".so", ".dll",
+    ".tmp", ".temp", ".swp", ".swx", ".log",
+    ".crdownload", ".part", ".download",
+}
+DEFAULT_IGNORE_FILE_NAMES = {"desktop.ini", "thumbs.db", ".ds_Store"}
+
+DIR_CACHE_SIZE = 65536      # 目录上下文缓存上限，超出后整体清空
+_DB_TAILS = (".wal", "-wal", ".journal", "-journal")
+
+
+def fast_norm(p: str) -> str:
+    """不触碰磁盘的规范化：绝对路径、'/' 分隔、小写"""
+    return os.path.abspath(p).replace(os.sep, "/").lower()
+
+
+def load_ignore_file(path: str) -> Tuple[List[str], List[str]]:
+    """读取 .trackerignore，返回 (忽略规则, 否定规则)"""
+    pats, neg = [], []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                s = line.strip()
+                if not s or s.startswith("#"): continue
+                if s.startswith("!"):
+                    neg.append(s[1:].strip())
+                else:
+                    pats.append(s)
+    return pats, neg
+
+
+def _compile(patterns: List[str]):
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p.lower())})" for p in patterns))
+
+
+class IgnoreMatcher:
+    """
+    root:     监听根目录
+    patterns: .trackerignore 中的忽略规则
+    negs:     .trackerignore 中的否定规则（! 开头）
+    """
+
+    def __init__(self, root: str, patterns: List[str], negs: List[str], db_file: str = DB_FILE):
+        self.root = fast_norm(root)
+        self.patterns = list(patterns)
+        self.negs = list(negs)
+        self._db = fast_norm(db_file)
+        self._glob = _compile(self.patterns)
+        self._neg = _compile(self.negs)
+        self._suffixes = tuple(DEFAULT_IGNORE_FILE_SUFFIX)
+        self._names = {n.lower() for n in DEFAULT_IGNORE_FILE_NAMES}
+        # 目录(原始字符串) -> (绝对前缀, 相对前缀, 路径段命中默认忽略目录, 目录本身已被忽略)
+        self._dirs: Dict[str, Tuple[str, str, bool, bool]] = {}
+
+    @classmethod
+    def from_root(cls, root: str) -> "IgnoreMatcher":
+        pats, neg = load_ignore_file(os.path.join(root, ".trackerignore"))
+        return cls(root, pats, neg)
+
+    # ---------- 判定 ---------- #
+    def ignored(self, path: str) -> bool:
+        d, base = os.path.split(path)
+        return self.ignored_in(d, base)
+
+    def ignored_in(self, dir_path: str, name: str) -> bool:
+        """判断 dir_path 下名为 name 的条目是否忽略（扫描器可直接调用，省去拆分路径）"""
+        if not name:        # 根路径，如 "C:\\" 或 "/"
+            return self._dir_ctx(dir_path)[3]
+        abs_dir, rel_dir, seg_hit, dir_ignored = self._dir_ctx(dir_path)
+        if dir_ignored:
+            return True
+        return self._decide(abs_dir + name.lower(), rel_dir, name.lower(), seg_hit)
+
+    def _decide(self, p_abs: str, rel_dir: Optional[str], base: str, seg_hit: bool) -> bool:
+        # 1) 数据库本体以及衍生
+        if p_abs.startswith(self._db):
+            tail = p_abs[len(self._db):]
+            if not tail or any(s in tail for s in _DB_TAILS):
+                return True
+
+        # 2) 默认文件名/后缀
+        if base in self._names or base.endswith(self._suffixes):
+            return True
+
+        # 3) 路径段命中默认忽略目录
+        seg_hit = seg_hit or base in DEFAULT_IGNORE_DIRS
+
+        # 4) .trackerignore（glob），相对与绝对都试；否定规则可覆盖 3) 与 4)
+        p_rel = p_abs if rel_dir is None else rel_dir + base
+        if self._glob is not None and (self._glob.match(p_rel) or self._glob.match(p_abs)):
+            return not self._neg_hit(p_rel, p_abs)
+        if seg_hit:
+            return not self._neg_hit(p_rel, p_abs)
+        return False
+
+    def _neg_hit(self, p_rel: str, p_abs: str) -> bool:
+        return self._neg is not None and bool(self._neg.match(p_rel) or self._neg.match(p_abs))
+
+    def _dir_ctx(self, dir_path: str) -> Tuple[str, str, bool, bool]:
+        ctx = self._dirs.get(dir_path)
+        if ctx is not None:
+            return ctx
+
+        d_abs = fast_norm(dir_path)
+        if d_abs == self.root:
+            rel = ""
+            seg_hit = self._seg_hit(d_abs)
+            own = self._decide(d_abs, None, d_abs.rsplit("/", 1)[-1], seg_hit)
+        elif d_abs.startswith(self.root + "/"):
+            parent, base = os.path.split(os.path.normpath(dir_path))
+            p_abs, p_rel, p_seg, p_ign = self._dir_ctx(parent)
+            rel = p_rel + base.lower()
+            seg_hit = p_seg or base.lower() in DEFAULT_IGNORE_DIRS
+            own = p_ign or self._decide(d_abs, p_rel, base.lower(), p_seg)
+        else:
+            # 不在监听目录下：只用绝对路径判定
+            rel = None
+            seg_hit = self._seg_hit(d_abs)
+            own = self._decide(d_abs, None, d_abs.rsplit("/", 1)[-1], seg_hit)
+
+        prefix = d_abs if d_abs.endswith("/") else d_abs + "/"
+        rel_prefix = None if rel is None else (rel + "/" if rel else "")
+        ctx = (prefix, rel_prefix, seg_hit, own)
+        if len(self._dirs) >= DIR_CACHE_SIZE:
+            self._dirs.clear()
+        self._dirs[dir_path] = ctx
+        return ctx
+
+    @staticmethod
+    def _seg_hit(p_abs: str) -> bool:
+        return any(seg in DEFAULT_IGNORE_DIRS for seg in Path(p_abs).parts)
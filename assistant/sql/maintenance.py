@@ -0,0 +1,276 @@
+import os, sys, time, sqlite3, threading, argparse
+from typing import Callable, Dict, Optional
+from core.error_handler import error
+from data.meta_data import get_option
+from sql import metrics, generation
+from sql import writer as writer_mod
+from sql.db_tools import get_pool, refresh_stats
+from sql.hasher import foreground_busy
+
+# 数据库后台维护
+# 监听期间库一直在写：改名风暴、全量重建（整表删除再建）之后 assistant.db 与 -wal 文件只增不减，统计信息也会过期
+# 维护线程只在空闲时（最近 MAINT_IDLE_SECONDS 秒没有提交、写队列为空、前台无负载）执行到期的任务：
+# - checkpoint: PASSIVE 检查点；-wal 超过 MAINT_WAL_TRUNCATE_MB 且已全部写回时 TRUNCATE，把 -wal 截断为 0
+# - optimize:   PRAGMA optimize，并在 files 行数漂移时重新 ANALYZE（db_tools.refresh_stats）
+# - vacuum:     auto_vacuum=INCREMENTAL 的库，空闲页超过 MAINT_VACUUM_MIN_MB 时分步 incremental_vacuum，
+#               每步之间重新检查是否空闲；新库由连接池在建表前设为 INCREMENTAL，
+#               旧库转换需要一次完整 VACUUM，由 convert_auto_vacuum() 手动执行（或开启 MAINT_CONVERT_VACUUM）
+# - cache:      按索引大小（dbstat）定 cache_size 的总预算并均分到连接池的各连接，按库文件大小设置 mmap_size
+#               （ConnectionPool.set_pragmas）
+# 每个任务的耗时记入 maint.<任务>_ms，库/WAL/空闲页大小见 db.* 指标；report() 汇总，命令行：
+#   python -m sql.maintenance            # 立即执行全部任务一次（不等空闲）并打印报告
+#   python -m sql.maintenance --report   # 只打印报告
+
+f_name = "maintenance.py"
+
+MB = 1 << 20
+TICK_SECONDS = 5            # 维护线程检查一次是否空闲、有无到期任务的间隔
+
+_m_db = metrics.gauge("db.size_mb")
+_m_wal = metrics.gauge("db.wal_mb")
+_m_free = metrics.gauge("db.freelist_mb")
+_m_skipped = metrics.counter("maint.busy_skips")     # 有到期任务但不空闲的次数
+
+
+def _file_mb(path: str) -> float:
+    try:
+        return os.path.getsize(path) / MB
+    except OSError:
+        return 0.0
+
+
+def sizes(conn: sqlite3.Connection) -> Dict:
+    """{'db_mb', 'wal_mb', 'freelist_mb', 'auto_vacuum'}，同时更新 db.* 指标"""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    page = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0] * page / MB
+    out = {"db_mb": round(_file_mb(path), 1), "wal_mb": round(_file_mb(path + "-wal"), 1),
+           "freelist_mb": round(free, 1),
+           "auto_vacuum": ("none", "full", "incremental")[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]}
+    _m_db.set(out["db_mb"])
+    _m_wal.set(out["wal_mb"])
+    _m_free.set(out["freelist_mb"])
+    return out
+
+
+# ---------- 任务：各自返回一段简短说明，供日志与报告 ---------- #
+def checkpoint(conn: sqlite3.Connection, idle: Callable[[], bool]) -> str:
+    busy, log, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    wal = _file_mb(path + "-wal")
+    if not busy and log == done and wal > float(get_option("MAINT_WAL_TRUNCATE_MB")):
+        busy, log, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return f"truncate {wal:.1f}MB -> {_file_mb(path + '-wal'):.1f}MB"
+    return f"passive {done}/{log} pages"
+
+
+def optimize(conn: sqlite3.Connection, idle: Callable[[], bool]) -> str:
+    conn.execute("PRAGMA optimize")
+    analyzed = refresh_stats(conn.cursor())
+    conn.commit()
+    return "analyze files" if analyzed else "ok"
+
+
+def vacuum(conn: sqlite3.Connection, idle: Callable[[], bool]) -> str:
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    page = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free * page < float(get_option("MAINT_VACUUM_MIN_MB")) * MB:
+        return f"freelist {free * page / MB:.1f}MB"
+    if mode != 2:
+        if get_option("MAINT_CONVERT_VACUUM"):
+            return convert_auto_vacuum(conn)
+        return f"auto_vacuum off, freelist {free * page / MB:.1f}MB (convert_auto_vacuum() to reclaim)"
+    step = max(1, int(float(get_option("MAINT_VACUUM_STEP_MB")) * MB // page))
+    freed = 0
+    while free > 0 and idle():
+        conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= free:
+            break
+        freed, free = freed + free - left, left
+    return f"freed {freed * page / MB:.1f}MB, left {free * page / MB:.1f}MB"
+
+
+def convert_auto_vacuum(conn: sqlite3.Connection) -> str:
+    """把旧库改为 auto_vacuum=INCREMENTAL：需要一次完整 VACUUM（重写整个库，期间阻塞写入）"""
+    t0 = time.perf_counter()
+    before = _file_mb(conn.execute("PRAGMA database_list").fetchone()[2])
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    after = _file_mb(conn.execute("PRAGMA database_list").fetchone()[2])
+    return f"VACUUM {before:.1f}MB -> {after:.1f}MB ({time.perf_counter() - t0:.1f}s)"
+
+
+def tune_cache(conn: sqlite3.Connection, idle: Callable[[], bool]) -> str:
+    """
+    cache_size 总量 ≈ 全部索引（含主键/唯一约束的自动索引）的大小，上限 MAINT_CACHE_MAX_MB，按连接池的连接数均分；
+    mmap_size ≈ 库文件大小
+    """
+    page = conn.execute("PRAGMA page_size").fetchone()[0]
+    try:
+        index = conn.execute("""
+        SELECT coalesce(sum(pgsize), 0) FROM dbstat
+        WHERE aggregate = TRUE AND name IN (SELECT name FROM sqlite_master WHERE type = 'index')
+        """).fetchone()[0]
+    except sqlite3.OperationalError:
+        index = conn.execute("PRAGMA page_count").fetchone()[0] * page // 4     # 未编译 DBSTAT：按库的 1/4 估计
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    pool = get_pool()
+    total = min(max(index * 1.25, 2 * MB), float(get_option("MAINT_CACHE_MAX_MB")) * MB)
+    # 页缓存是每个连接私有的（mmap 为各连接共享）：总预算按连接数上限均分，全部借出时合计也不超过预算；
+    # 每个连接不低于 SQLite 的默认值 2MB
+    cache = max(total / pool.max_connections, 2 * MB)
+    mmap = min(os.path.getsize(path) * 1.25, float(get_option("MAINT_MMAP_MAX_MB")) * MB)
+    pool.set_pragmas({"cache_size": -int(cache // 1024), "mmap_size": int(mmap)})
+    return (f"indexes {index / MB:.1f}MB: cache_size {cache / MB:.1f}MB x {pool.max_connections} connections, "
+            f"mmap_size {mmap / MB:.0f}MB")
+
+
+# (任务名, 函数, 执行周期的配置项)
+TASKS = [
+    ("cache", tune_cache, "MAINT_OPTIMIZE_SECONDS"),
+    ("checkpoint", checkpoint, "MAINT_CHECKPOINT_SECONDS"),
+    ("optimize", optimize, "MAINT_OPTIMIZE_SECONDS"),
+    ("vacuum", vacuum, "MAINT_VACUUM_SECONDS"),
+]
+_m_task = {name: metrics.histogram(f"maint.{name}_ms") for name, _, _ in TASKS}
+
+
+def default_idle() -> bool:
+    """最近 MAINT_IDLE_SECONDS 秒没有提交、写线程队列为空、前台无负载"""
+    w = writer_mod.writer
+    return (generation.idle_seconds() >= float(get_option("MAINT_IDLE_SECONDS"))
+            and (w is None or w.pending() == 0) and not foreground_busy())
+
+
+class Maintainer:
+    """
+    维护线程
+    idle: 返回 True 时才执行任务，默认 default_idle
+    """
+
+    def __init__(self, idle: Callable[[], bool] = default_idle):
+        self.idle = idle
+        self._last: Dict[str, float] = {}       # 任务名 -> 上次执行的时间点（time.monotonic()）
+        self._report: Dict[str, Dict] = {name: {"runs": 0, "last_ms": 0.0, "total_ms": 0.0, "last_at": None,
+                                                "result": ""} for name, _, _ in TASKS}
+        self._lock = threading.Lock()           # 同一时刻只执行一个任务（后台线程与 run_now 之间）
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def due(self) -> list:
+        now = time.monotonic()
+        return [name for name, _, opt in TASKS
+                if name not in self._last or now - self._last[name] >= float(get_option(opt))]
+
+    def run_task(self, name: str, idle: Optional[Callable[[], bool]] = None) -> str:
+        fn = next(f for n, f, _ in TASKS if n == name)
+        pool = get_pool()
+        with self._lock:
+            conn = pool.checkout()
+            t0 = time.perf_counter()
+            try:
+                result = fn(conn, idle or self.idle)
+            except sqlite3.Error as e:
+                result = f"error: {e}"          # 多半是遇到了写锁，下个周期再试
+                error(f_name, name, e)
+            finally:
+                pool.release(conn)
+            ms = (time.perf_counter() - t0) * 1000
+            self._last[name] = time.monotonic()
+            r = self._report[name]
+            r.update(runs=r["runs"] + 1, last_ms=round(ms, 1), total_ms=round(r["total_ms"] + ms, 1),
+                     last_at=int(time.time()), result=result)
+            _m_task[name].observe(ms)
+        print(f"[maint] {name} {ms:.0f}ms {result}")
+        return result
+
+    def run_now(self) -> Dict:
+        """立即执行全部任务一次（不等空闲），返回报告"""
+        for name, _, _ in TASKS:
+            self.run_task(name, idle=lambda: True)
+        return self.report()
+
+    def report(self) -> Dict:
+        """{'db_mb', 'wal_mb', 'freelist_mb', 'auto_vacuum', 'tasks': {任务名: {runs, last_ms, total_ms, last_at, result}}}"""
+        pool = get_pool()
+        conn = pool.checkout()
+        try:
+            out = sizes(conn)
+        finally:
+            pool.release(conn)
+        with self._lock:
+            out["tasks"] = {k: dict(v) for k, v in self._report.items()}
+        return out
+
+    # ---------- 后台线程 ---------- #
+    def _run(self):
+        while not self._stop.wait(TICK_SECONDS):
+            try:
+                due = self.due()
+                if not due:
+                    continue
+                for name in due:
+                    if self._stop.is_set():
+                        return
+                    if not self.idle():
+                        _m_skipped.inc()
+                        break
+                    self.run_task(name)
+                self.report()       # 刷新 db.* 指标
+            except Exception as e:
+                error(f_name, "_run", e)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+maintainer: Optional[Maintainer] = None     # 进程内唯一的维护线程
+_lock = threading.Lock()
+
+
+def get_maintainer() -> Optional[Maintainer]:
+    """取得（必要时启动）维护线程；配置 MAINT_ENABLED 为 false 时返回 None"""
+    global maintainer
+    if not get_option("MAINT_ENABLED"):
+        return None
+    with _lock:
+        if maintainer is None:
+            maintainer = Maintainer()
+            maintainer.start()
+        return maintainer
+
+
+def stop_maintainer():
+    global maintainer
+    with _lock:
+        if maintainer:
+            maintainer.stop()
+            maintainer = None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m sql.maintenance")
+    ap.add_argument("--report", action="store_true", help="只打印库/WAL/空闲页大小，不执行任务")
+    args = ap.parse_args(argv)
+    m = Maintainer()
+    out = m.report() if args.report else m.run_now()
+    tasks = out.pop("tasks")
+    print(" ".join(f"{k}={v}" for k, v in out.items()))
+    for name, r in tasks.items():
+        if r["runs"]:
+            print(f"  {name:<11}{r['last_ms']:>9.1f} ms  {r['result']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import os, sys, json, time, bisect, argparse, threading
+from typing import Dict, Optional, Sequence
+from core.error_handler import error
+from data.meta_data import METRICS_FILE, get_option
+
+# 进程内指标
+# 监听器各环节只做计数/记录，UI 与命令行通过 snapshot() 轮询：
+# - Counter:   单调递增计数（如各类型事件数、被忽略的事件数）
+# - Gauge:     当前值（如队列积压）
+# - Histogram: 固定分桶的分布（如落库耗时、批大小、事件到提交的延迟），给出 p50/p95/p99 估计
+# 监听期间按 METRICS_DUMP_SECONDS 周期写入 data/metrics.json，供另一个进程中的命令行读取：
+#   python -m sql.metrics            # 打印一次
+#   python -m sql.metrics --watch 2  # 每 2 秒刷新
+
+f_name = "metrics.py"
+
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Counter:
+    def __init__(self):
+        self._v = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        with self._lock:
+            self._v += n
+
+    @property
+    def value(self) -> int:
+        return self._v
+
+
+class Gauge:
+    def __init__(self):
+        self._v = 0.0
+
+    def set(self, v: float):
+        self._v = v
+
+    @property
+    def value(self) -> float:
+        return self._v
+
+
+class Histogram:
+    """buckets: 各桶上界（升序），超出最后一个上界的计入 +Inf 桶"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_MS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+        self._lock = threading.Lock()
+
+    def observe(self, v: float):
+        i = bisect.bisect_left(self.buckets, v)
+        with self._lock:
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += v
+            if self._min is None or v < self._min:
+                self._min = v
+            if self._max is None or v > self._max:
+                self._max = v
+
+    def _quantile(self, counts, q: float) -> Optional[float]:
+        # 以所在桶的上界作为估计，不超过观测到的最大值
+        if not self._count:
+            return None
+        rank = q * self._count
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.buckets[i], self._max) if i < len(self.buckets) else self._max
+        return self._max
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            out = {
+                "count": self._count,
+                "sum": round(self._sum, 3),
+                "min": None if self._min is None else round(self._min, 3),
+                "max": None if self._max is None else round(self._max, 3),
+                "avg": round(self._sum / self._count, 3) if self._count else None,
+            }
+            for q in (0.5, 0.95, 0.99):
+                v = self._quantile(counts, q)
+                out[f"p{int(q * 100)}"] = None if v is None else round(v, 3)
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        out["buckets"] = {le: c for le, c in zip(labels, counts) if c}
+        return out
+
+
+class Registry:
+    """按名字取得（不存在则创建）指标，名字用点分层级，如 events.received.created"""
+
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def counter(self, name: str) -> Counter:
+        m = self._counters.get(name)
+        if m is None:
+            with self._lock:
+                m = self._counters.setdefault(name, Counter())
+        return m
+
+    def gauge(self, name: str) -> Gauge:
+        m = self._gauges.get(name)
+        if m is None:
+            with self._lock:
+                m = self._gauges.setdefault(name, Gauge())
+        return m
+
+    def histogram(self, name: str, buckets: Sequence[float] = LATENCY_MS_BUCKETS) -> Histogram:
+        m = self._histograms.get(name)
+        if m is None:
+            with self._lock:
+                m = self._histograms.setdefault(name, Histogram(buckets))
+        return m
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        return {
+            "ts": int(now),
+            "uptime_s": round(now - self.started, 1),
+            "counters": {k: m.value for k, m in sorted(self._counters.items())},
+            "gauges": {k: m.value for k, m in sorted(self._gauges.items())},
+            "histograms": {k: m.snapshot() for k, m in sorted(self._histograms.items())},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+
+registry = Registry()      # 进程内唯一的指标注册表
+
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+
+
+def snapshot() -> Dict:
+    """当前全部指标的快照（可直接 json 序列化）"""
+    return registry.snapshot()
+
+
+def format_snapshot(snap: Dict) -> str:
+    """把快照格式化为便于阅读的多行文本（命令行与 UI 共用）"""
+    lines = [f"uptime: {snap.get('uptime_s', 0)}s"]
+    if snap.get("counters"):
+        lines.append("[counters]")
+        lines += [f"  {k}: {v}" for k, v in snap["counters"].items()]
+    if snap.get("gauges"):
+        lines.append("[gauges]")
+        lines += [f"  {k}: {v}" for k, v in snap["gauges"].items()]
+    if snap.get("histograms"):
+        lines.append("[histograms]  count / avg / p50 / p95 / p99 / max")
+        for k, h in snap["histograms"].items():
+            lines.append(f"  {k}: {h['count']} / {h['avg']} / {h['p50']} / {h['p95']} / {h['p99']} / {h['max']}")
+    return "\n".join(lines)
+
+
+# ---------- 周期落盘（供命令行跨进程读取） ---------- #
+def dump(path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class _Dumper(threading.Thread):
+    def __init__(self, path: str, interval: float):
+        super().__init__(name="metrics-dump", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            dump(self.path)
+        except Exception as e:
+            error(f_name, "dump", e)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+        self._write()       # 停止时再写一次最终状态
+
+
+_dumper: Optional[_Dumper] = None
+
+
+def start_dump(path: Optional[str] = None, interval: Optional[float] = None):
+    """开始周期写入快照；interval <= 0 时不写"""
+    global _dumper
+    interval = float(get_option("METRICS_DUMP_SECONDS") if interval is None else interval)
+    if _dumper is not None or interval <= 0:
+        return
+    _dumper = _Dumper(path or METRICS_FILE, interval)
+    _dumper.start()
+
+
+def stop_dump():
+    global _dumper
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="打印监听器指标（读取运行中的程序写出的快照）")
+    ap.add_argument("--file", default=METRICS_FILE)
+    ap.add_argument("--watch", type=float, default=0, help="每隔 N 秒刷新，0 为只打印一次")
+    ap.add_argument("--json", action="store_true", help="输出原始 JSON")
+    args = ap.parse_args(argv)
+
+    while True:
+        if not os.path.exists(args.file):
+            print(f"找不到{args.file}文件（监听器未运行或 METRICS_DUMP_SECONDS 为 0）")
+        else:
+            with open(args.file, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            age = int(time.time()) - snap.get("ts", 0)
+            print(json.dumps(snap, ensure_ascii=False, indent=2) if args.json
+                  else f"{format_snapshot(snap)}\n(快照于 {age}s 前)")
+        if args.watch <= 0:
+            return
+        time.sleep(args.watch)
+        print()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
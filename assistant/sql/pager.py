@@ -0,0 +1,167 @@
+import time
+from typing import List, Optional, Tuple
+import sql.db_tools as db_tools
+from sql.db_tools import DBTools
+from sql.query_budget import QueryBudget, QueryAborted
+from sql.result_cache import ResultCache, get_cache
+from data.meta_data import get_option
+from sql import generation, metrics
+
+# 分页执行 SELECT（模型生成的查询结果可能有上百万行）
+# - 执行后不 fetchall，游标保持打开，next_page() 每次 fetchmany 一页
+# - count() 给出总行数：第一页就取完时直接得到，否则用 count(*) 包一层原查询，数到 PAGE_COUNT_LIMIT 为止
+# - 聊天窗口与记忆管道只拿第一页和总行数，其余页由用户按需取
+# - 第一页与总行数写入查询结果缓存（sql/result_cache.py）；命中时不执行查询，翻到第二页时才重新执行并跳过第一页
+# 执行语句、取每一页、计数都在 QueryBudget 预算内（见 sql/query_budget.py），超时/超步数/取消时中止
+# 分页期间占用连接池的一个连接（读快照保持打开，WAL 检查点推进不到它之后），取完或不再需要时 close()
+
+f_name = "pager.py"
+
+_m_pages = metrics.counter("pager.pages")
+_m_rows = metrics.counter("pager.rows")
+_m_first_ms = metrics.histogram("pager.first_page_ms")
+_m_count_ms = metrics.histogram("pager.count_ms")
+
+
+class ResultPager:
+    """
+    sql:         已通过 SQL_Filter 的 SELECT
+    page_size:   每页行数，默认读取配置 PAGE_SIZE
+    count_limit: count() 最多数到多少行，默认读取配置 PAGE_COUNT_LIMIT
+    budget:      执行预算，默认 QueryBudget()；界面可对它 cancel()
+    use_cache:   第一页与总行数是否走查询结果缓存（cached 表示本次命中）
+    预算用尽时构造与 next_page() 抛出 QueryAborted（分页器随之关闭），count() 退回已取到的行数
+    """
+
+    def __init__(self, sql: str, page_size: Optional[int] = None, count_limit: Optional[int] = None,
+                 budget: Optional[QueryBudget] = None, use_cache: bool = True):
+        self.sql = sql.replace("\\\\", "\\").strip().rstrip(";").strip()
+        self.page_size = int(page_size or get_option("PAGE_SIZE"))
+        self.count_limit = int(count_limit or get_option("PAGE_COUNT_LIMIT"))
+        self.budget = budget or QueryBudget()
+        self.pages = 0              # 已取的页数
+        self.fetched = 0            # 已取的行数
+        self.exhausted = False
+        self.cached = False
+        self.columns: List[str] = []
+        self._count: Optional[Tuple[int, bool]] = None
+        self._db: Optional[DBTools] = None
+        self._cur = None
+        self._prefetched: Optional[List[tuple]] = None     # 缓存命中时的第一页
+        self._first: Optional[List[tuple]] = None          # 待写入缓存的第一页
+
+        # 代数在执行前取得：执行期间有提交时不写缓存
+        self._gen = generation.current()
+        self._key = ResultCache.key(self.sql, db_tools.DB_FILE, self.page_size, self.count_limit) if use_cache else None
+        hit = get_cache().get(self._key) if self._key else None
+        if hit is not None:
+            self.columns, self._prefetched, self._count = list(hit[0]), list(hit[1]), hit[2]
+            self.cached = True
+        else:
+            self._open()
+
+    def _open(self, skip: int = 0):
+        # 执行查询；skip 为缓存命中后已显示的行数，重新执行时跳过
+        self._db = DBTools()
+        try:
+            self._cur = self._db.conn.cursor()
+            with self.budget.guard(self._db.conn):
+                self._cur.execute(self.sql)
+                if skip:
+                    self._cur.fetchmany(skip)
+        except Exception:
+            self._db.close()
+            self._db = None
+            raise
+        self.columns = [d[0] for d in self._cur.description or ()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def next_page(self) -> List[tuple]:
+        """下一页（取完后返回空列表并归还连接）"""
+        if self.exhausted:
+            return []
+        if self._prefetched is not None:
+            rows, self._prefetched = self._prefetched, None
+            return self._advance(rows)
+        t0 = time.perf_counter()
+        try:
+            if self._db is None:
+                self._open(self.fetched)
+            with self.budget.guard(self._db.conn):
+                rows = self._cur.fetchmany(self.page_size)
+        except Exception:
+            self.close()
+            raise
+        if self.pages == 0:
+            _m_first_ms.observe((time.perf_counter() - t0) * 1000)
+            self._first = rows
+        return self._advance(rows)
+
+    def _advance(self, rows: List[tuple]) -> List[tuple]:
+        self.pages += 1
+        self.fetched += len(rows)
+        _m_pages.inc()
+        _m_rows.inc(len(rows))
+        if len(rows) < self.page_size:
+            # 不足一页即已取完；恰好整页时下一次取到空页再结束（总行数已知时直接结束）
+            self._count = (self.fetched, True)
+            self._remember()
+            self.close()
+        elif self._count is not None and self._count[1] and self.fetched >= self._count[0]:
+            self.close()
+        return rows
+
+    @property
+    def has_more(self) -> bool:
+        return not self.exhausted
+
+    def count(self) -> Tuple[int, bool]:
+        """(总行数, 是否精确)；超过 count_limit 时返回 (count_limit, False)"""
+        if self._count is not None:
+            return self._count
+        if self.exhausted:
+            return self.fetched, False     # 已提前 close()，只知道取到的行数
+        t0 = time.perf_counter()
+        try:
+            with self.budget.guard(self._db.conn):
+                n = self._db.conn.execute(f"SELECT count(*) FROM (SELECT 1 FROM ({self.sql}) LIMIT ?)",
+                                          (self.count_limit + 1,)).fetchone()[0]
+        except QueryAborted:
+            self._count = (self.fetched, False)     # 不写缓存
+            return self._count
+        finally:
+            _m_count_ms.observe((time.perf_counter() - t0) * 1000)
+        self._count = (self.count_limit, False) if n > self.count_limit else (n, True)
+        self._remember()
+        if self._count[1] and self.fetched >= n:
+            self.close()
+        return self._count
+
+    def _remember(self):
+        # 第一页与总行数都已知时写入缓存（只写一次）
+        if self._key and self._first is not None and self._count is not None:
+            get_cache().put(self._key, (tuple(self.columns), self._first, self._count), self._gen)
+            self._first = None
+
+    def close(self):
+        """结束分页，归还连接；重复调用无副作用"""
+        if self.exhausted:
+            return
+        self.exhausted = True
+        if self._db is not None:
+            try:
+                self._cur.close()
+            except Exception:
+                pass
+            self._db.close()
+            self._db = None
+
+
+def format_count(count: Tuple[int, bool]) -> str:
+    """(行数, 是否精确) → '123' / '100000+'"""
+    return f"{count[0]}" if count[1] else f"{count[0]}+"
@@ -0,0 +1,291 @@
+import os, time, zlib, pickle, struct, threading
+from typing import Callable, Dict, List, Optional, Tuple
+from watchdog.events import (FileCreatedEvent, DirCreatedEvent, FileDeletedEvent, DirDeletedEvent,
+                             FileModifiedEvent, FileMovedEvent, DirMovedEvent)
+from core.error_handler import error
+from data.meta_data import get_option
+from sql import metrics
+
+# 快照对比式轮询监听（网络盘 SMB/NFS、超出 inotify 上限的大目录树）
+# 与 watchdog 的 Observer 接口一致（schedule/start/stop/join），产生同样的 watchdog 事件交给 FileChangeHandler：
+# - 每个目录在快照中保存：目录 mtime、子目录名、各条目 (inode, size, mtime_ns, 类型)，条目紧凑打包为 bytes
+# - 轮询时每个目录先 stat 一次，mtime 未变则不列目录，只继续深入其子目录
+# - mtime 变化的目录重新列举并与快照对比：新增/消失的条目按 inode 配对为移动，其余为 新建/删除；
+#   文件 size/mtime 变化为修改
+# - 原地修改文件不改变目录 mtime，每 POLL_FULL_EVERY 轮做一次完整校验（列举全部目录）
+# - 按 POLL_CPU_BUDGET 限制 CPU 占用；快照压缩后保存在 data/ 下，重启后沿用
+# 扫描代价见 sql/metrics.py 中的 poll.* 指标
+
+f_name = "poller.py"
+
+_ENTRY = struct.Struct("<qqqB")     # inode, size, mtime_ns, 类型(0=文件 1=目录 2=目录符号链接，不深入)
+SNAPSHOT_VERSION = 1
+
+_m_cycle = metrics.histogram("poll.cycle_ms")
+_m_cpu = metrics.histogram("poll.cycle_cpu_ms")
+_m_stat = metrics.counter("poll.dirs_stat")
+_m_listed = metrics.counter("poll.dirs_listed")
+_m_entries = metrics.counter("poll.entries_listed")
+_m_events = metrics.counter("poll.events")
+_m_throttled = metrics.counter("poll.throttled_ms")
+_m_dirs = metrics.gauge("poll.snapshot_dirs")
+
+
+def _pack(entries: Dict[str, Tuple]) -> Tuple[tuple, bytes]:
+    names = tuple(entries)
+    return names, b"".join(_ENTRY.pack(*entries[n]) for n in names)
+
+
+def _unpack(names: tuple, packed: bytes) -> Dict[str, Tuple]:
+    return dict(zip(names, _ENTRY.iter_unpack(packed)))
+
+
+class SnapshotObserver(threading.Thread):
+    """
+    snapshot_file: 快照文件路径
+    interval:      轮询间隔（秒），默认读取配置 POLL_INTERVAL_SECONDS
+    cpu_budget:    允许占用的单核 CPU 比例，默认读取配置 POLL_CPU_BUDGET
+    full_every:    每多少轮做一次完整校验，默认读取配置 POLL_FULL_EVERY（0 为不做）
+    should_ignore: 被忽略的条目不进入快照，被忽略的目录不深入
+    """
+
+    def __init__(self, snapshot_file: str, interval: Optional[float] = None,
+                 cpu_budget: Optional[float] = None, full_every: Optional[int] = None,
+                 should_ignore: Callable[[str], bool] = lambda p: False):
+        super().__init__(name="snapshot-observer", daemon=True)
+        self.snapshot_file = snapshot_file
+        self.interval = float(interval if interval is not None else get_option("POLL_INTERVAL_SECONDS"))
+        self.cpu_budget = float(cpu_budget if cpu_budget is not None else get_option("POLL_CPU_BUDGET"))
+        self.full_every = int(full_every if full_every is not None else get_option("POLL_FULL_EVERY"))
+        self.should_ignore = should_ignore
+        self.handler = None
+        self.root = ""
+        # 目录 -> (目录 mtime_ns, 子目录名, 条目名, 打包的条目)
+        self._snap: Dict[str, Tuple[int, tuple, tuple, bytes]] = {}
+        self._halt = threading.Event()
+        self._force_full = False
+        self._dirty = False
+
+    # ---------- 与 watchdog Observer 一致的接口 ---------- #
+    def schedule(self, handler, path: str, recursive: bool = True):
+        self.handler = handler
+        self.root = os.path.normpath(path)
+
+    def stop(self):
+        self._halt.set()
+
+    def invalidate(self):
+        """下一轮做完整校验（如忽略规则变化后）"""
+        self._force_full = True
+
+    # ---------- 快照 ---------- #
+    def _load(self) -> bool:
+        try:
+            with open(self.snapshot_file, "rb") as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            error(f_name, "_load", e)
+            return False
+        if data.get("version") != SNAPSHOT_VERSION or data.get("root") != self.root:
+            return False
+        self._snap = data["dirs"]
+        return True
+
+    def _save(self):
+        tmp = self.snapshot_file + ".tmp"
+        data = {"version": SNAPSHOT_VERSION, "root": self.root, "dirs": self._snap}
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(tmp, self.snapshot_file)
+        self._dirty = False
+
+    def _list(self, d: str) -> Optional[Dict[str, Tuple]]:
+        entries = {}
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if self.should_ignore(e.path):
+                        continue
+                    try:
+                        is_dir = e.is_dir()
+                        st = e.stat()
+                        kind = (2 if e.is_symlink() else 1) if is_dir else 0
+                        entries[e.name] = (e.inode(), 0 if is_dir else st.st_size, st.st_mtime_ns, kind)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        _m_listed.inc()
+        _m_entries.inc(len(entries))
+        return entries
+
+    def _record(self, d: str, mtime_ns: int, entries: Dict[str, Tuple]):
+        subdirs = tuple(n for n, e in entries.items() if e[3] == 1)
+        self._snap[d] = (mtime_ns, subdirs, *_pack(entries))
+        self._dirty = True
+
+    def _add_tree(self, top: str, emit: bool):
+        # 列举整棵子树写入快照；emit 时为每个条目产生新建事件
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            try:
+                mtime_ns = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            _m_stat.inc()
+            entries = self._list(d)
+            if entries is None:
+                continue
+            self._record(d, mtime_ns, entries)
+            for name, e in entries.items():
+                p = os.path.join(d, name)
+                if emit:
+                    self._emit(DirCreatedEvent(p) if e[3] else FileCreatedEvent(p))
+                if e[3] == 1:
+                    stack.append(p)
+            self._throttle()
+
+    def _subtree_dirs(self, top: str) -> List[str]:
+        out, stack = [], [top]
+        while stack:
+            d = stack.pop()
+            rec = self._snap.get(d)
+            if rec is None:
+                continue
+            out.append(d)
+            stack.extend(os.path.join(d, n) for n in rec[1])
+        return out
+
+    # ---------- 轮询 ---------- #
+    def _emit(self, event):
+        _m_events.inc()
+        try:
+            self.handler.dispatch(event)
+        except Exception as e:
+            error(f_name, "dispatch", e)
+
+    def _throttle(self):
+        # 本轮 CPU 时间超出预算时让出
+        if self.cpu_budget <= 0 or self.cpu_budget >= 1:
+            return
+        wall = time.monotonic() - self._t0
+        cpu = time.thread_time() - self._cpu0
+        excess = cpu / self.cpu_budget - wall
+        if excess > 0.01:
+            _m_throttled.inc(int(excess * 1000))
+            self._halt.wait(excess)
+
+    def poll_once(self, full: bool = False):
+        """轮询一轮：对比快照并产生事件"""
+        snap = self._snap
+        added: List[Tuple[str, Tuple]] = []
+        removed: List[Tuple[str, Tuple]] = []
+        modified: List[str] = []
+
+        stack = [self.root]
+        while stack and not self._halt.is_set():
+            d = stack.pop()
+            rec = snap.get(d)
+            try:
+                mtime_ns = os.stat(d).st_mtime_ns
+            except OSError:
+                continue        # 目录已消失：由父目录的对比处理
+            _m_stat.inc()
+            if rec is not None and rec[0] == mtime_ns and not full:
+                stack.extend(os.path.join(d, n) for n in rec[1])
+                continue
+
+            new = self._list(d)
+            if new is None:
+                continue
+            old = _unpack(rec[2], rec[3]) if rec else {}
+            for name, e in new.items():
+                p = os.path.join(d, name)
+                o = old.get(name)
+                if o is None:
+                    added.append((p, e))
+                elif o[3] != e[3] or (o[0] and e[0] and o[0] != e[0]):
+                    removed.append((p, o))      # 同名但已是另一个条目
+                    added.append((p, e))
+                elif e[3] == 0 and (o[1] != e[1] or o[2] != e[2]):
+                    modified.append(p)
+            for name, o in old.items():
+                if name not in new:
+                    removed.append((os.path.join(d, name), o))
+            self._record(d, mtime_ns, new)
+            # 新出现的目录在配对移动之后处理
+            stack.extend(p for p in (os.path.join(d, n) for n, e in new.items() if e[3] == 1) if p in snap)
+            self._throttle()
+
+        # 按 inode 把 消失 + 新增 配对为移动
+        by_ino: Dict[Tuple[int, int], List[str]] = {}
+        for p, o in removed:
+            if o[0]:
+                by_ino.setdefault((o[0], o[3]), []).append(p)
+        moved_src = set()
+        for p, e in added:
+            srcs = by_ino.get((e[0], e[3])) if e[0] else None
+            if srcs:
+                src = srcs.pop()
+                moved_src.add(src)
+                self._move(src, p, e)
+            elif e[3] == 1:
+                self._emit(DirCreatedEvent(p))
+                self._add_tree(p, emit=True)
+            else:
+                self._emit(DirCreatedEvent(p) if e[3] else FileCreatedEvent(p))
+        for p, o in removed:
+            if p in moved_src:
+                continue
+            if o[3] == 1:
+                for d in reversed(self._subtree_dirs(p)):
+                    rec = snap.pop(d)
+                    for name, e in _unpack(rec[2], rec[3]).items():
+                        if e[3] != 1:
+                            self._emit(DirDeletedEvent(os.path.join(d, name)) if e[3]
+                                       else FileDeletedEvent(os.path.join(d, name)))
+                    if d != p:
+                        self._emit(DirDeletedEvent(d))
+                self._dirty = True
+            self._emit(DirDeletedEvent(p) if o[3] else FileDeletedEvent(p))
+        for p in modified:
+            self._emit(FileModifiedEvent(p))
+
+    def _move(self, src: str, dst: str, e: Tuple):
+        if e[3] != 1:
+            self._emit(DirMovedEvent(src, dst) if e[3] else FileMovedEvent(src, dst))
+            return
+        # 目录移动：快照中的子树改到新前缀下，下一轮再对比其内容
+        for d in self._subtree_dirs(src):
+            rec = self._snap.pop(d)
+            nd = dst + d[len(src):]
+            self._snap[nd] = (-1, rec[1], rec[2], rec[3]) if d == src else rec
+        self._dirty = True
+        self._emit(DirMovedEvent(src, dst))
+
+    def run(self):
+        if not self._load():
+            # 首次：建立快照，不产生事件（此前的差异由启动时的对账处理）
+            self._t0, self._cpu0 = time.monotonic(), time.thread_time()
+            self._add_tree(self.root, emit=False)
+            self._save()
+        _m_dirs.set(len(self._snap))
+
+        cycle = 0
+        while not self._halt.wait(self.interval):
+            cycle += 1
+            full = self._force_full or (self.full_every > 0 and cycle % self.full_every == 0)
+            self._force_full = False
+            self._t0, self._cpu0 = time.monotonic(), time.thread_time()
+            try:
+                self.poll_once(full)
+                if self._dirty:
+                    self._save()
+            except Exception as e:
+                error(f_name, "poll_once", e)
+            _m_cycle.observe((time.monotonic() - self._t0) * 1000)
+            _m_cpu.observe((time.thread_time() - self._cpu0) * 1000)
+            _m_dirs.set(len(self._snap))
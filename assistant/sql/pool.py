@@ -0,0 +1,201 @@
+import sqlite3, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from data.meta_data import get_option
+from sql import metrics
+
+# SQLite 连接池
+# DBTools() 不再每次新开连接、设置 pragma、执行建表脚本，而是从这里借出连接，close() 时归还：
+# - 连接优先借给上次使用它的线程（预编译语句缓存仍然有效），同一时刻只被一个借用者使用
+# - 每个连接打开时设置一次 pragma；建表检查（init）每个数据库文件每进程只执行一次
+# - set_pragmas() 设置的 pragma（维护线程按库大小调整的 cache_size/mmap_size）在连接下次借出时补执行
+# - 同时借出的连接数超过 POOL_MAX_CONNECTIONS 时等待归还，最多等 POOL_WAIT_SECONDS 秒，
+#   超时则临时多开一个（不会因为嵌套借用而死锁），空闲连接最多保留 POOL_MAX_IDLE 个
+# 借出次数、等待时间等见 stats() 与 sql/metrics.py 中的 pool.* 指标
+
+f_name = "pool.py"
+
+_m_checkouts = metrics.counter("pool.checkouts")
+_m_reused = metrics.counter("pool.reused")
+_m_opened = metrics.counter("pool.opened")
+_m_overflow = metrics.counter("pool.overflow")
+_m_rollback = metrics.counter("pool.rollback_on_release")
+_m_wait = metrics.histogram("pool.wait_ms")
+_m_in_use = metrics.gauge("pool.in_use")
+_m_idle = metrics.gauge("pool.idle")
+
+
+class ConnectionPool:
+    """
+    path:  数据库文件
+    init:  第一个连接打开后执行一次的初始化（建表检查），参数为该连接
+    其余参数默认读取配置 POOL_MAX_CONNECTIONS / POOL_MAX_IDLE / POOL_CACHED_STATEMENTS / POOL_WAIT_SECONDS
+    """
+
+    def __init__(self, path: str, init: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 max_connections: Optional[int] = None, max_idle: Optional[int] = None,
+                 cached_statements: Optional[int] = None, wait_seconds: Optional[float] = None):
+        self.path = path
+        self.init = init
+        self.max_connections = int(max_connections or get_option("POOL_MAX_CONNECTIONS"))
+        self.max_idle = int(max_idle if max_idle is not None else get_option("POOL_MAX_IDLE"))
+        self.cached_statements = int(cached_statements or get_option("POOL_CACHED_STATEMENTS"))
+        self.wait_seconds = float(wait_seconds if wait_seconds is not None else get_option("POOL_WAIT_SECONDS"))
+        self._idle: List[Tuple[int, sqlite3.Connection]] = []    # (上次使用的线程 id, 连接)
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._pragmas: Dict[str, int] = {}     # set_pragmas() 设置的 pragma
+        self._pragma_ver = 0
+        self._conn_ver: Dict[int, int] = {}    # id(连接) -> 已执行到的 pragma 版本
+        self._stats = {"checkouts": 0, "reused": 0, "opened": 0, "overflow": 0, "waited": 0,
+                       "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False：连接可以被不同线程先后借用，但同一时刻只有一个借用者
+        conn = sqlite3.connect(self.path, cached_statements=self.cached_statements, check_same_thread=False)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")      # 只对尚未建表的新库生效，旧库见 sql/maintenance.py
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    if self.init is not None:
+                        self.init(conn)
+                    self._ready = True
+        self._conn_ver.pop(id(conn), None)      # id 可能与已关闭的连接重复
+        return conn
+
+    def set_pragmas(self, pragmas: Dict[str, int]):
+        """设置各连接的 pragma（如 cache_size/mmap_size）：空闲连接在下次借出时执行，借出中的在下次借出时执行"""
+        with self._cond:
+            self._pragmas.update(pragmas)
+            self._pragma_ver += 1
+
+    def configure(self, conn: sqlite3.Connection):
+        """补执行 set_pragmas() 之后尚未执行的 pragma；借出时自动调用，长期持有连接的写线程每批调用一次"""
+        ver = self._pragma_ver
+        if self._conn_ver.get(id(conn), 0) == ver:
+            return
+        with self._cond:
+            pragmas = dict(self._pragmas)
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name}={int(value)}")
+        self._conn_ver[id(conn)] = ver
+
+    def checkout(self) -> sqlite3.Connection:
+        t0 = time.perf_counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    # 优先取本线程上次归还的连接，没有则取最近归还的
+                    i = next((k for k in range(len(self._idle) - 1, -1, -1) if self._idle[k][0] == me),
+                             len(self._idle) - 1)
+                    conn = self._idle.pop(i)[1]
+                    self._stats["reused"] += 1
+                    _m_reused.inc()
+                    break
+                if self._open < self.max_connections:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._open += 1
+                    self._stats["overflow"] += 1
+                    _m_overflow.inc()
+                    break
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            _m_in_use.set(self._in_use)
+            _m_idle.set(len(self._idle))
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            self._stats["opened"] += 1
+            _m_opened.inc()
+
+        ms = (time.perf_counter() - t0) * 1000
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["waited"] += waited
+            self._stats["wait_ms_total"] += ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], ms)
+        _m_checkouts.inc()
+        _m_wait.observe(ms)
+        self.configure(conn)
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """归还连接；未提交的事务回滚，不带入下一个借用者"""
+        try:
+            if conn.in_transaction:
+                _m_rollback.inc()
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append((threading.get_ident(), conn))
+                conn = None
+            else:
+                self._open -= 1
+            _m_in_use.set(self._in_use)
+            _m_idle.set(len(self._idle))
+            self._cond.notify()
+        if conn is not None:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """with pool.connection() as conn: 借出连接，离开时归还（只在用到时短暂借用）"""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._cond:
+            self._in_use -= 1
+            self._open -= 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """关闭全部空闲连接（借出中的连接归还时照常处理）"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            _m_idle.set(0)
+        for _, conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """{'checkouts','reused','opened','overflow','waited','wait_ms_avg','wait_ms_max','open','in_use','idle'}"""
+        with self._cond:
+            s = dict(self._stats)
+            n = s.pop("wait_ms_total")
+            s["wait_ms_avg"] = round(n / s["checkouts"], 3) if s["checkouts"] else 0.0
+            s["wait_ms_max"] = round(s["wait_ms_max"], 3)
+            s.update(open=self._open, in_use=self._in_use, idle=len(self._idle))
+            return s
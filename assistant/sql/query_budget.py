@@ -0,0 +1,127 @@
+import re, time, sqlite3, threading
+from contextlib import contextmanager
+from typing import List, Optional
+from data.meta_data import get_option
+from sql import metrics
+
+# 模型生成 SQL 的执行预算
+# - QueryBudget: 执行期间在连接上挂 set_progress_handler，每 QUERY_CHECK_EVERY 条 VM 指令检查一次：
+#   超过 QUERY_TIMEOUT_SECONDS（墙钟时间）、超过 QUERY_MAX_STEPS（VM 指令数）或被界面 cancel() 时中止当前语句，
+#   抛出 QueryAborted；语句结束后卸下处理器（连接来自连接池，不能把处理器留给下一个借用者）
+# - check_plan: 执行前 EXPLAIN QUERY PLAN，files 较大时找出不走索引的全表扫描
+# 结果记入 sql/metrics.py 中的 query.* 指标
+
+f_name = "query_budget.py"
+
+OUTCOMES = ("ok", "timeout", "steps", "cancelled", "error")
+
+_m_outcome = {k: metrics.counter(f"query.{k}") for k in OUTCOMES}
+_m_ms = metrics.histogram("query.ms")
+_m_steps = metrics.histogram("query.vm_steps", (1e4, 1e5, 1e6, 1e7, 1e8, 1e9))
+_m_full_scan = metrics.counter("query.full_scan")
+_m_blocked = metrics.counter("query.blocked")
+
+# EXPLAIN QUERY PLAN 中不走任何索引的全表扫描：恰好是 "SCAN <表或别名>"
+# 不计：USING [COVERING] INDEX（按索引顺序走，常配合 LIMIT 提前结束）、全文索引（VIRTUAL TABLE）、
+# 子查询结果（SCAN (subquery-1)）、CONSTANT ROW
+_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW$)\w+$")
+
+
+class QueryAborted(Exception):
+    """查询因预算中止；reason 为 timeout / steps / cancelled"""
+
+    def __init__(self, reason: str, seconds: float, steps: int):
+        self.reason = reason
+        self.seconds = seconds
+        self.steps = steps
+        super().__init__(f"query aborted: {reason} after {seconds:.1f}s, {steps} VM steps")
+
+
+class QueryBudget:
+    """
+    seconds:     每次执行（执行语句 / 取一页 / 计数各算一次）的墙钟时间上限，默认读取配置 QUERY_TIMEOUT_SECONDS（0 为不限）
+    steps:       每次执行的 VM 指令数上限，默认读取配置 QUERY_MAX_STEPS（0 为不限）
+    check_every: 每多少条 VM 指令检查一次，默认读取配置 QUERY_CHECK_EVERY
+    cancel() 可从任意线程调用，之后该预算上的执行（包括正在进行的）都会中止
+    """
+
+    def __init__(self, seconds: Optional[float] = None, steps: Optional[int] = None,
+                 check_every: Optional[int] = None):
+        self.seconds = float(seconds if seconds is not None else get_option("QUERY_TIMEOUT_SECONDS"))
+        self.max_steps = int(steps if steps is not None else get_option("QUERY_MAX_STEPS"))
+        self.check_every = max(1, int(check_every or get_option("QUERY_CHECK_EVERY")))
+        self._cancel = threading.Event()
+        self._deadline = None
+        self.steps = 0              # 最近一次执行的 VM 指令数（按检查间隔计）
+        self.reason = None          # 最近一次执行的中止原因
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _tick(self) -> int:
+        # 返回非 0 时 SQLite 中止当前语句（sqlite3.OperationalError: interrupted）
+        self.steps += self.check_every
+        if self._cancel.is_set():
+            self.reason = "cancelled"
+        elif self._deadline is not None and time.monotonic() > self._deadline:
+            self.reason = "timeout"
+        elif self.max_steps and self.steps > self.max_steps:
+            self.reason = "steps"
+        return 1 if self.reason else 0
+
+    @contextmanager
+    def guard(self, conn: sqlite3.Connection):
+        """在 conn 上按预算执行：with budget.guard(conn): cur.execute(...)"""
+        self.steps = 0
+        self.reason = "cancelled" if self._cancel.is_set() else None
+        if self.reason:
+            _m_outcome["cancelled"].inc()
+            raise QueryAborted("cancelled", 0.0, 0)
+        t0 = time.monotonic()
+        self._deadline = t0 + self.seconds if self.seconds > 0 else None
+        conn.set_progress_handler(self._tick, self.check_every)
+        outcome = "ok"
+        try:
+            yield self
+        except sqlite3.OperationalError as e:
+            if self.reason:
+                outcome = self.reason
+                raise QueryAborted(self.reason, time.monotonic() - t0, self.steps) from e
+            outcome = "error"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            _m_outcome[outcome].inc()
+            _m_ms.observe((time.monotonic() - t0) * 1000)
+            _m_steps.observe(self.steps)
+
+
+def check_plan(conn: sqlite3.Connection, sql: str, min_rows: Optional[int] = None) -> List[str]:
+    """
+    EXPLAIN QUERY PLAN 预检：files 的行数（按 max(id) 估计）不少于 min_rows（默认读取配置 QUERY_SCAN_WARN_ROWS）时，
+    返回计划中不走索引的全表扫描（如 ['SCAN files']），否则返回空列表
+    """
+    min_rows = int(min_rows if min_rows is not None else get_option("QUERY_SCAN_WARN_ROWS"))
+    n = conn.execute("SELECT max(id) FROM files").fetchone()[0] or 0
+    if n < min_rows:
+        return []
+    sql = sql.replace("\\\\", "\\").strip().rstrip(";")
+    scans = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql) if _SCAN.match(row[3])]
+    if scans:
+        _m_full_scan.inc()
+    return scans
+
+
+def full_scan_policy(scans: List[str]) -> bool:
+    """按配置 QUERY_FULL_SCAN（warn / block）决定是否允许执行有全表扫描的查询"""
+    if scans and get_option("QUERY_FULL_SCAN") == "block":
+        _m_blocked.inc()
+        return False
+    return True
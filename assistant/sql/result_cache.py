@@ -0,0 +1,142 @@
+import re, sys, threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from data.meta_data import get_option
+from sql import generation, metrics
+
+# 查询结果缓存（custom_instruction 与 ResultPager 的第一页 + 总行数）
+# - 键：规范化后的 SQL（字符串字面量外的空白合并、转小写、去掉分号）+ 调用方的附加项（如数据库文件、页大小）
+# - 失效：条目记下查询开始前的索引代数（sql/generation.py），取用时代数已变化即丢弃
+# - 容量：按结果估算的字节数做 LRU，总量不超过 CACHE_MAX_BYTES，单条超过 CACHE_MAX_ENTRY_BYTES 的结果不缓存
+# 命中率等见 stats() 与 sql/metrics.py 中的 cache.* 指标
+
+f_name = "result_cache.py"
+
+_m_hits = metrics.counter("cache.hits")
+_m_misses = metrics.counter("cache.misses")
+_m_stale = metrics.counter("cache.stale")
+_m_evictions = metrics.counter("cache.evictions")
+_m_too_big = metrics.counter("cache.too_big")
+_m_bytes = metrics.gauge("cache.bytes")
+_m_entries = metrics.gauge("cache.entries")
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    字符串字面量外：空白合并为一个空格、去掉括号/逗号/比较符两侧空白、转小写；去掉末尾分号
+    （- * / 两侧的空白保留：去掉后 "a - -1" 会变成注释 "a--1"）
+    """
+    sql = sql.replace("\\\\", "\\").strip().rstrip(";").strip()
+    parts = _LITERAL.split(sql)
+    for i in range(0, len(parts), 2):
+        s = re.sub(r"\s+", " ", parts[i].lower())
+        parts[i] = re.sub(r" ?([(),=<>!]) ?", r"\1", s)
+    return "".join(parts).strip()
+
+
+def sizeof(value: Any, limit: int = sys.maxsize) -> int:
+    """估算结果占用的字节数（行的列表 / 元组 / 标量），超过 limit 即停止累加"""
+    if isinstance(value, (list, tuple)):
+        n = sys.getsizeof(value)
+        for v in value:
+            n += sizeof(v, limit)
+            if n > limit:
+                break
+        return n
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    max_bytes:       总容量，默认读取配置 CACHE_MAX_BYTES（0 为关闭缓存）
+    max_entry_bytes: 单条上限，默认读取配置 CACHE_MAX_ENTRY_BYTES
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = int(max_bytes if max_bytes is not None else get_option("CACHE_MAX_BYTES"))
+        self.max_entry_bytes = int(max_entry_bytes or get_option("CACHE_MAX_ENTRY_BYTES"))
+        self._entries: "OrderedDict[Hashable, Tuple[int, int, Any]]" = OrderedDict()    # 键 -> (代数, 字节, 结果)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "too_big": 0}
+
+    @staticmethod
+    def key(sql: str, *extra) -> Hashable:
+        return (normalize_sql(sql),) + extra
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """命中且代数未变时返回结果，否则 None"""
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None and e[0] != generation.current():
+                self._drop(key)
+                self._stats["stale"] += 1
+                _m_stale.inc()
+                e = None
+            if e is None:
+                self._stats["misses"] += 1
+                _m_misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            _m_hits.inc()
+            return e[2]
+
+    def put(self, key: Hashable, value: Any, gen: int):
+        """gen: 查询开始前取得的 generation.current()；期间有提交时不缓存（结果可能已过期）"""
+        if self.max_bytes <= 0 or gen != generation.current():
+            return
+        size = sizeof(value, self.max_entry_bytes)
+        with self._lock:
+            if size > self.max_entry_bytes or size > self.max_bytes:
+                self._stats["too_big"] += 1
+                _m_too_big.inc()
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (gen, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+                _m_evictions.inc()
+            _m_bytes.set(self._bytes)
+            _m_entries.set(len(self._entries))
+
+    def _drop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        _m_bytes.set(self._bytes)
+        _m_entries.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            _m_bytes.set(0)
+            _m_entries.set(0)
+
+    def stats(self) -> Dict:
+        """{'hits','misses','stale','evictions','too_big','hit_rate','entries','bytes'}"""
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s["hits"] + s["misses"]
+            s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+            s.update(entries=len(self._entries), bytes=self._bytes)
+            return s
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    """进程内唯一的查询结果缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
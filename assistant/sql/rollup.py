@@ -0,0 +1,195 @@
+import re, time
+from sql import metrics
+
+# 目录汇总（递归）：每个目录子树内的文件数、目录数、总大小，以及按扩展名的文件数/大小
+# “哪个文件夹最大”“X 下有多少 PDF” 由递归 LIKE + SUM 全表扫描变成按主键查一行
+#
+# 增量维护：
+# - files 上的触发器把每一行的变化折算成对其父目录的增量，记入 dir_delta（只记直接父目录，O(1)）
+#   文件: (父目录, ext, ±1 个文件, ±size)；目录: 把自身已汇总的数值整体挪到新父目录下（移动/删除目录不必遍历子树）
+# - 提交前 flush()（DBTools._commit() 与写线程每批各一次）按 parent_id 把增量沿祖先链向上累加，清空 dir_delta
+# - 子树改名只改 path/depth，不触发；内容哈希、备注的改写也不触发
+# - 全量重建（sync_rebuild）与旧库首次建表时 recompute() 从 files 重新汇总
+# 触发器里不能用 WITH RECURSIVE，所以祖先链的展开放在 flush() 里做
+# suffix: 全量重建时在 files_new 旁边预建一套 dir_stats_new 等（表名、触发器名加后缀，不建索引），换表时改名
+
+f_name = "rollup.py"
+
+_m_flush_ms = metrics.histogram("rollup.flush_ms")
+_m_dirs = metrics.counter("rollup.dirs")        # flush 更新的目录（含祖先）行数
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS dir_stats (
+      dir_id INTEGER PRIMARY KEY,           -- 目录记录的 files.id
+      files  INTEGER NOT NULL DEFAULT 0,    -- 子树内的文件数（递归）
+      dirs   INTEGER NOT NULL DEFAULT 0,    -- 子树内的目录数（递归，不含自身）
+      size   INTEGER NOT NULL DEFAULT 0     -- 子树内文件的总大小（字节）
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_dir_stats_size  ON dir_stats(size)",
+    "CREATE INDEX IF NOT EXISTS idx_dir_stats_files ON dir_stats(files)",
+    """
+    CREATE TABLE IF NOT EXISTS dir_ext_stats (
+      dir_id INTEGER NOT NULL,              -- 目录记录的 files.id
+      ext    TEXT NOT NULL,                 -- 扩展名（含点；无扩展名为 ''）
+      files  INTEGER NOT NULL,              -- 子树内该扩展名的文件数
+      size   INTEGER NOT NULL,              -- 子树内该扩展名文件的总大小
+      PRIMARY KEY (dir_id, ext)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dir_delta (
+      dir_id INTEGER NOT NULL,              -- 增量记在这个目录上（flush 时再加到它的祖先）
+      ext    TEXT,                          -- NULL 为目录数增量
+      files  INTEGER NOT NULL,
+      dirs   INTEGER NOT NULL,
+      size   INTEGER NOT NULL
+    )
+    """,
+]
+
+# 一行在父目录上的贡献：{sign} 为 +/-，{r} 为 new/old
+_CONTRIB = """
+  INSERT INTO dir_delta SELECT {r}.parent_id, coalesce({r}.ext, ''), {sign}1, 0, {sign}coalesce({r}.size, 0)
+    WHERE {r}.deleted = 0 AND {r}.parent_id IS NOT NULL;
+  INSERT INTO dir_delta SELECT {r}.parent_id, ext, {sign}files, 0, {sign}size FROM dir_ext_stats
+    WHERE dir_id = {r}.id AND {r}.deleted = 1 AND {r}.parent_id IS NOT NULL;
+  INSERT INTO dir_delta SELECT {r}.parent_id, NULL, 0, {sign}(1 + coalesce((SELECT dirs FROM dir_stats WHERE dir_id = {r}.id), 0)), 0
+    WHERE {r}.deleted = 1 AND {r}.parent_id IS NOT NULL;
+"""
+
+_ADD = _CONTRIB.format(sign="+", r="new")
+_SUB = _CONTRIB.format(sign="-", r="old")
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_ai AFTER INSERT ON files BEGIN
+      INSERT OR IGNORE INTO dir_stats(dir_id) SELECT new.id WHERE new.deleted = 1;
+      {_ADD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_ad AFTER DELETE ON files BEGIN
+      {_SUB}
+      DELETE FROM dir_stats WHERE dir_id = old.id;
+      DELETE FROM dir_ext_stats WHERE dir_id = old.id;
+    END
+    """,
+    # 先按旧值撤出、再按新值计入；目录变文件时丢弃它的汇总，文件变目录时从零开始
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_au AFTER UPDATE OF size, ext, deleted, parent_id ON files
+    WHEN old.size IS NOT new.size OR old.ext IS NOT new.ext
+      OR old.deleted IS NOT new.deleted OR old.parent_id IS NOT new.parent_id BEGIN
+      {_SUB}
+      DELETE FROM dir_stats WHERE dir_id = old.id AND new.deleted = 0;
+      DELETE FROM dir_ext_stats WHERE dir_id = old.id AND new.deleted = 0;
+      INSERT OR IGNORE INTO dir_stats(dir_id) SELECT new.id WHERE new.deleted = 1;
+      {_ADD}
+    END
+    """,
+]
+
+def _named(sql: str, suffix: str) -> str:
+    """表名与触发器名加后缀（files 也是列名，只替换 ON/FROM/JOIN 之后的）"""
+    if not suffix:
+        return sql
+    sql = re.sub(r"\b(dir_stats|dir_ext_stats|dir_delta|trg_rollup_a[iud])\b", rf"\1{suffix}", sql)
+    return re.sub(r"\b(ON|FROM|JOIN)\s+files\b", rf"\1 files{suffix}", sql)
+
+
+# 增量 → 目录及其全部祖先（祖先必须仍是库中的目录；已删除目录上的增量随之丢弃）
+_EXPAND = """
+INSERT INTO temp.dir_up
+WITH RECURSIVE anc(src, dir_id) AS (
+  SELECT DISTINCT d.dir_id, d.dir_id FROM temp.dir_agg d JOIN files f ON f.id = d.dir_id WHERE f.deleted = 1
+  UNION
+  SELECT anc.src, f.parent_id FROM anc
+  JOIN files f ON f.id = anc.dir_id
+  JOIN files p ON p.id = f.parent_id
+  WHERE p.deleted = 1
+)
+SELECT anc.dir_id, d.ext, sum(d.files), sum(d.dirs), sum(d.size)
+FROM anc JOIN temp.dir_agg d ON d.dir_id = anc.src
+GROUP BY anc.dir_id, d.ext
+"""
+
+
+def ensure(cur, suffix: str = "") -> bool:
+    """建汇总表与触发器（逐条执行，不提交）；dir_stats 是新建的返回 True（需要 recompute）"""
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"dir_stats{suffix}",)).fetchone()
+    for stmt in DDL + TRIGGERS:
+        if suffix and "CREATE INDEX" in stmt:
+            continue        # 索引名不能重复，换表改名后由 ensure(cur) 再建
+        cur.execute(_named(stmt, suffix))
+    return not exists
+
+
+def flush(cur, suffix: str = "") -> int:
+    """把 dir_delta 中的增量累加到各目录及其祖先（不提交，在调用方的事务内），返回更新的目录行数"""
+    if cur.execute(_named("SELECT 1 FROM dir_delta LIMIT 1", suffix)).fetchone() is None:
+        return 0
+    t0 = time.perf_counter()
+    cur.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS dir_up(
+      dir_id INTEGER, ext TEXT, files INTEGER, dirs INTEGER, size INTEGER
+    )
+    """)
+    cur.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS dir_agg(
+      dir_id INTEGER, ext TEXT, files INTEGER, dirs INTEGER, size INTEGER
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS temp.idx_dir_agg ON dir_agg(dir_id)")
+    cur.execute("DELETE FROM temp.dir_up")
+    cur.execute("DELETE FROM temp.dir_agg")
+    # 同一目录、同一扩展名的增量先合并（批量写入时多数增量落在少数目录上）
+    cur.execute(_named("""
+    INSERT INTO temp.dir_agg
+    SELECT dir_id, ext, sum(files), sum(dirs), sum(size) FROM dir_delta GROUP BY dir_id, ext
+    """, suffix))
+    cur.execute(_named(_EXPAND, suffix))
+    cur.execute(_named("""
+    INSERT INTO dir_stats(dir_id, files, dirs, size)
+    SELECT dir_id, sum(files), sum(dirs), sum(size) FROM temp.dir_up WHERE true GROUP BY dir_id
+    ON CONFLICT(dir_id) DO UPDATE SET
+      files = files + excluded.files, dirs = dirs + excluded.dirs, size = size + excluded.size
+    """, suffix))
+    n = cur.rowcount
+    cur.execute(_named("""
+    INSERT INTO dir_ext_stats(dir_id, ext, files, size)
+    SELECT dir_id, ext, files, size FROM temp.dir_up WHERE ext IS NOT NULL
+    ON CONFLICT(dir_id, ext) DO UPDATE SET files = files + excluded.files, size = size + excluded.size
+    """, suffix))
+    cur.execute(_named("""
+    DELETE FROM dir_ext_stats
+    WHERE files = 0 AND dir_id IN (SELECT dir_id FROM temp.dir_up WHERE ext IS NOT NULL)
+    """, suffix))
+    cur.execute(_named("DELETE FROM dir_delta", suffix))
+    cur.execute("DELETE FROM temp.dir_up")
+    cur.execute("DELETE FROM temp.dir_agg")
+    _m_dirs.inc(n)
+    _m_flush_ms.observe((time.perf_counter() - t0) * 1000)
+    return n
+
+
+def recompute(cur, suffix: str = "") -> int:
+    """从 files 重新汇总全部目录（不提交），返回目录数"""
+    cur.execute(_named("DELETE FROM dir_delta", suffix))
+    cur.execute(_named("DELETE FROM dir_stats", suffix))
+    cur.execute(_named("DELETE FROM dir_ext_stats", suffix))
+    cur.execute(_named("INSERT INTO dir_stats(dir_id) SELECT id FROM files WHERE deleted = 1", suffix))
+    n = cur.rowcount
+    # 每个目录的直接子项先按 (父目录, 扩展名) 聚合，再由 flush 沿祖先链累加
+    cur.execute(_named("""
+    INSERT INTO dir_delta
+    SELECT parent_id, coalesce(ext, ''), count(*), 0, coalesce(sum(size), 0)
+    FROM files WHERE deleted = 0 AND parent_id IS NOT NULL GROUP BY parent_id, coalesce(ext, '')
+    """, suffix))
+    cur.execute(_named("""
+    INSERT INTO dir_delta
+    SELECT parent_id, NULL, 0, count(*), 0
+    FROM files WHERE deleted = 1 AND parent_id IS NOT NULL GROUP BY parent_id
+    """, suffix))
+    flush(cur, suffix)
+    return n
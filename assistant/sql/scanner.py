@@ -0,0 +1,133 @@
+import os, time, pickle
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from typing import Callable, Iterator, List, Optional, Tuple
+from core.error_handler import error
+from data.meta_data import get_option
+
+# 目录树扫描器
+# 用 os.scandir 的 DirEntry 直接取 is_dir / stat（Windows 上 stat 随目录列表一起返回，
+# Linux 上每个条目只需一次 stat），不再对每个条目重复 stat/is_dir/resolve。
+# - 线程模式（默认）：每个目录的列举是一个任务，子目录不断分发到线程池
+# - 进程模式（可选，适合网络盘/慢盘）：根目录在本进程列举，每个顶层子目录交给一个进程串行遍历
+#   进程模式下 should_ignore 必须可 pickle：模块级函数，或 IgnoreMatcher 的绑定方法（如 root.matcher.ignored）；
+#   WatchRoot.should_ignore 带着锁与 Observer，不能 pickle。scan_tree 在调用时（而非首次迭代时）就检查并抛出 TypeError
+# 产出的行与 sync_rebuild._file_meta 相同：
+# (path, name, case_key, ext, size, mtime, ctime, deleted(1=目录), updated_at, note)
+# 父目录的行总是先于其子项产出。
+
+f_name = "scanner.py"
+
+
+def stat_row(path: str, name: str, st: os.stat_result, is_dir: bool) -> Tuple:
+    """由已有的 stat 结果构造 files 行，不再额外发起系统调用"""
+    dot = name.rfind(".")
+    ext = name[dot:].lower() if 0 < dot < len(name) - 1 else ""      # 与 Path.suffix 一致，小写（同 cracker）
+    return (
+        path, name, name.lower(),
+        "" if is_dir else ext,
+        0 if is_dir else int(st.st_size),
+        int(st.st_mtime),
+        int(st.st_ctime),
+        1 if is_dir else 0,
+        int(time.time()),
+        "",
+    )
+
+
+def list_dir(path: str, should_ignore: Callable[[str], bool]) -> Tuple[List[Tuple], List[str]]:
+    """列举一个目录：返回 (该目录下未被忽略的行[目录在前], 需要继续深入的子目录)"""
+    dir_rows, file_rows, subdirs = [], [], []
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        error(f_name, "list_dir", e)
+        return dir_rows, subdirs
+    for entry in entries:
+        if should_ignore(entry.path):
+            continue
+        try:
+            is_dir = entry.is_dir()
+            st = entry.stat()
+        except OSError as e:
+            error(f_name, "list_dir.stat", e)
+            continue
+        if is_dir:
+            dir_rows.append(stat_row(entry.path, entry.name, st, True))
+            # 与 os.walk 默认行为一致：不跟随目录符号链接
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        else:
+            file_rows.append(stat_row(entry.path, entry.name, st, False))
+    dir_rows.extend(file_rows)
+    return dir_rows, subdirs
+
+
+def _scan_subtree(path: str, should_ignore: Callable[[str], bool]) -> List[Tuple]:
+    # 进程模式的任务：在子进程内串行遍历一个顶层目录
+    rows: List[Tuple] = []
+    stack = [path]
+    while stack:
+        r, subdirs = list_dir(stack.pop(), should_ignore)
+        rows.extend(r)
+        stack.extend(subdirs)
+    return rows
+
+
+def check_predicate(should_ignore: Callable[[str], bool], processes: Optional[bool] = None):
+    """进程模式（processes 默认读取配置 SCAN_PROCESSES）下 should_ignore 不能 pickle 时抛 TypeError"""
+    if not (get_option("SCAN_PROCESSES") if processes is None else processes):
+        return
+    try:
+        pickle.dumps(should_ignore)
+    except Exception as e:
+        raise TypeError(f"进程模式下 should_ignore 必须可 pickle（如 root.matcher.ignored）: {e}") from e
+
+
+def scan_tree(root: str, should_ignore: Callable[[str], bool],
+              workers: Optional[int] = None, processes: Optional[bool] = None) -> Iterator[Tuple]:
+    """
+    并行扫描 root，逐目录产出 files 行（返回生成器）
+    workers:   线程/进程数，默认读取配置 SCAN_WORKERS
+    processes: 是否使用进程池，默认读取配置 SCAN_PROCESSES；此时 should_ignore 不能 pickle 立即抛 TypeError
+    """
+    workers = int(workers or get_option("SCAN_WORKERS") or 8)
+    processes = bool(get_option("SCAN_PROCESSES") if processes is None else processes)
+    check_predicate(should_ignore, processes)
+    return _scan_tree(str(Path(root).resolve()), should_ignore, workers, processes)
+
+
+def _scan_tree(rootp: str, should_ignore: Callable[[str], bool], workers: int, processes: bool) -> Iterator[Tuple]:
+
+    # 根目录也可入库（目录项）
+    if not should_ignore(rootp):
+        try:
+            yield stat_row(rootp, os.path.basename(rootp) or rootp, os.stat(rootp), True)
+        except OSError as e:
+            error(f_name, "scan_tree.root", e)
+
+    if processes:
+        rows, subdirs = list_dir(rootp, should_ignore)
+        yield from rows
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_scan_subtree, d, should_ignore) for d in subdirs]
+            for fut in as_completed(futures):
+                yield from fut.result()
+        return
+
+    # 在途任务数有上限：消费端（如批量写库）慢时扫描随之放缓，内存不随目录树增长
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="scanner")
+    backlog = [rootp]           # 待列举的目录（栈，深度优先，积压只占路径字符串）
+    pending = set()
+    try:
+        while backlog or pending:
+            while backlog and len(pending) < workers * 2:
+                pending.add(pool.submit(list_dir, backlog.pop(), should_ignore))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rows, subdirs = fut.result()
+                backlog.extend(subdirs)
+                yield from rows
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
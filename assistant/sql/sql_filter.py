@@ -6,6 +6,10 @@ class Output(TypedDict):
     sql:str
     status:bool
 
+# 允许查询的表：files 与其全文索引 files_fts（子串检索用 MATCH），目录汇总 dir_stats / dir_ext_stats（只读），
+# 文件正文的全文索引 content_fts（按内容检索用 MATCH）
+TABLES = ("files", "files_fts", "dir_stats", "dir_ext_stats", "content_fts")
+
 # 黑名单
 BANNED = [
     " pragma ", " with ", " drop ", " truncate ", " delete ", " insert ",
@@ -24,10 +28,12 @@ def SQL_Filter(sql:str) -> Output:
 
     # 仅允许 select / update
     if s.lstrip().startswith("select"):
-        # 只允许 from files
-        if " from files " not in s:
+        # 只允许 from TABLES 中的表（含子查询中的）
+        bare = re.sub(r"'(?:[^']|'')*'", "''", s)      # 去掉字符串字面量，避免 note 里的 from 被误判
+        tables = re.findall(r"\b(?:from|join)\s+([a-z_][a-z0-9_]*)", bare)
+        if not tables or any(t not in TABLES for t in tables):
             return {"sql": text, "status": False}
-        if re.search(r"\bfrom\s+files\s*,", s):
+        if re.search(rf"\bfrom\s+(?:{'|'.join(TABLES)})\s*,", s):
             return {"sql": text, "status": False}
         return {"sql": text, "status": True}
 
@@ -63,10 +69,14 @@ def SQL_Filter(sql:str) -> Output:
     return {"sql": text, "status": False}
 
 # print(SQL_Filter("select path,size from files where ext='.py' and deleted=0;")   )          # ✅
-# print(SQL_Filter("select * from files join other on 1=1;")                                 )# ✅
 # print(SQL_Filter("update files set note='日志' where ext='.log' and deleted=0;")  )          # ✅
 # print(SQL_Filter("update files set note='a', name='x' where id=1;")              )          # ❌（多列）
 # print(SQL_Filter("update files set size=0 where id=1;")                          )          # ❌（非 note）
 # print(SQL_Filter("update other set note='a' where id=1;")                        )          # ❌（非 files）
 # print(SQL_Filter("update files set note='a';")                                   )          # ❌（无 WHERE）
-# print(SQL_Filter("update files set note='a' where id = 1;")                      )          # ✅
\ No newline at end of file
+# print(SQL_Filter("update files set note='a' where id = 1;")                      )          # ✅
+# print(SQL_Filter("select path from files where id in (select rowid from files_fts where name match '\"报告\"');"))  # ✅
+# print(SQL_Filter("select * from files_fts where files_fts match '\"abc\"';")      )          # ✅
+# print(SQL_Filter("select * from files join other on 1=1;")                       )          # ❌（其他表）
+# print(SQL_Filter("select size from dir_stats where dir_id = (select id from files where path = '/a');"))  # ✅
+# print(SQL_Filter("select * from dir_delta;")                                     )          # ❌（内部表）
\ No newline at end of file
@@ -1,8 +1,12 @@
-import os, time, sqlite3
+import os, re, stat, time, sqlite3
 from pathlib import Path
-from typing import Tuple, List, Dict, Callable
-from sql.db_tools import DBTools  # 你已有
+from itertools import islice
+from typing import Tuple, List, Dict, Callable, Iterator, Optional
+from sql.db_tools import DBTools, tree_pos, refresh_stats, create_indexes, ensure_fts, ensure_content, FTS_DDL, CONTENT_DDL  # 你已有
+from sql.scanner import scan_tree, stat_row, list_dir
 from core.error_handler import error
+from sql import generation, rollup
+from sql.writer import get_writer
 
 def _file_meta(p: Path) -> Tuple[str,str,str,str,int,int,int,int,int,str]:
     st = p.stat()
@@ -11,7 +15,7 @@ def _file_meta(p: Path) -> Tuple[str,str,str,str,int,int,int,int,int,str]:
         str(p.resolve()),       # path
         p.name,                 # name
         p.name.lower(),         # case_key
-        "" if is_dir else p.suffix,   # ext
+        "" if is_dir else p.suffix.lower(),   # ext（小写，同 cracker）
         0 if is_dir else int(st.st_size),    # size
         int(st.st_mtime),       # mtime
         int(st.st_ctime),       # ctime
@@ -21,35 +25,10 @@ def _file_meta(p: Path) -> Tuple[str,str,str,str,int,int,int,int,int,str]:
     )
 
 def scan_to_rows(root: str, should_ignore: Callable[[str], bool]) -> List[Tuple]:
-    rows: List[Tuple] = []
-    rootp = Path(root).resolve()
-    # 根目录也可入库（目录项）
-    if not should_ignore(str(rootp)):
-        rows.append(_file_meta(rootp))
-    for cur, dnames, fnames in os.walk(root):
-        # 过滤将要深入的目录，避免 node_modules/venv 巨树
-        dnames[:] = [d for d in dnames if not should_ignore(os.path.join(cur, d))]
-        # 目录项
-        for d in dnames:
-            dp = Path(cur, d)
-            if should_ignore(str(dp)):
-                continue
-            try:
-                rows.append(_file_meta(dp))
-            except Exception as e:
-                error("sync_rebuild.py", "scan_dir", e)
-        # 文件项
-        for f in fnames:
-            fp = Path(cur, f)
-            if should_ignore(str(fp)):
-                continue
-            try:
-                rows.append(_file_meta(fp))
-            except Exception as e:
-                error("sync_rebuild.py", "scan_file", e)
-    return rows
+    # 并行 scandir 扫描（见 sql/scanner.py），行格式与 _file_meta 相同
+    return list(scan_tree(root, should_ignore))
 
-# -------- 2) 重建：files_new → 迁移 note → 原子换表 --------
+# -------- 2) 重建：写事务之外建好 files_new → 迁移 note → 短暂持锁换表 --------
 DDL_FILES = """
 CREATE TABLE IF NOT EXISTS {tbl} (
   id         INTEGER PRIMARY KEY,
@@ -62,83 +41,596 @@ CREATE TABLE IF NOT EXISTS {tbl} (
   ctime      INTEGER,
   deleted    INTEGER DEFAULT 0,
   updated_at INTEGER NOT NULL,
-  note       TEXT
+  note       TEXT,
+  root_id    INTEGER,
+  content_hash TEXT,
+  hash_size  INTEGER,
+  hash_mtime INTEGER,
+  parent_id  INTEGER,
+  depth      INTEGER
 );
 """
 
-INDEXES = [
-    # ("idx_files_path", "CREATE UNIQUE INDEX IF NOT EXISTS idx_files_path ON {tbl}(path)"),
+REBUILD_CHUNK = 5000        # 每次 executemany 写入的行数
+PROGRESS_EVERY = 20         # 每写入多少个分块打印一次进度
+SHADOW_CHUNK = 50000        # 迁移 note/哈希、填充预建的索引与正文时，每个短事务处理的 id 区间
+
+# 重建期间 files / content_text 上的写入（监听器、哈希、正文抽取、备注……）记下 path，换表前在 files_new 上重放
+# 触发器名以 trg_rebuild_ 开头：重建中断时由建表检查删除（见 sql/db_tools.py）
+TOUCHED_DDL = [
+    "CREATE TABLE IF NOT EXISTS rebuild_touched (seq INTEGER PRIMARY KEY, path TEXT NOT NULL)",
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_rebuild_ai AFTER INSERT ON files BEGIN
+      INSERT INTO rebuild_touched(path) VALUES (new.path);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_rebuild_ad AFTER DELETE ON files BEGIN
+      INSERT INTO rebuild_touched(path) VALUES (old.path);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_rebuild_au AFTER UPDATE ON files BEGIN
+      INSERT INTO rebuild_touched(path) VALUES (old.path);
+      INSERT INTO rebuild_touched(path) SELECT new.path WHERE new.path IS NOT old.path;
+    END
+    """,
+]
+TOUCHED_CONTENT_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_rebuild_content_ai AFTER INSERT ON content_text BEGIN
+      INSERT INTO rebuild_touched(path) SELECT path FROM files WHERE id = new.file_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_rebuild_content_au AFTER UPDATE ON content_text BEGIN
+      INSERT INTO rebuild_touched(path) SELECT path FROM files WHERE id = new.file_id;
+    END
+    """,
+]
+
+# 预建在 files_new 旁、换表时改名就位的全文索引与正文表
+# content= 仍写 files / content_text（改名不会改写它，换表后即是它们）；同步触发器建在 *_new 上，换表前删除
+SHADOW_FTS = [re.sub(r"\bON files\b", "ON files_new", s.replace("files_fts", "files_fts_new")) for s in FTS_DDL]
+SHADOW_CONTENT = [CONTENT_DDL[0].replace("content_text", "content_text_new"),
+                  CONTENT_DDL[1].replace("content_fts", "content_fts_new")] + [
+    s.replace("content_fts", "content_fts_new").replace("ON content_text", "ON content_text_new")
+    for s in CONTENT_DDL[2:5]
 ]
+SHADOW_TABLES = ("files_fts_new", "content_fts_new", "content_text_new",
+                 "dir_stats_new", "dir_ext_stats_new", "dir_delta_new", "files_new", "rebuild_touched")
+
+# 以 path 为连接键一次迁移旧表的 note 与内容哈希（两边 path 都有唯一索引；哈希是否过期由 hash_size/hash_mtime 判断）
+MIGRATE = """
+UPDATE files_new SET note = COALESCE(old.note, files_new.note),
+  content_hash = old.content_hash, hash_size = old.hash_size, hash_mtime = old.hash_mtime
+FROM files AS old WHERE old.path = files_new.path AND {where}
+"""
+
+# 正文按 path 迁移到新 id（不重新读文件）；冲突时改写，由 content_text_new 上的触发器同步 content_fts_new
+COPY_CONTENT = """
+INSERT INTO content_text_new(file_id, size, mtime, encoding, text)
+SELECT n.id, c.size, c.mtime, c.encoding, c.text
+FROM files_new n JOIN files o ON o.path = n.path JOIN content_text c ON c.file_id = o.id
+WHERE {where}
+ON CONFLICT(file_id) DO UPDATE SET
+  size = excluded.size, mtime = excluded.mtime, encoding = excluded.encoding, text = excluded.text
+"""
+
+# 其他根目录的一条记录照 files 复制到 files_new（已有则改写，id 不变），参数：父目录路径, path, 重建的 root_id
+MIRROR_ROW = """
+INSERT INTO files_new
+(path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,
+ content_hash,hash_size,hash_mtime,parent_id,depth)
+SELECT path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,
+       content_hash,hash_size,hash_mtime,(SELECT id FROM files_new WHERE path = ?),depth
+FROM files WHERE path = ? AND root_id IS NOT NULL AND root_id != ?
+ON CONFLICT(path) DO UPDATE SET
+  name = excluded.name, case_key = excluded.case_key, ext = excluded.ext,
+  size = excluded.size, mtime = excluded.mtime, ctime = excluded.ctime,
+  deleted = excluded.deleted, updated_at = excluded.updated_at, note = excluded.note,
+  root_id = excluded.root_id, parent_id = excluded.parent_id, depth = excluded.depth
+"""
+
+def _chunks(it: Iterator[Tuple], size: int) -> Iterator[List[Tuple]]:
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _with_root(rows: Iterator[Tuple], root_id: Optional[int]) -> Iterator[Tuple]:
+    # 扫描器产出的行末尾补上 所属根目录、父目录路径、深度（对应 UPSERT_ROW）
+    for row in rows:
+        yield row + (root_id,) + tree_pos(row[0])
+
+def _with_tree(rows: Iterator[Tuple], root_id: Optional[int]) -> Iterator[Tuple]:
+    # 重建用：按扫描顺序分配 id，父目录总先于子项产出，只需记住目录的 path -> id
+    dir_ids: Dict[str, int] = {}
+    for row_id, row in enumerate(rows, 1):
+        parent, depth = tree_pos(row[0])
+        if row[7]:
+            dir_ids[row[0]] = row_id
+        yield (row_id,) + row + (root_id, dir_ids.get(parent), depth)
+
+def _print_progress(stats: Dict[str, float]):
+    print(f"[rebuild] chunks={stats['chunks']} rows={stats['scanned']} "
+          f"{stats['rows_per_sec']:.0f} rows/s")
+
+def _has(cur, name: str) -> bool:
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def _drop_shadow(cur):
+    """删除上次中断的重建留下的预建表与变更记录触发器（不提交）"""
+    for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rebuild_%'").fetchall():
+        cur.execute(f"DROP TRIGGER {name}")
+    for table in SHADOW_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+
+def _by_id(conn: sqlite3.Connection, cur: sqlite3.Cursor, sql: str):
+    """按 files_new 的 id 区间分批执行 sql（最后两个参数为区间上下界），每批一个短事务，不长时间占用写锁"""
+    lo, hi = cur.execute("SELECT min(id), max(id) FROM files_new").fetchone()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, SHADOW_CHUNK):
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(sql, (start, start + SHADOW_CHUNK - 1))
+        conn.commit()
+
+def _backup(conn: sqlite3.Connection, path: str):
+    """sqlite3 备份 API 把整个库拷贝到 path（时间点副本；WAL 下只占一个读事务，不阻塞写入）"""
+    dest = sqlite3.connect(path)
+    try:
+        conn.backup(dest)
+    finally:
+        dest.close()
+
+def _drop_new(cur, path: str):
+    """从 files_new 删除一行（不提交），连同已迁移的正文"""
+    row = cur.execute("SELECT id FROM files_new WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return
+    if _has(cur, "content_text_new"):
+        cur.execute("DELETE FROM content_text_new WHERE file_id = ?", row)
+    cur.execute("DELETE FROM files_new WHERE id = ?", row)
+
+def _replay(cur, scope: str, should_ignore: Callable[[str], bool], root_id: Optional[int]) -> int:
+    """
+    把 rebuild_touched 中记下的 path 在 files_new 上重做一遍（不提交），返回处理的 path 数
+    重建范围内的重新 stat（不存在或被忽略则删除）；root_id 给定时其他根目录的照 files 复制
+    """
+    hi = cur.execute("SELECT max(seq) FROM rebuild_touched").fetchone()[0]
+    if hi is None:
+        return 0
+    paths = sorted({p for (p,) in cur.execute("SELECT path FROM rebuild_touched WHERE seq <= ?", (hi,))})
+    prefix = scope.rstrip(os.sep) + os.sep
+    for path in paths:      # 排序后父目录先于子项
+        if path == scope or path.startswith(prefix):
+            row = None
+            if not should_ignore(path):
+                try:
+                    st = os.stat(path)
+                    row = stat_row(path, os.path.basename(path) or path, st, stat.S_ISDIR(st.st_mode))
+                except OSError:
+                    pass
+            if row is not None:
+                cur.execute(REPLAY_ROW, row + (root_id,) + tree_pos(path))
+                continue
+        elif root_id is not None:
+            cur.execute(MIRROR_ROW, (tree_pos(path)[0], path, root_id))
+            if cur.rowcount:
+                continue
+        else:
+            continue        # 不在重建范围内，新表不保留
+        _drop_new(cur, path)
+    touched = "files_new.path IN (SELECT path FROM rebuild_touched WHERE seq <= ?)"
+    cur.execute(MIGRATE.format(where=touched), (hi,))
+    if _has(cur, "content_text_new"):
+        cur.execute(COPY_CONTENT.format(where=touched.replace("files_new.", "n.")), (hi,))
+    cur.execute("DELETE FROM rebuild_touched WHERE seq <= ?", (hi,))
+    return len(paths)
+
+def _build_shadow(conn: sqlite3.Connection, cur: sqlite3.Cursor) -> int:
+    """在 files_new 旁预建全文索引、正文表与目录汇总（分批短事务），返回汇总的目录数"""
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        for stmt in SHADOW_FTS:
+            cur.execute(stmt)
+        conn.commit()
+        _by_id(conn, cur, "INSERT INTO files_fts_new(rowid, name, path, note) "
+                          "SELECT id, name, path, note FROM files_new WHERE id BETWEEN ? AND ?")
+    except sqlite3.OperationalError as e:
+        # 没有 trigram 分词器：换表时照旧由 ensure_fts 处理（填充到一半的也不用）
+        conn.rollback()
+        error("sync_rebuild.py", "rebuild_files_table.fts", e)
+        cur.execute("DROP TABLE IF EXISTS files_fts_new")
+
+    if _has(cur, "content_fts"):
+        cur.execute("BEGIN IMMEDIATE")
+        for stmt in SHADOW_CONTENT:
+            cur.execute(stmt)
+        conn.commit()
+        _by_id(conn, cur, COPY_CONTENT.format(where="n.id BETWEEN ? AND ?"))
+
+    # 目录汇总按 id 记录：在 files_new 上全量重算，之后的改动由 *_new 触发器记增量、换表时 flush
+    cur.execute("BEGIN IMMEDIATE")
+    rollup.ensure(cur, "_new")
+    dirs = rollup.recompute(cur, "_new")
+    conn.commit()
+    return dirs
+
+def _swap(cur):
+    """换表（在调用方的写事务内）：files_new 与预建的表改名就位，再在新 files 上补建触发器"""
+    for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND (name LIKE 'trg_rebuild_%' "
+                               "OR tbl_name IN ('files_new', 'content_text_new'))").fetchall():
+        cur.execute(f"DROP TRIGGER {name}")
+    cur.execute("ALTER TABLE files RENAME TO files_old")
+    cur.execute("ALTER TABLE files_new RENAME TO files")
+    cur.execute("DROP TABLE files_old")         # 旧表上的触发器随之删除
+    cur.execute("DROP TABLE rebuild_touched")
+
+    # 全文索引按 rowid 对应旧表的 id：换成预建的
+    has_fts = _has(cur, "files_fts_new")
+    cur.execute("DROP TABLE IF EXISTS files_fts")
+    if has_fts:
+        cur.execute("ALTER TABLE files_fts_new RENAME TO files_fts")
+    for table in ("dir_stats", "dir_ext_stats"):
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    cur.execute("DROP TABLE dir_delta_new")
+    if _has(cur, "content_text_new"):
+        cur.execute("DROP TABLE content_fts")
+        cur.execute("DROP TABLE content_text")  # 其上的同步触发器随之删除
+        cur.execute("ALTER TABLE content_text_new RENAME TO content_text")
+        cur.execute("ALTER TABLE content_fts_new RENAME TO content_fts")
 
-def rebuild_files_table(watch_path: str, should_ignore: Callable[[str], bool]) -> Dict[str, int]:
+    # 触发器与汇总表的索引；预建失败（没有 trigram 分词器）时 ensure_fts 在这里新建并全量填充
+    rollup.ensure(cur)
+    for fn in (ensure_fts, ensure_content):
+        try:
+            fn(cur)
+        except sqlite3.OperationalError as e:
+            error("sync_rebuild.py", f"rebuild_files_table.{fn.__name__}", e)
+
+def rebuild_files_table(watch_path: str, should_ignore: Callable[[str], bool],
+                        chunk_size: int = REBUILD_CHUNK,
+                        progress: Optional[Callable[[Dict[str, float]], None]] = None,
+                        root_id: Optional[int] = None,
+                        backup: Optional[str] = None) -> Dict[str, int]:
     """
-    全量重扫 → 建 files_new → 批插 → 迁移 note → 原子换表。
-    返回统计：{'scanned': n, 'inserted': m}
+    全量重扫 → 在写事务之外建好 files_new（连同索引、全文索引、正文、目录汇总）→ 短暂持锁换表。
+    扫描是生成器，每 chunk_size 行一个短事务写入，内存占用与目录树大小无关（只在内存中保留目录的 path -> id）。
+    id 按扫描顺序分配，parent_id/depth 在插入时一并写好；note 与内容哈希按 path 连接旧表迁移（UPDATE ... FROM）。
+    重建期间读者照常读旧表、监听器照常写入：被改动的 path 由触发器记入 rebuild_touched，在 files_new 上重放（重新 stat），
+    换表事务里只重放最后一批并改名，持锁时间与库的大小无关。
+    root_id: 重建的根目录；给定时其他根目录的记录原样保留到新表
+    backup: 给定文件路径时，开始前用 sqlite3 备份 API 把整个库拷贝一份（时间点副本）
+    progress: 每写入 PROGRESS_EVERY 个分块回调一次（默认打印），参数为当前统计
+    返回统计：{'scanned': n, 'inserted': m, 'chunks': k, 'replayed': 重放的 path 数, 'dirs': 汇总的目录数,
+              'seconds': t, 'rows_per_sec': r, 'swap_ms': 换表持锁毫秒数}
     """
-    rows = scan_to_rows(watch_path, should_ignore)
-    stats = {"scanned": len(rows), "inserted": 0}
+    stats = {"scanned": 0, "inserted": 0, "chunks": 0, "replayed": 0, "dirs": 0,
+             "seconds": 0.0, "rows_per_sec": 0.0, "swap_ms": 0.0}
+    progress = progress or _print_progress
+    t0 = time.perf_counter()
+    scope = str(Path(watch_path).resolve())
 
     db = DBTools()
     conn: sqlite3.Connection = db.conn
     cur: sqlite3.Cursor = db.cur
 
     try:
+        if backup:
+            _backup(conn, backup)
+
+        # 新表与索引（先建索引，之后按 id 顺序分块写入）；开始记录 files 上的改动
         cur.execute("BEGIN IMMEDIATE")
-        cur.execute("PRAGMA foreign_keys = OFF")
+        _drop_shadow(cur)
+        cur.execute(DDL_FILES.format(tbl="files_new"))
+        create_indexes(cur, "files_new")
+        for stmt in TOUCHED_DDL + (TOUCHED_CONTENT_DDL if _has(cur, "content_fts") else []):
+            cur.execute(stmt)
+        conn.commit()
 
-        # 备份旧表（可选）
-        cur.execute("DROP TABLE IF EXISTS files_backup")
-        cur.execute("CREATE TABLE files_backup AS SELECT * FROM files")
+        # 边扫描边分块插入
+        for chunk in _chunks(_with_tree(scan_tree(watch_path, should_ignore), root_id), chunk_size):
+            cur.execute("BEGIN IMMEDIATE")
+            cur.executemany(
+                """
+                INSERT INTO files_new
+                (id,path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,parent_id,depth)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                chunk
+            )
+            conn.commit()
+            stats["scanned"] += len(chunk)
+            stats["inserted"] += cur.rowcount if cur.rowcount is not None else 0
+            stats["chunks"] += 1
+            stats["seconds"] = time.perf_counter() - t0
+            stats["rows_per_sec"] = stats["scanned"] / stats["seconds"] if stats["seconds"] else 0.0
+            if stats["chunks"] % PROGRESS_EVERY == 0:
+                progress(dict(stats))
 
-        # 新表
-        cur.execute("DROP TABLE IF EXISTS files_new")
-        cur.execute(DDL_FILES.format(tbl="files_new"))
-        for name, sql_tpl in INDEXES:
-            cur.execute(sql_tpl.format(tbl="files_new"))
-
-        # 批量插入扫描结果
-        cur.executemany(
-            """
-            INSERT INTO files_new
-            (path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note)
-            VALUES (?,?,?,?,?,?,?,?,?,?)
-            """,
-            rows
-        )
-        stats["inserted"] = cur.rowcount if cur.rowcount is not None else 0
-
-        # 迁移旧表 note（以 path 对齐）
-        cur.execute(
-            """
-            UPDATE files_new
-            SET note = COALESCE((
-              SELECT note FROM files old WHERE old.path = files_new.path
-            ), files_new.note)
-            WHERE EXISTS (SELECT 1 FROM files old WHERE old.path = files_new.path)
-            """
-        )
-
-        # 原子换表
-        cur.execute("ALTER TABLE files RENAME TO files_old")
-        cur.execute("ALTER TABLE files_new RENAME TO files")
-
-        # 如需将索引重建到新表名（若你在 INDEXES 用了固定名，这里再建一次）
-        for name, sql_tpl in INDEXES:
-            cur.execute(sql_tpl.format(tbl="files"))
-
-        # 删除旧表
-        cur.execute("DROP TABLE IF EXISTS files_old")
-
-        cur.execute("PRAGMA foreign_keys = ON")
+        # 其他根目录的记录原样保留
+        if root_id is not None:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                """
+                INSERT OR IGNORE INTO files_new
+                (path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,
+                 content_hash,hash_size,hash_mtime,parent_id,depth)
+                SELECT path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,
+                       content_hash,hash_size,hash_mtime,parent_id,depth
+                FROM files WHERE root_id IS NOT NULL AND root_id != ?
+                """,
+                (root_id,)
+            )
+            # 保留下来的记录换了 id：parent_id 经由旧表的 path 映射到新 id
+            cur.execute(
+                """
+                UPDATE files_new SET parent_id = (
+                  SELECT n.id FROM files old JOIN files_new n ON n.path = old.path
+                  WHERE old.id = files_new.parent_id
+                )
+                WHERE root_id IS NOT NULL AND root_id != ? AND parent_id IS NOT NULL
+                """,
+                (root_id,)
+            )
+            conn.commit()
+
+        # 迁移 note 与内容哈希，再重放扫描期间的改动
+        _by_id(conn, cur, MIGRATE.format(where="files_new.id BETWEEN ? AND ?"))
+        cur.execute("BEGIN IMMEDIATE")
+        stats["replayed"] += _replay(cur, scope, should_ignore, root_id)
+        conn.commit()
+
+        stats["dirs"] = _build_shadow(conn, cur)
+
+        # 换表：只有这一步持锁等待监听器
+        t1 = time.perf_counter()
+        cur.execute("BEGIN IMMEDIATE")
+        stats["replayed"] += _replay(cur, scope, should_ignore, root_id)
+        rollup.flush(cur, "_new")
+        _swap(cur)
         conn.commit()
-        print(f"[rebuild] scanned={stats['scanned']} inserted≈{stats['inserted']}")
+        stats["swap_ms"] = (time.perf_counter() - t1) * 1000
+        generation.bump()
+        # 新表上还没有 updated_at 触发器与统计信息（建表检查每进程只执行一次，这里补上）
+        db._ensure_schema()
+        stats["seconds"] = time.perf_counter() - t0
+        stats["rows_per_sec"] = stats["scanned"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"[rebuild] scanned={stats['scanned']} inserted≈{stats['inserted']} chunks={stats['chunks']} "
+              f"replayed={stats['replayed']} swap={stats['swap_ms']:.0f}ms {stats['seconds']:.1f}s")
         return stats
 
     except Exception as e:
         try: conn.rollback()
         except: pass
         error("sync_rebuild.py", "rebuild_files_table", e)
-        # 回滚后尽量恢复旧表（若需要可从 files_backup 还原）
+        # 换表之前旧表一直可用，只需清理预建的表
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            _drop_shadow(cur)
+            conn.commit()
+        except Exception as e2:
+            error("sync_rebuild.py", "rebuild_files_table.cleanup", e2)
         return stats
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 行 = 扫描行 + (root_id, 父目录路径, depth)，见 _with_root；父目录须先于子项写入
+_UPSERT_ROW = """
+INSERT INTO {tbl} (path,name,case_key,ext,size,mtime,ctime,deleted,updated_at,note,root_id,parent_id,depth)
+VALUES (?,?,?,?,?,?,?,?,?,?,?,(SELECT id FROM {tbl} WHERE path = ?),?)
+ON CONFLICT(path) DO UPDATE SET
+  ext = excluded.ext, size = excluded.size, mtime = excluded.mtime,
+  ctime = excluded.ctime, deleted = excluded.deleted, updated_at = excluded.updated_at,
+  root_id = excluded.root_id, parent_id = excluded.parent_id, depth = excluded.depth
+"""
+UPSERT_ROW = _UPSERT_ROW.format(tbl="files")
+REPLAY_ROW = _UPSERT_ROW.format(tbl="files_new")      # 重建时重放到新表
+
+# -------- 3) 增量对账：只对变化的部分做 增/改/删 --------
+def _write_diff(db: DBTools, rows: List[Tuple], gone: List[Tuple[str, bool]]) -> int:
+    """写线程中执行：先删除 gone 中 (path, 是否保留 path 本身) 的子树，再写入 rows；返回删除的行数"""
+    n = 0
+    for path, keep_self in gone:
+        n += db._delete_subtree(path, keep_self)
+    db.cur.executemany(UPSERT_ROW, rows)
+    return n
+
+
+def _outside(db: DBTools, root: str, root_id: Optional[int]) -> int:
+    """写线程中执行：删除范围内（root_id 为 None 时为全库）不在 root 之下的记录"""
+    lo, hi = root + os.sep, root + chr(ord(os.sep) + 1)
+    scope, args = ("", ()) if root_id is None else ("root_id = ? AND ", (root_id,))
+    db.cur.execute(f"DELETE FROM files WHERE {scope}(path < ? OR (path > ? AND path < ?) OR path >= ?)",
+                   args + (root, root, lo, hi))
+    return db.cur.rowcount
+
+
+def reconcile_files_table(watch_path: str, should_ignore: Callable[[str], bool],
+                          root_id: Optional[int] = None, submit: Optional[Callable] = None,
+                          chunk_size: int = REBUILD_CHUNK) -> Dict[str, int]:
+    """
+    root_id: 对账的根目录；给定时只删除该根目录的记录，其他根目录不受影响
+    submit:  写任务提交函数，默认 sql.writer.get_writer().submit：所有写入都经由单写线程，
+             每 chunk_size 条差异一个写任务（各自一个短事务），不与监听器争写锁
+    以 (path, size, mtime) 对比磁盘与 files 表，只写入差异。
+    逐个目录沿 parent_id 读取库中的直接子项（走 idx_files_parent），内存占用与库大小无关。
+    目录 mtime 与库中一致时，认为其直接子项没有增删改名：不再列目录，
+    直接沿用库中的子项，只继续深入其子目录（子目录内部的变化不会改变父目录 mtime）。
+    注意：文件内容原地修改不会改变所在目录的 mtime，这类变化由监听器负责；
+    需要彻底校正时使用 rebuild_files_table。
+    返回统计：{'listed_dirs','skipped_dirs','inserted','updated','deleted'}
+    """
+    stats = {"listed_dirs": 0, "skipped_dirs": 0, "inserted": 0, "updated": 0, "deleted": 0}
+    root = str(Path(watch_path).resolve())
+    submit = submit or get_writer().submit
+    rows: List[Tuple] = []                  # 本块待写入的行
+    gone: List[Tuple[str, bool]] = []       # 本块待删除的 (path, 是否保留 path 本身)
+
+    def flush():
+        if rows or gone:
+            stats["deleted"] += submit(lambda db, r=rows[:], g=gone[:]: _write_diff(db, r, g)).result()
+            rows.clear()
+            gone.clear()
+
+    def drop(path: str, keep_self: bool = False):
+        gone.append((path, keep_self))
+        if len(rows) + len(gone) >= chunk_size:
+            flush()
+
+    def check(row: Tuple, old: Optional[Tuple[int, int, int]]):
+        if old is None:
+            stats["inserted"] += 1
+        elif old[0] != row[4] or old[1] != row[5] or old[2] != row[7]:
+            if old[2] != row[7]:
+                gone.append((row[0], True))     # 目录与文件互换：原有的子树不再存在
+            stats["updated"] += 1
+        else:
+            return
+        rows.append(row + (root_id,) + tree_pos(row[0]))
+        if len(rows) + len(gone) >= chunk_size:
+            flush()
+
+    db = DBTools()      # 只读
+    try:
+        if root_id is not None:
+            submit(lambda w: w._claim_root(root_id, root)).result()
+
+        def children(path: str) -> Dict[str, Tuple[int, int, int]]:
+            # 库中 path 的直接子项：path -> (size, mtime, 是否目录)
+            return {p: (size, mtime, is_dir) for p, size, mtime, is_dir in db.cur.execute("""
+            SELECT path, size, mtime, deleted FROM files WHERE parent_id = (SELECT id FROM files WHERE path = ?)
+            """, (path,))}
+
+        # 根目录本身
+        stack: List[Tuple[str, bool]] = []
+        if not should_ignore(root):
+            st = os.stat(root)
+            old = db.cur.execute("SELECT size, mtime, deleted FROM files WHERE path = ?", (root,)).fetchone()
+            check(stat_row(root, os.path.basename(root), st, True), old)
+            stack.append((root, old is not None and old[2] == 1 and old[1] == int(st.st_mtime)))
+        else:
+            drop(root)
+
+        while stack:
+            cur, unchanged = stack.pop()
+            known = children(cur)
+            if unchanged:
+                # 目录结构未变：沿用库中子项，只检查忽略规则并深入子目录
+                stats["skipped_dirs"] += 1
+                for child, old in known.items():
+                    if should_ignore(child):
+                        drop(child)
+                        continue
+                    if not old[2]:
+                        continue
+                    try:
+                        st = os.stat(child)
+                    except OSError:
+                        drop(child)
+                        continue
+                    check(stat_row(child, os.path.basename(child), st, True), old)
+                    stack.append((child, old[1] == int(st.st_mtime)))
+                continue
+
+            stats["listed_dirs"] += 1
+            listed, subdirs = list_dir(cur, should_ignore)
+            dir_mtime = {}
+            for row in listed:
+                old = known.pop(row[0], None)
+                check(row, old)
+                if row[7]:
+                    dir_mtime[row[0]] = old is not None and old[2] == 1 and old[1] == row[5]
+            for child in known:     # 磁盘上已不存在、或新被忽略
+                drop(child)
+            for d in subdirs:
+                stack.append((d, dir_mtime[d]))
+        flush()
+
+        # 不在根目录之下的记录；根目录内父目录不在库中的孤立记录（沿 parent_id 走不到），磁盘上已不存在的删除
+        stats["deleted"] += submit(lambda w: _outside(w, root, root_id)).result()
+        orphans = [p for (p,) in db.cur.execute("""
+        SELECT path FROM files WHERE parent_id IS NULL AND path >= ? AND path < ?
+        """, (root + os.sep, root + chr(ord(os.sep) + 1))) if not os.path.lexists(p)]
+        for p in orphans:
+            drop(p)
+        flush()
+        submit(lambda w: refresh_stats(w.cur)).result()
+        print(f"[reconcile] listed={stats['listed_dirs']} skipped={stats['skipped_dirs']} "
+              f"+{stats['inserted']} ~{stats['updated']} -{stats['deleted']}")
+        return stats
+
+    except Exception as e:
+        error("sync_rebuild.py", "reconcile_files_table", e)
+        return stats
+    finally:
+        db.close()
+
+# -------- 4) 忽略规则变更：只清理新被忽略的行、只补扫新放行的子树 --------
+def apply_ignore_change(watch_path: str, old, new, submit: Callable,
+                        chunk_size: int = REBUILD_CHUNK, root_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    watch_path: 监听根目录（root_id 为其 id，给定时只处理该根目录的记录）
+    old/new: 变更前后的 sql.ignore.IgnoreMatcher
+    submit:  写任务提交函数（sql.writer.DBWriter.submit），所有写入都经由单写线程
+    - 规则变严（新增忽略 / 删除否定）：一条集合式 DELETE，由注册到连接上的 SQL 函数判定新规则
+    - 规则变松（删除忽略 / 新增否定）：只列举库中已有的目录，找出旧规则忽略、新规则放行的条目；
+      文件直接入库，目录整棵子树扫描入库
+    返回统计：{'purged': n, 'backfilled': m}
+    """
+    stats = {"purged": 0, "backfilled": 0}
+    added = set(new.patterns) - set(old.patterns)
+    removed = set(old.patterns) - set(new.patterns)
+    neg_added = set(new.negs) - set(old.negs)
+    neg_removed = set(old.negs) - set(new.negs)
+
+    scope, args = ("", ()) if root_id is None else (" AND root_id = ?", (root_id,))
+
+    if added or neg_removed:
+        def purge(db):
+            db.conn.create_function("tracker_ignored", 1, lambda p: new.ignored(p), deterministic=True)
+            db.cur.execute("DELETE FROM files WHERE tracker_ignored(path)" + scope, args)
+            return db.cur.rowcount
+        stats["purged"] = submit(purge).result()
+
+    if removed or neg_added:
+        with DBTools() as db:
+            known_dirs = [r[0] for r in db.cur.execute("SELECT path FROM files WHERE deleted = 1" + scope, args)]
+        root = str(Path(watch_path).resolve())
+        if root not in known_dirs:
+            known_dirs.append(root)
+
+        def freed():
+            # 只 stat 新放行的条目；列目录本身不触发 stat
+            for d in known_dirs:
+                try:
+                    with os.scandir(d) as it:
+                        entries = list(it)
+                except OSError:
+                    continue
+                for entry in entries:
+                    if not old.ignored(entry.path) or new.ignored(entry.path):
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                        yield stat_row(entry.path, entry.name, entry.stat(), is_dir)
+                    except OSError as e:
+                        error("sync_rebuild.py", "apply_ignore_change.stat", e)
+                        continue
+                    if is_dir and not entry.is_symlink():
+                        stack = [entry.path]
+                        while stack:
+                            rows, subdirs = list_dir(stack.pop(), new.ignored)
+                            yield from rows
+                            stack.extend(subdirs)
+
+        for chunk in _chunks(_with_root(freed(), root_id), chunk_size):
+            submit(lambda db, rows=chunk: db.cur.executemany(UPSERT_ROW, rows)).result()
+            stats["backfilled"] += len(chunk)
+
+    print(f"[ignore] purged={stats['purged']} backfilled={stats['backfilled']}")
+    return stats
@@ -1,109 +1,223 @@
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import time,os,json,sys
+import time,os,json,threading
+from typing import Optional
 from sql.db_tools import DBTools
-from data.meta_data import HISTORY_RECORD,DB_FILE,get_watch_path
+from sql.writer import get_writer, stop_writer
+from sql.event_queue import EventQueue, FileEvent, CREATED, DELETED, MOVED, MODIFIED
+from sql.scanner import scan_tree, check_predicate
+from sql import metrics
+from sql.hasher import get_hasher, stop_hasher, foreground
+from sql.extractor import get_extractor, stop_extractor
+from sql.maintenance import get_maintainer, stop_maintainer
+from sql.poller import SnapshotObserver
+from sql.sync_rebuild import apply_ignore_change, reconcile_files_table
+from sql.ignore import (IgnoreMatcher, load_ignore_file, DEFAULT_IGNORE_DIRS,
+                        DEFAULT_IGNORE_FILE_SUFFIX, DEFAULT_IGNORE_FILE_NAMES)
+from data.meta_data import DB_FILE,DATA_DIR,get_watch_path,get_watch_roots,add_watch_root,remove_watch_root,get_option
 from core.error_handler import error
-import fnmatch
-from pathlib import Path
 
 f_name = "tracker.py"
 INDEX_FILE = "../data/file_index2.json"
 
-# 项目根目录的ignore文件(放在 WATCH PATH 的根部)
-TRACKERIGNORE = os.path.join(get_watch_path(), ".trackerignore")
-
-# 需要忽略的类型
-# 默认忽略目录/文件/后缀（可按需增删）
-DEFAULT_IGNORE_DIRS = {
-    ".git", ".hg", ".svn", ".idea", ".vscode",
-    "__pycache__", ".mypy_cache", ".pytest_cache",
-    "dist", "build", ".cache", ".local",
-    "node_modules", ".pnpm-store", ".yarn", ".parcel-cache",
-    "venv", ".venv", "env",
-    "Lib", "site-packages",  # Windows venv 常见
-}
-DEFAULT_IGNORE_FILE_SUFFIX = {
-    ".pyc", ".pyo", ".pyd", ".so", ".dll",
-    ".tmp", ".temp", ".swp", ".swx", ".log",
-    ".crdownload", ".part", ".download",
-}
-DEFAULT_IGNORE_FILE_NAMES = {"desktop.ini", "thumbs.db", ".ds_Store"}
-
-
-def _norm(p:str) -> str:
-    # 统一大小写与分隔符，方便匹配。把任意输入路径 规范化 成一个稳定的字符串
-    return Path(p).resolve().as_posix().lower()
-
-def _rel(p:str) -> str:
-    # 转相对路径，便于.trackerignore 用相对规则
-    try:
-        return Path(p).resolve().relative_to(Path(get_watch_path()).resolve()).as_posix().lower()
-    except ValueError:
-        # 如果p不处于监听目录下，那么就转移到 _norm(p)（绝对路径）
-        return _norm(p)
-
-def _load_trackerignore() -> tuple[list[str], list[str]]:
-    # 负责读取并解析 .trackerignore 文件里的规则
-    pats, neg = [], []      # pats: 普通忽略规则, neg: 否定规则
-    if os.path.exists(TRACKERIGNORE):
-        with open(TRACKERIGNORE, "r",encoding="utf-8") as f:
-            for line in f:
-                s = line.strip()
-                if not s or s.startswith("#"): continue
-                if s.startswith("!"):
-                    neg.append(s[1:].strip())
-                else:
-                    pats.append(s)
-    return pats, neg
-
-# 程序启动前，先读一遍
-IGNORE_GLOBS, IGNORE_NEG_GLOBS = _load_trackerignore()
+# 需要忽略的类型：默认集合与规则引擎见 sql/ignore.py
+# 每个根目录各有一份 .trackerignore（放在根目录的根部）
+
+IGNORE_RELOAD_DELAY = 0.5   # 秒；编辑器保存时常连发多个事件，合并为一次重载
+STORM_BATCH = 100           # 单批事件数达到该值视为事件风暴，后台哈希暂停
+APPLY_RETRIES = 3           # 整批落库失败（如写锁超时）时原地重试的次数，之后放回队列
+APPLY_RETRY_DELAY = 0.5     # 秒；第 n 次重试前等待 APPLY_RETRY_DELAY * 2**n
+
+# 指标（见 sql/metrics.py）
+_m_received = {k: metrics.counter(f"events.received.{k}") for k in (CREATED, DELETED, MOVED, MODIFIED)}
+_m_ignored = metrics.counter("events.ignored")
+_m_applied = metrics.counter("db.applied")
+_m_skipped = metrics.counter("db.skipped")
+_m_retried = metrics.counter("db.batch_retries")    # 整批落库失败后的重试（含放回队列）
+_m_apply = metrics.histogram("db.apply_ms")          # 整批提交给写线程到提交完成
+_m_lag = metrics.histogram("events.lag_ms")          # 事件进入队列到所在事务提交
+
+
+# 监听根目录 #
+class WatchRoot:
+    """
+    一个监听根目录：各自的忽略规则、事件队列与 Observer
+    所有根目录共用进程内唯一的写线程（SQLite 同一时刻只允许一个写者）
+    mode: native 为系统通知，poll 为快照对比轮询（见 sql/poller.py），None 为使用配置 WATCH_MODE
+    """
+    def __init__(self, root_id:int, path:str, mode:str = None):
+        self.root_id = root_id
+        self.path = os.path.normpath(path)
+        self.mode = mode or get_option("WATCH_MODE")
+        self.snapshot_file = os.path.join(DATA_DIR, f"poll_snapshot_{root_id}.bin")
+        self.trackerignore = os.path.join(self.path, ".trackerignore")
+        self.matcher = IgnoreMatcher(self.path, *load_ignore_file(self.trackerignore))
+        self.event_queue: Optional[EventQueue] = None
+        self.observer = None
+        self._reload_timer = None
+        self._reload_lock = threading.Lock()
+
+    def should_ignore(self, p:str) -> bool:
+        return self.matcher.ignored(p)
+
+    def contains(self, p:str) -> bool:
+        root, p = os.path.normcase(self.path), os.path.normcase(os.path.normpath(p))
+        return p == root or p.startswith(root.rstrip(os.sep) + os.sep)
+
+    # 批量落库 #
+    def apply_batch(self, events:list[FileEvent]):
+        """
+        事件队列的回调：整批交给写线程在一个事务内应用
+        整批失败（写锁超时、磁盘错误等；单条事件的错误在批内跳过）时退避重试，仍失败则放回队列，事件不丢弃
+        """
+        t0 = time.perf_counter()
+        for attempt in range(APPLY_RETRIES + 1):
+            try:
+                stats = get_writer().submit_events(events, self.root_id).result()
+                break
+            except Exception as e:
+                error(f_name,"apply_batch",e)
+                _m_retried.inc()
+                if attempt == APPLY_RETRIES:
+                    queue = self.event_queue
+                    if queue is not None:
+                        queue.requeue(events)
+                    return
+                time.sleep(APPLY_RETRY_DELAY * 2 ** attempt)
+        _m_apply.observe((time.perf_counter() - t0) * 1000)
+        now = time.time()
+        for ev in events:
+            _m_lag.observe((now - ev.ts) * 1000)
+        _m_applied.inc(stats["applied"])
+        _m_skipped.inc(stats["skipped"])
+        if len(events) >= STORM_BATCH:
+            foreground()
+        _enqueue_background(events)
+        print(f"[root {self.root_id}] batch applied: {stats['applied']} skipped: {stats['skipped']}")
+
+    # .trackerignore 热加载 #
+    def is_ignore_file(self, p:str) -> bool:
+        return os.path.normcase(os.path.normpath(p)) == os.path.normcase(self.trackerignore)
+
+    def schedule_ignore_reload(self):
+        """ignore 文件变化时调用，延迟一小段时间后重载（重复调用会重新计时）"""
+        with self._reload_lock:
+            if self._reload_timer is not None:
+                self._reload_timer.cancel()
+            self._reload_timer = threading.Timer(IGNORE_RELOAD_DELAY, self.reload_ignore)
+            self._reload_timer.daemon = True
+            self._reload_timer.start()
+
+    def reload_ignore(self):
+        """
+        重新读取 .trackerignore，对比新旧规则：
+        新被忽略的行一次性删除，新放行的子树补扫入库；规则没变则什么也不做
+        """
+        old = self.matcher
+        pats, negs = load_ignore_file(self.trackerignore)
+        if pats == old.patterns and negs == old.negs:
+            return
+        # 先切换规则，之后到达的事件按新规则过滤
+        new = self.matcher = IgnoreMatcher(self.path, pats, negs)
+        print(f"检测到 {self.trackerignore} 变化，正在同步索引")
+        try:
+            apply_ignore_change(self.path, old, new, get_writer().submit, root_id=self.root_id)
+        except Exception as e:
+            error(f_name, "reload_ignore", e)
+        if isinstance(self.observer, SnapshotObserver):
+            self.observer.invalidate()      # 快照中没有原先被忽略的条目，下一轮完整校验
+
+    # 启停 #
+    def start(self):
+        self.event_queue = EventQueue(self.apply_batch)
+        self.event_queue.start()
+        handler = FileChangeHandler(self)
+        if self.mode != "poll":
+            try:
+                self.observer = Observer()
+                self.observer.schedule(handler, self.path, recursive=True)
+                self.observer.start()
+                return
+            except OSError as e:
+                # 如 inotify 监听数耗尽（ENOSPC）：退回轮询
+                print(f"[root {self.root_id}] 系统通知不可用，改为轮询: {e}")
+                try: self.observer.stop()
+                except Exception: pass
+                self.observer = None
+        self.observer = self._poller()
+        self.observer.schedule(handler, self.path, recursive=True)
+        self.observer.start()
+
+    def _poller(self) -> SnapshotObserver:
+        # 被忽略的条目不进入快照；.trackerignore 本身保留，以便轮询也能发现规则变化
+        return SnapshotObserver(self.snapshot_file,
+                                should_ignore=lambda p: self.should_ignore(p) and not self.is_ignore_file(p))
+
+    def stop(self):
+        with self._reload_lock:
+            if self._reload_timer is not None:
+                self._reload_timer.cancel()
+        if self.observer:
+            try:
+                self.observer.stop()
+                self.observer.join()
+            except Exception as e:
+                print("停止监控时出错:", e)
+            finally:
+                self.observer = None
+        if self.event_queue:
+            # 刷入队列中剩余的事件
+            self.event_queue.stop()
+            self.event_queue = None
+
+
+_roots: dict[int, WatchRoot] = {}     # root_id -> WatchRoot，与 data.meta_data 的注册表同步
+_roots_lock = threading.RLock()
+_watching = False
+
+def reset_matcher():
+    """按根目录注册表重建各根目录的状态，并重新读取各自的 .trackerignore"""
+    with _roots_lock:
+        registry = {r["id"]: r for r in get_watch_roots()}
+        for root_id in list(_roots):
+            r = registry.get(root_id)
+            if (r is None or _roots[root_id].path != os.path.normpath(r["path"])
+                    or _roots[root_id].mode != (r.get("mode") or get_option("WATCH_MODE"))):
+                _roots.pop(root_id).stop()
+        for root_id, r in registry.items():
+            root = _roots.get(root_id)
+            if root is None:
+                _roots[root_id] = WatchRoot(root_id, r["path"], r.get("mode"))
+            elif root.observer is None:
+                root.matcher = IgnoreMatcher(root.path, *load_ignore_file(root.trackerignore))
+
+def list_roots() -> list[WatchRoot]:
+    with _roots_lock:
+        if not _roots:
+            reset_matcher()
+        return list(_roots.values())
+
+def root_for(p:str) -> Optional[WatchRoot]:
+    """路径所属的根目录（不在任何根目录下时返回 None）"""
+    for root in list_roots():
+        if root.contains(p):
+            return root
+    return None
+
+def get_matcher(root_id:int = None) -> IgnoreMatcher:
+    roots = list_roots()
+    for root in roots:
+        if root_id is None or root.root_id == root_id:
+            return root.matcher
+    raise KeyError(root_id)
 
 def should_ignore(p:str) -> bool:
-    p_abs = _norm(p)
-    p_rel= _rel(p)
-    base = os.path.basename(p_abs)
-
-    # 开始排除
-    # 1) 排除数据库本体以及衍生
-    dbn = _norm(DB_FILE)
-    if p_abs == dbn:
-        return True
-    if p_abs.startswith(dbn):
-        tail = p_abs[len(dbn):]
-        if any(s in tail for s in (".wal", "-wal", ".journal", "-journal")):
-            return True
-
-    # 2) 默认文件名/后缀
-    if base in DEFAULT_IGNORE_FILE_SUFFIX:
-        return True
-    if any(base.endswith(suf) for suf in DEFAULT_IGNORE_FILE_SUFFIX):
-        return True
-
-    # 3) 默认目录命中(路径段包含任一忽略目录)
-    parts = Path(p_abs).parts
-    if any(seg.lower in DEFAULT_IGNORE_DIRS for seg in parts):
-        # 允许被 .trackerignore 的否定规则覆盖，继续看第4步
-        pass
-
-    # 4) .trackerignore（glob），相对与绝对都试
-    def _glob_hit(p: str, patterns: list[str]) -> bool:
-        return any(fnmatch.fnmatch(p, pat.lower()) for pat in patterns)
-
-    if _glob_hit(p_rel, IGNORE_GLOBS) or _glob_hit(p_abs, IGNORE_GLOBS):
-        # 若被否定规则命中，则不忽略
-        if _glob_hit(p_rel, IGNORE_NEG_GLOBS) or _glob_hit(p_abs, IGNORE_NEG_GLOBS):
-            return False
-        return True
-
-    # 5) 若路径段包含默认忽略目录，且没有被否定覆盖 → 忽略
-    if any(seg.lower() in DEFAULT_IGNORE_DIRS for seg in parts):
-        if _glob_hit(p_rel, IGNORE_NEG_GLOBS) or _glob_hit(p_abs, IGNORE_NEG_GLOBS):
-            return False
-        return True
-
-    return False
+    # 按路径所属根目录的规则判定；不在任何根目录下时用第一个根目录的规则
+    root = root_for(p)
+    if root is None:
+        roots = list_roots()
+        return roots[0].should_ignore(p) if roots else False
+    return root.should_ignore(p)
 
 
 # 修改json目录 #
@@ -125,194 +239,216 @@ def save_index(index):
     with open(INDEX_FILE,'w',encoding='utf-8') as f:
         json.dump(index,f,indent=2,ensure_ascii=False)
 
+def _enqueue_background(events:list[FileEvent]):
+    # 新建/修改的文件在落库后交给后台哈希与正文抽取（移动不改变内容，沿用原哈希与正文）
+    workers = [w for w in (get_hasher(), get_extractor()) if w is not None]
+    if not workers:
+        return
+    for ev in events:
+        if ev.kind in (CREATED, MODIFIED) and not ev.is_directory:
+            for w in workers:
+                w.submit(ev.path)
+
+def _root_id(path:str) -> Optional[int]:
+    root = root_for(path)
+    return root.root_id if root else None
+
 def add_to_index(filepath, is_directory:bool):
     filepath = os.path.normpath(filepath)
-    dbtools = DBTools()
-    print("在里:",filepath)
-
-    try:
-        if not is_directory:
-            if dbtools.create(filepath):
-                print(f"new file added: {filepath}")
-        else:
-            if dbtools.create_dir(filepath):
-                print(f"new dir added: {filepath}")
-    except Exception as e:
-        error(f_name,"add_to_index",e)
-    finally:
-        dbtools.close()
+    events = [FileEvent(CREATED, filepath, is_directory)]
+    get_writer().submit_events(events, _root_id(filepath)).add_done_callback(lambda f: _enqueue_background(events))
 
 def remove_from_index(filepath, is_directory = False):
     filepath = os.path.normpath(filepath)
-    dbtools = DBTools()
-
-    try:
-        if dbtools.delete(filepath):
-            print(f"File removed: {filepath}")
-    except Exception as e:
-        error(f_name,"remove_from_index",e)
-    finally:
-        dbtools.close()
+    get_writer().submit_events([FileEvent(DELETED, filepath, is_directory)], _root_id(filepath))
 
 
 def update_index(old_path,new_path,is_directory = False):
-    history = load_json(HISTORY_RECORD)
-
     # 统一路径分隔符
     old_path = os.path.normpath(old_path)
     new_path = os.path.normpath(new_path)
-
-    # 前缀检查
-    if old_path in history:
-        return
-
-    dbtools = DBTools()
-    try:
-        # 非目录项的修改
-        if not is_directory :
-            # 单个更新
-            print("非目录项的修改")
-            dbtools.update(old_path,new_path)
-        else:
-            # 目录项的修改
-            print("目录项的修改")
-            # 递归查找需要改变的全部文件
-            update_list = dbtools.list_file_and_dir_paths(old_path)
-            print(f"需要修改的文件数量:{len(update_list)}")
-            # 更新前缀记录文件
-            with open(HISTORY_RECORD,'w',encoding='utf-8') as f:
-                json.dump(update_list,f,indent=2,ensure_ascii=False)
-            # 批量更新
-            dbtools.update_many(update_list,new_path+os.sep,old_path+os.sep)
-    except Exception as ex:
-        error(f_name,"update_index",ex)
-    finally:
-        dbtools.close()
+    # 目录：一条范围 UPDATE 改写整个子树（见 DBTools.rename_dir）
+    get_writer().submit_events([FileEvent(MOVED, old_path, is_directory, new_path)], _root_id(new_path))
 
 def modify_index(path:str):
     path = os.path.normpath(path)
-    dbtools = DBTools()
-    try:
-        dbtools.update(path,path)
-    except Exception as e:
-        error(f_name,"modify_index",e)
-    finally:
-        dbtools.close()
+    events = [FileEvent(MODIFIED, path)]
+    get_writer().submit_events(events, _root_id(path)).add_done_callback(lambda f: _enqueue_background(events))
 
-def clear_json(json_path:str) -> bool:
-    if not os.path.exists(json_path):
-        print(f"错误来自 tracker clear_json函数: 文件{json_path}不存在")
-        return False
-    else:
-        with open(json_path,'w',encoding='utf-8') as f:
-            json.dump([],f,indent=2,ensure_ascii=False)
-        return True
 
 # 事件监听器 #
 class FileChangeHandler(FileSystemEventHandler):
+    """一个根目录的事件回调，事件放入该根目录的合并队列"""
+    def __init__(self, root:WatchRoot):
+        super().__init__()
+        self.root = root
+
     def on_created(self, event):
+        _m_received[CREATED].inc()
         src = os.path.normpath(event.src_path)
-        if should_ignore(src):
+        if self.root.is_ignore_file(src):
+            self.root.schedule_ignore_reload()
+        if self.root.should_ignore(src):
+            _m_ignored.inc()
             return
-        add_to_index(src, is_directory=event.is_directory)
-        clear_json(HISTORY_RECORD)
+        self.root.event_queue.put(FileEvent(CREATED, src, event.is_directory))
 
     def on_deleted(self, event):
+        _m_received[DELETED].inc()
         src = os.path.normpath(event.src_path)
-        if should_ignore(src):
+        if self.root.is_ignore_file(src):
+            self.root.schedule_ignore_reload()
+        if self.root.should_ignore(src):
+            _m_ignored.inc()
             return
-        remove_from_index(src,event.is_directory)
-        clear_json(HISTORY_RECORD)
+        self.root.event_queue.put(FileEvent(DELETED, src, event.is_directory))
 
+    def on_modified(self, event):
+        # 目录的修改事件只是子项变化的副作用，忽略
+        if event.is_directory:
+            return
+        _m_received[MODIFIED].inc()
+        src = os.path.normpath(event.src_path)
+        if self.root.is_ignore_file(src):
+            self.root.schedule_ignore_reload()
+        if self.root.should_ignore(src):
+            _m_ignored.inc()
+            return
+        self.root.event_queue.put(FileEvent(MODIFIED, src))
 
     def on_moved(self, event):
+        _m_received[MOVED].inc()
         src = os.path.normpath(event.src_path)
         dst = os.path.normpath(event.dest_path)
+        # 编辑器“写临时文件再改名”式保存
+        if self.root.is_ignore_file(src) or self.root.is_ignore_file(dst):
+            self.root.schedule_ignore_reload()
+        src_ignored = self.root.should_ignore(src)
+        dst_ignored = self.root.should_ignore(dst)
 
         # 两端都应忽略
-        if should_ignore(src) and should_ignore(dst):
+        if src_ignored and dst_ignored:
+            _m_ignored.inc()
             return
 
         # 一端在工作集、一端被忽略：等价于 “增 或 删”
-        if should_ignore(src) and not should_ignore(dst):
-            add_to_index(dst, is_directory=event.is_directory)
-            clear_json(HISTORY_RECORD)
+        if src_ignored:
+            self.root.event_queue.put(FileEvent(CREATED, dst, event.is_directory))
             return
 
-        if not should_ignore(src) and should_ignore(dst):
-            remove_from_index(src, event.is_directory)
-            clear_json(HISTORY_RECORD)
+        if dst_ignored:
+            self.root.event_queue.put(FileEvent(DELETED, src, event.is_directory))
             return
 
-        update_index(src, dst, is_directory = event.is_directory)
-        # print(f"ON move 触发， SRC:{event.src_path}, DEST:{event.dest_path}, IS DIR:{event.is_directory}")
+        self.root.event_queue.put(FileEvent(MOVED, src, event.is_directory, dst))
 
 
 
 # 初始化 #
-def initialize(reset:bool = False):
+def _scan_root(dbtools:DBTools, root:WatchRoot, rows):
+    # 并行 scandir 扫描（被忽略的目录不会深入），扫描行直接批量入库：一个事务，不再逐条 stat + 提交
+    stats = dbtools.upsert_many(rows, root.root_id)
+    print(f"[initialize] {root.path}: +{stats['inserted']} ~{stats['updated']} ({stats['seconds']}s)")
+
+def _scanner(root:WatchRoot):
+    # 传 matcher 的绑定方法：可 pickle（进程模式），WatchRoot 本身带锁不能 pickle
+    return scan_tree(root.path, root.matcher.ignored)
+
+def initialize(reset:bool = False, root_id:int = None):
+    """清空后全量扫描；给定 root_id 时只重建该根目录，其他根目录的记录不动"""
     print("初始化中...")
-    dbtools = DBTools()
-    dbtools.reset_db()      # 清空数据库
-    for root, dirs, files in os.walk(get_watch_path()):
-        # 原地过滤目录
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.join(root, d))]
-
-        # 目录入库
-        for d in dirs:
-            dp = os.path.normpath(os.path.join(root, d))
-            if not should_ignore(dp):
-                try:
-                    dbtools.create_dir(dp)
-                except Exception as e:
-                    error("sql/tracker.py", "initialize.create_dir", e)
-
-        # 文件入库
-        for file in files:
-            filepath = os.path.normpath(os.path.join(root,file))
-            if should_ignore(filepath):
-                continue
-            try:
-                dbtools.create(filepath)
-            except Exception as e:
-                error("sql/tracker.py", "initialize.create_file", e)
-    dbtools.close()
+    reset_matcher()
+    with DBTools() as dbtools:
+        roots = list_roots() if root_id is None else [_roots[root_id]]
+        for root in roots:
+            check_predicate(root.matcher.ignored)   # 进程模式下不能 pickle 时在清库之前就抛出
+        if root_id is None:
+            dbtools.reset_db()      # 清空数据库
+        else:
+            dbtools.delete_root(root_id)
+        for root in roots:
+            _scan_root(dbtools, root, _scanner(root))   # 清库之后才建扫描器
+        dbtools.analyze()           # 大批写入后统计信息多半已过期
     print("初始化完成")
 
 
-observer = None     # 将监听器作为全局变量
+# 根目录增删 #
+def add_root(path:str, mode:str = None) -> int:
+    """
+    注册并索引一个新的根目录：只扫描这个根目录，监听中则立即为它启动 Observer
+    mode 为 poll 时用快照对比轮询（网络盘）；与已有根目录互相嵌套时抛 ValueError
+    """
+    root_id = add_watch_root(path, mode)
+    with _roots_lock:
+        reset_matcher()
+        root = _roots[root_id]
+    reconcile_files_table(root.path, root.matcher.ignored, root_id)
+    if _watching and root.observer is None:
+        root.start()
+    print(f"已添加根目录 {root_id}: {root.path}")
+    return root_id
+
+def remove_root(root_id:int) -> int:
+    """停止监听并删除该根目录的全部记录，返回删除行数"""
+    with _roots_lock:
+        root = _roots.pop(root_id, None)
+    if root:
+        root.stop()
+        if os.path.exists(root.snapshot_file):
+            os.remove(root.snapshot_file)
+    remove_watch_root(root_id)
+    if _watching:
+        n = get_writer().submit(lambda db: db._delete_root(root_id)).result()
+    else:
+        with DBTools() as dbtools:
+            n = dbtools.delete_root(root_id)
+    print(f"已移除根目录 {root_id}，删除记录 {n} 条")
+    return n
+
 
 # 启动器 #
 def start_watching():
-    global observer
-    if not os.path.exists(HISTORY_RECORD):
-        print("From tracker: history_record.json 文件缺失")
-        sys.exit(1)
+    global _watching
     print("监听开始")
-    event_handler = FileChangeHandler()
-    observer = Observer()
-    observer.schedule(event_handler, get_watch_path(), recursive=True)
-    observer.start()
+    reset_matcher()
+    get_writer()    # 写线程启动时完成建表检查，之后不再重复
+    for root in list_roots():
+        if not os.path.isdir(root.path):
+            print(f"根目录不存在，跳过: {root.path}")
+            continue
+        root.start()
+    hasher = get_hasher()
+    if hasher is not None:
+        hasher.submit_stale()   # 补算尚未哈希/已过期的文件（队列空闲时分页读取）
+    extractor = get_extractor()
+    if extractor is not None:
+        extractor.submit_stale()    # 同上：补抽尚未抽取/已过期的正文
+    get_maintainer()    # 空闲时检查点、optimize、incremental_vacuum、按库大小调整缓存
+    metrics.start_dump()
+    _watching = True
 
 
 def stop_watching():
-    global observer
-    if observer:
-        try:
-            observer.stop()
-            observer.join()
-            print("监听已停止")
-        except Exception as e:
-            print("停止监控时出错:", e)
-        finally:
-            observer = None
+    global _watching
+    _watching = False
+    for root in list_roots():
+        root.stop()
+    print("监听已停止")
+    stop_hasher()       # 哈希结果经由写线程写回，先停
+    stop_extractor()    # 正文同上
+    stop_maintainer()
+    stop_writer()
+    metrics.stop_dump()
+
+def is_watching() -> bool:
+    return _watching
 
 if __name__ == "__main__":
     # 脚本模式
     initialize()
     start_watching()
     try:
-        while observer and observer.is_alive():
+        while is_watching():
             time.sleep(1)
     except KeyboardInterrupt:
         pass
@@ -0,0 +1,160 @@
+import queue, threading, time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+from sql.db_tools import DBTools, get_pool
+from core.error_handler import error
+from sql import metrics
+
+# 单写线程
+# 监听器的所有写操作都通过队列交给这一个线程执行：
+# - 线程独占一个长连接，建表检查与 WAL pragma 只在启动时执行一次
+# - 语句文本固定，复用 sqlite3 的预编译语句缓存
+# - 一次取出队列中积压的全部任务，在同一个事务里提交（每个任务各自一个 SAVEPOINT，
+#   单个任务失败只回滚自己），写锁永远只有这一个连接在争用
+
+f_name = "writer.py"
+MAX_JOBS_PER_TXN = 256      # 单个事务最多合并的任务数
+
+_STOP = object()
+
+_m_txn = metrics.histogram("writer.txn_ms")
+_m_jobs = metrics.histogram("writer.jobs_per_txn", metrics.SIZE_BUCKETS)
+_m_failed = metrics.counter("writer.jobs_failed")
+_m_depth = metrics.gauge("writer.queue_depth")
+
+
+class DBWriter:
+    """写线程。submit(fn) 中的 fn 接收写线程的 DBTools，在事务内执行，返回值通过 Future 取回"""
+
+    def __init__(self):
+        self._q: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None     # 写线程启动（连接/建表）失败的异常，由 start() 抛出
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="tracker-db-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            e, self._error = self._error, None
+            self._thread.join()
+            self._thread = None
+            raise e
+
+    def stop(self):
+        """处理完队列中已有的任务后退出"""
+        if self._thread:
+            self._q.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def pending(self) -> int:
+        """队列中尚未执行的任务数"""
+        return self._q.qsize()
+
+    # ---------- 生产端 ---------- #
+    def submit(self, fn: Callable[[DBTools], object]) -> Future:
+        fut: Future = Future()
+        self._q.put((fn, fut))
+        return fut
+
+    def submit_events(self, events: List, root_id: Optional[int] = None) -> Future:
+        """提交一批 FileEvent（属于根目录 root_id），结果为 DBTools._apply_events 的统计"""
+        return self.submit(lambda db: db._apply_events(events, root_id))
+
+    # ---------- 写线程 ---------- #
+    def _run(self):
+        try:
+            db = DBTools()      # 唯一的写连接
+        except BaseException as e:
+            self._error = e     # 不能让 start() 一直等下去
+            return
+        finally:
+            self._ready.set()
+        try:
+            while True:
+                job = self._q.get()
+                if job is _STOP:
+                    return
+                jobs = [job]
+                stop = False
+                while len(jobs) < MAX_JOBS_PER_TXN:
+                    try:
+                        job = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is _STOP:
+                        stop = True
+                        break
+                    jobs.append(job)
+                self._apply(db, jobs)
+                if stop:
+                    return
+        finally:
+            db.close()
+
+    def _apply(self, db: DBTools, jobs: list):
+        results = []
+        t0 = time.perf_counter()
+        _m_depth.set(self._q.qsize())
+        _m_jobs.observe(len(jobs))
+        try:
+            get_pool().configure(db.conn)     # 写连接长期持有：维护线程调整的 cache_size 等在这里补上
+            db.cur.execute("BEGIN IMMEDIATE")
+            for fn, fut in jobs:
+                db.cur.execute("SAVEPOINT job")
+                try:
+                    results.append((fut, fn(db), None))
+                    db.cur.execute("RELEASE job")
+                except Exception as e:
+                    db.cur.execute("ROLLBACK TO job")
+                    db.cur.execute("RELEASE job")
+                    error(f_name, "job", e)
+                    results.append((fut, None, e))
+            db._commit()            # 含目录汇总的 flush 与索引代数推进
+        except Exception as e:
+            try:
+                db.conn.rollback()
+            except Exception:
+                pass
+            error(f_name, "_apply", e)
+            results = [(fut, None, e) for _, fut in jobs]
+        _m_txn.observe((time.perf_counter() - t0) * 1000)
+        _m_failed.inc(sum(1 for _, _, exc in results if exc is not None))
+
+        # 提交后再通知调用方
+        for fut, result, exc in results:
+            if exc is None:
+                fut.set_result(result)
+            else:
+                fut.set_exception(exc)
+
+
+writer: Optional[DBWriter] = None      # 进程内唯一的写线程
+_lock = threading.Lock()
+
+
+def get_writer() -> DBWriter:
+    """取得（必要时启动）写线程"""
+    global writer
+    with _lock:
+        if writer is None or not writer.is_alive():
+            writer = DBWriter()
+            writer.start()
+        return writer
+
+
+def stop_writer():
+    global writer
+    with _lock:
+        if writer:
+            writer.stop()
+            writer = None
@@ -0,0 +1,24 @@
+import os, sys
+
+# assistant/cmd 与标准库 cmd 同名：在 assistant/ 下 python -m pytest 时当前目录排在 sys.path 最前，
+# pytest 导入 pdb（pdb 依赖标准库 cmd.Cmd）会拿到本地的 cmd 包而崩溃。
+# 这里先避开 assistant/ 导入 pdb，再把 sys.modules 中的 cmd 还原，本地的 cmd 包照常可用
+
+_here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_pdb():
+    local = sys.modules.pop("cmd", None)
+    path = sys.path[:]
+    sys.path[:] = [p for p in path if os.path.abspath(p or os.curdir) != _here]
+    try:
+        import pdb  # noqa: F401
+    finally:
+        sys.path[:] = path
+        sys.modules.pop("cmd", None)
+        if local is not None:
+            sys.modules["cmd"] = local
+
+
+if "pdb" not in sys.modules:
+    _import_pdb()
@@ -0,0 +1,73 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data.meta_data as meta_data
+import sql.db_tools as db_tools
+from sql.writer import stop_writer
+
+# 测试公用：每个用例一个临时库（db_tools.DB_FILE 指向临时目录）和一个临时目录树 self.root，配置取默认值，
+# 不读写 data/ 下的配置与数据库
+
+
+class DBTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="assistant_test_")
+        self.root = os.path.join(self.tmp, "root")
+        os.makedirs(self.root)
+        self._saved = meta_data._cache, db_tools.DB_FILE
+        meta_data._cache = {**meta_data._DEFAULTS, "WATCH_PATH": self.root}
+        db_tools.DB_FILE = os.path.join(self.tmp, "assistant.db")
+        self.db = db_tools.DBTools()
+
+    def tearDown(self):
+        self.db.close()
+        stop_writer()
+        pool = db_tools._pools.pop(db_tools.DB_FILE, None)
+        if pool is not None:
+            pool.close_all()
+        meta_data._cache, db_tools.DB_FILE = self._saved
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    # ---------- 磁盘 ---------- #
+    def p(self, rel: str) -> str:
+        """self.root 下的绝对路径（rel 用 / 分隔）"""
+        return os.path.join(self.root, *rel.split("/")) if rel else self.root
+
+    def make(self, *rels: str, data: str = "x"):
+        """建文件（rel 以 / 结尾时建目录），父目录自动创建"""
+        for rel in rels:
+            if rel.endswith("/"):
+                os.makedirs(self.p(rel.rstrip("/")), exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(self.p(rel)), exist_ok=True)
+                with open(self.p(rel), "w") as f:
+                    f.write(data)
+
+    # ---------- 库 ---------- #
+    def index(self, *rels: str, root_id: int = None):
+        """把 self.root 及给定路径写入 files（父目录先于子项）"""
+        self.db.upsert_many([self.root] + [self.p(r.rstrip("/")) for r in rels], root_id)
+
+    def paths(self) -> list:
+        """files 中 self.root 下的全部记录（相对路径，目录以 / 结尾），排序"""
+        rows = self.db.cur.execute("SELECT path, deleted FROM files").fetchall()
+        out = []
+        for path, is_dir in rows:
+            if path == self.root or not path.startswith(self.root + os.sep):
+                continue
+            rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+            out.append(rel + "/" if is_dir else rel)
+        return sorted(out)
+
+    def assert_tree_consistent(self):
+        """parent_id 都指向在库的父目录记录，dir_stats 与从 files 重算的结果一致"""
+        orphans = self.db.cur.execute("""
+        SELECT c.path FROM files c LEFT JOIN files p ON p.id = c.parent_id
+        WHERE c.parent_id IS NOT NULL AND p.id IS NULL
+        """).fetchall()
+        self.assertEqual(orphans, [])
+        before = self.db.cur.execute("SELECT dir_id, files, dirs, size FROM dir_stats ORDER BY dir_id").fetchall()
+        self.db.rebuild_rollup()
+        after = self.db.cur.execute("SELECT dir_id, files, dirs, size FROM dir_stats ORDER BY dir_id").fetchall()
+        self.assertEqual(before, after)
@@ -0,0 +1,69 @@
+import os, unittest
+from unittest import mock
+
+from support import DBTestCase
+import sql.db_tools as db_tools
+from sql.event_queue import FileEvent, CREATED, DELETED, MOVED, MODIFIED
+
+# 批量落库（DBTools.apply_events）：单条事件出错只跳过它自己，同批其他事件照常落库
+# 运行：assistant/ 下 python -m pytest tests（或 python -m unittest discover tests），仓库根目录下 python -m pytest assistant/tests
+
+
+class ApplyEventsTest(DBTestCase):
+    def test_applies_coalesced_batch(self):
+        self.make("a/1.txt", "a/2.txt")
+        self.index("a/", "a/1.txt", "a/2.txt")
+        os.remove(self.p("a/2.txt"))
+        self.make("a/3.txt")
+        os.rename(self.p("a/1.txt"), self.p("a/4.txt"))
+        stats = self.db.apply_events([
+            FileEvent(DELETED, self.p("a/2.txt")),
+            FileEvent(CREATED, self.p("a/3.txt")),
+            FileEvent(MOVED, self.p("a/1.txt"), False, self.p("a/4.txt")),
+        ])
+        self.assertEqual(stats["applied"], 3)
+        self.assertEqual(self.paths(), ["a/", "a/3.txt", "a/4.txt"])
+        self.assert_tree_consistent()
+
+    def test_vanished_file_is_skipped(self):
+        self.make("a.txt")
+        stats = self.db.apply_events([FileEvent(CREATED, self.p("gone.txt")), FileEvent(CREATED, self.p("a.txt"))])
+        self.assertEqual((stats["applied"], stats["skipped"]), (1, 1))
+        self.assertEqual(self.paths(), ["a.txt"])
+
+    def test_integrity_error_skips_only_that_event(self):
+        # 库中 b/ 下留有旧记录，磁盘上 a 改名为 b：范围改写 a/x → b/x 与旧记录冲突
+        self.make("a/x.txt", "b/x.txt", "c.txt")
+        self.index("a/", "a/x.txt", "b/", "b/x.txt")
+        os.remove(self.p("b/x.txt"))
+        os.rmdir(self.p("b"))
+        os.rename(self.p("a"), self.p("b"))
+        with mock.patch.object(db_tools, "error") as logged:
+            stats = self.db.apply_events([
+                FileEvent(MOVED, self.p("a"), True, self.p("b")),
+                FileEvent(CREATED, self.p("c.txt")),
+            ])
+        self.assertEqual((stats["applied"], stats["skipped"]), (1, 1))
+        self.assertEqual(logged.call_count, 1)
+        # 失败的目录移动整体撤销，新建照常落库
+        self.assertEqual(self.paths(), ["a/", "a/x.txt", "b/", "b/x.txt", "c.txt"])
+        self.assert_tree_consistent()
+
+    def test_permission_error_skips_only_that_event(self):
+        self.make("ok.txt", "locked.txt")
+        real = db_tools.cracker
+
+        def cracker(path):
+            if path.endswith("locked.txt"):
+                raise PermissionError(path)
+            return real(path)
+
+        with mock.patch.object(db_tools, "cracker", cracker), mock.patch.object(db_tools, "error"):
+            stats = self.db.apply_events([FileEvent(MODIFIED, self.p("locked.txt")),
+                                          FileEvent(CREATED, self.p("ok.txt"))])
+        self.assertEqual((stats["applied"], stats["skipped"]), (1, 1))
+        self.assertEqual(self.paths(), ["ok.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
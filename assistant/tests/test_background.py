@@ -0,0 +1,86 @@
+import time, unittest
+from unittest import mock
+
+from support import DBTestCase
+import sql.db_tools as db_tools
+from sql.background import BackgroundQueue
+
+# 后台队列：工作线程只在取补处理页、处理文件时借用连接，等待期间不占用连接池
+# 运行方式见 test_scanner.py
+
+
+class Recorder(BackgroundQueue):
+    STALE_SQL = "SELECT f.id, f.path FROM files f WHERE f.id > ? AND f.deleted = 0"
+
+    def __init__(self, workers: int):
+        super().__init__(lambda fn: None, workers, lambda: False)
+        self.seen = []
+
+    def _process(self, conn, path):
+        conn.execute("SELECT 1").fetchone()
+        with self._cond:
+            self.seen.append(path)
+
+
+class BackgroundQueueTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.files = [f"{i}.txt" for i in range(5)]
+        self.make(*self.files)
+        self.index(*self.files)
+        self.db.conn.commit()
+        self.pool = db_tools.get_pool()
+        self.base = self.pool.stats()["in_use"]     # self.db 借出的连接
+        self.q = None
+
+    def tearDown(self):
+        if self.q is not None:
+            self.q.stop()
+        super().tearDown()
+
+    def start(self, workers: int = 3) -> Recorder:
+        self.q = Recorder(workers)
+        self.q.start()
+        return self.q
+
+    def wait_for(self, n: int):
+        deadline = time.monotonic() + 5
+        while len(self.q.seen) < n and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+    def test_idle_workers_hold_no_connection(self):
+        self.start(4)
+        time.sleep(0.1)
+        self.assertEqual(self.pool.stats()["in_use"], self.base)
+        self.q.submit(self.p("0.txt"))
+        self.wait_for(1)
+        self.assertEqual(self.q.seen, [self.p("0.txt")])
+        self.assertEqual(self.pool.stats()["in_use"], self.base)
+
+    def test_stale_pages_processed_once(self):
+        with mock.patch("sql.background.STALE_PAGE", 2):
+            self.start(3)
+            self.q.submit_stale()
+            self.wait_for(len(self.files))
+        expected = [self.p(f) for f in self.files]     # 目录（deleted=1）不在补处理之列
+        self.assertEqual(sorted(self.q.seen), sorted(expected))
+        self.assertIsNone(self.q._stale)
+        self.assertEqual(self.pool.stats()["in_use"], self.base)
+
+    def test_refill_error_stops_stale_only(self):
+        self.q = Recorder(2)
+        self.q.STALE_SQL = "SELECT nope FROM files WHERE id > ?"
+        with mock.patch("sql.background.error") as err:
+            self.q.start()
+            self.q.submit_stale()
+            self.q.submit(self.p("1.txt"))
+            self.wait_for(1)
+        err.assert_called_once()
+        self.assertIsNone(self.q._stale)
+        self.assertEqual(self.q.seen, [self.p("1.txt")])
+        self.assertEqual(self.pool.stats()["in_use"], self.base)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os, shutil, unittest
+
+from support import DBTestCase
+from sql.event_queue import EventQueue, FileEvent, CREATED, DELETED, MOVED, MODIFIED
+
+# 事件合并：抵消、串联，以及删除后又新建的路径（原记录仍在库中）之后再删除/移走时不能抵消成无事发生
+# 运行方式见 test_scanner.py
+
+R = os.path.join(os.sep, "r")
+
+
+def p(name: str) -> str:
+    return os.path.join(R, name)
+
+
+def coalesce(*events) -> list:
+    q = EventQueue(lambda batch: None, flush_ms=0, batch_size=1 << 30)
+    for ev in events:
+        q.put(ev)
+    return sorted((ev.kind, ev.src, ev.dest, ev.replaces) for ev in q._take())
+
+
+class MergeTest(unittest.TestCase):
+    def test_create_then_delete_cancels(self):
+        self.assertEqual(coalesce(FileEvent(CREATED, p("y")), FileEvent(DELETED, p("y"))), [])
+
+    def test_repeated_modify_kept_once(self):
+        self.assertEqual(coalesce(FileEvent(MODIFIED, p("y")), FileEvent(MODIFIED, p("y"))),
+                         [(MODIFIED, p("y"), "", False)])
+
+    def test_moves_are_chained(self):
+        self.assertEqual(coalesce(FileEvent(MOVED, p("x"), False, p("y")), FileEvent(MOVED, p("y"), False, p("z"))),
+                         [(MOVED, p("x"), p("z"), False)])
+        self.assertEqual(coalesce(FileEvent(MOVED, p("x"), False, p("y")), FileEvent(MOVED, p("y"), False, p("x"))),
+                         [(MODIFIED, p("x"), "", False)])
+
+    def test_delete_create_replaces(self):
+        self.assertEqual(coalesce(FileEvent(DELETED, p("y")), FileEvent(CREATED, p("y"))),
+                         [(CREATED, p("y"), "", True)])
+
+    def test_delete_create_delete_keeps_delete(self):
+        self.assertEqual(coalesce(FileEvent(DELETED, p("y")), FileEvent(CREATED, p("y")), FileEvent(DELETED, p("y"))),
+                         [(DELETED, p("y"), "", False)])
+
+    def test_delete_create_move_keeps_delete(self):
+        self.assertEqual(coalesce(FileEvent(DELETED, p("y")), FileEvent(CREATED, p("y")),
+                                  FileEvent(MOVED, p("y"), False, p("z"))),
+                         [(CREATED, p("z"), "", False), (DELETED, p("y"), "", False)])
+
+    def test_move_onto_deleted_path_replaces(self):
+        self.assertEqual(coalesce(FileEvent(DELETED, p("y")), FileEvent(MOVED, p("x"), False, p("y"))),
+                         [(MOVED, p("x"), p("y"), True)])
+        # 再删除：两条原记录都要删
+        self.assertEqual(coalesce(FileEvent(DELETED, p("y")), FileEvent(MOVED, p("x"), False, p("y")),
+                                  FileEvent(DELETED, p("y"))),
+                         [(DELETED, p("x"), "", False), (DELETED, p("y"), "", False)])
+
+    def test_move_away_then_recreate_then_delete(self):
+        # x 移到 y，原处又新建 x，再删除 y：x 的原记录由新建替换
+        self.assertEqual(coalesce(FileEvent(MOVED, p("x"), False, p("y")), FileEvent(CREATED, p("x")),
+                                  FileEvent(DELETED, p("y"))),
+                         [(CREATED, p("x"), "", True)])
+
+    def test_requeue_merges_before_later_events(self):
+        # 落库失败的 x→y 放回队列时，之后到达的 删除 y 按发生顺序接在它后面合并
+        q = EventQueue(lambda batch: None, flush_ms=0, batch_size=1 << 30)
+        q.put(FileEvent(MOVED, p("x"), False, p("y")))
+        failed = q._take()
+        q.put(FileEvent(DELETED, p("y")))
+        q.requeue(failed)
+        self.assertEqual([(ev.kind, ev.src) for ev in q._take()], [(DELETED, p("x"))])
+
+    def test_dir_move_rekeys_children(self):
+        self.assertEqual(coalesce(FileEvent(CREATED, p("d/f")), FileEvent(MOVED, p("d"), True, p("e"))),
+                         [(CREATED, p("e/f"), "", False), (MOVED, p("d"), p("e"), False)])
+
+
+class CoalescedApplyTest(DBTestCase):
+    """合并后的批次落库：原记录都被删除或替换"""
+
+    def apply(self, *events):
+        q = EventQueue(lambda batch: None, flush_ms=0, batch_size=1 << 30)
+        for ev in events:
+            q.put(ev)
+        stats = self.db.apply_events(q._take())
+        self.assertEqual(stats["skipped"], 0)
+        self.assert_tree_consistent()
+
+    def test_delete_create_delete(self):
+        self.make("y.txt", "k.txt")
+        self.index("y.txt", "k.txt")
+        os.remove(self.p("y.txt"))
+        self.apply(FileEvent(DELETED, self.p("y.txt")), FileEvent(CREATED, self.p("y.txt")),
+                   FileEvent(DELETED, self.p("y.txt")))
+        self.assertEqual(self.paths(), ["k.txt"])
+
+    def test_delete_create_move(self):
+        self.make("y.txt")
+        self.index("y.txt")
+        os.rename(self.p("y.txt"), self.p("z.txt"))
+        self.apply(FileEvent(DELETED, self.p("y.txt")), FileEvent(CREATED, self.p("y.txt")),
+                   FileEvent(MOVED, self.p("y.txt"), False, self.p("z.txt")))
+        self.assertEqual(self.paths(), ["z.txt"])
+
+    def test_dir_replaced_by_file(self):
+        self.make("d/a.txt", "d/e/b.txt")
+        self.index("d/", "d/a.txt", "d/e/", "d/e/b.txt")
+        shutil.rmtree(self.p("d"))
+        self.make("d")
+        self.apply(FileEvent(DELETED, self.p("d"), True), FileEvent(CREATED, self.p("d")))
+        self.assertEqual(self.paths(), ["d"])
+
+    def test_dir_moved_onto_deleted_dir(self):
+        self.make("a/1.txt", "b/1.txt", "b/2.txt")
+        self.index("a/", "a/1.txt", "b/", "b/1.txt", "b/2.txt")
+        shutil.rmtree(self.p("b"))
+        os.rename(self.p("a"), self.p("b"))
+        self.apply(FileEvent(DELETED, self.p("b"), True), FileEvent(MOVED, self.p("a"), True, self.p("b")))
+        self.assertEqual(self.paths(), ["b/", "b/1.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
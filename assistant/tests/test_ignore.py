@@ -0,0 +1,69 @@
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql.ignore import IgnoreMatcher
+
+# 忽略规则：默认集合、.trackerignore 的 glob 与否定规则、被忽略目录下的子项、数据库文件
+# 只做字符串判定，不读写磁盘；运行方式见 test_scanner.py
+
+ROOT = os.path.abspath(os.path.join(os.sep, "watch", "Root"))
+
+
+def p(rel: str) -> str:
+    return os.path.join(ROOT, *rel.split("/"))
+
+
+class IgnoreMatcherTest(unittest.TestCase):
+    def matcher(self, patterns=(), negs=(), db_file=None) -> IgnoreMatcher:
+        return IgnoreMatcher(ROOT, list(patterns), list(negs), db_file or os.path.join(os.sep, "elsewhere", "a.db"))
+
+    def test_defaults(self):
+        m = self.matcher()
+        for rel in ("node_modules", "node_modules/x/y.js", "a/.git/config", "a/b.log", "a/Thumbs.DB", "x.PYC"):
+            self.assertTrue(m.ignored(p(rel)), rel)
+        for rel in ("a", "a/b.txt", "a/build.txt", "logs/x.txt"):
+            self.assertFalse(m.ignored(p(rel)), rel)
+
+    def test_glob_is_relative_and_case_insensitive(self):
+        m = self.matcher(["*.bak", "docs", "out/*.bin"])
+        self.assertTrue(m.ignored(p("a/b/C.BAK")))
+        self.assertTrue(m.ignored(p("docs")))
+        self.assertTrue(m.ignored(p("Docs/readme.md")))      # 目录被忽略，子项一律忽略
+        self.assertTrue(m.ignored(p("out/a.bin")))
+        self.assertFalse(m.ignored(p("a/docs.md")))
+        self.assertFalse(m.ignored(p("a/out/x.txt")))
+
+    def test_negation_overrides_globs_and_default_dirs(self):
+        m = self.matcher(["*.bak"], ["keep.bak", "build*", "env"])
+        self.assertTrue(m.ignored(p("x.bak")))
+        self.assertFalse(m.ignored(p("keep.bak")))
+        self.assertFalse(m.ignored(p("build")))
+        self.assertFalse(m.ignored(p("build/app.js")))      # 否定规则按整条相对路径匹配，* 可跨目录
+        self.assertFalse(m.ignored(p("env")))
+        self.assertTrue(m.ignored(p("env/x.py")))           # 只否定了目录本身
+        self.assertTrue(m.ignored(p("dist/app.js")))
+
+    def test_database_files(self):
+        db = p("data/a.db")
+        m = self.matcher(db_file=db)
+        for name in ("a.db", "a.db-wal", "a.db-journal"):
+            self.assertTrue(m.ignored(p("data/" + name)), name)
+        self.assertFalse(m.ignored(p("data/a.dbx")))
+
+    def test_ignored_in_matches_ignored(self):
+        m = self.matcher(["*.bak", "docs"])
+        for rel in ("a/x.bak", "docs/y.txt", "a/b/c.txt", "node_modules/z", "a/Desktop.ini"):
+            d, name = os.path.split(p(rel))
+            self.assertEqual(m.ignored_in(d, name), m.ignored(p(rel)), rel)
+            self.assertEqual(m.ignored(p(rel)), m.ignored(p(rel)), rel)     # 第二次走目录缓存
+
+    def test_outside_root_uses_absolute_path(self):
+        m = self.matcher()
+        other = os.path.abspath(os.path.join(os.sep, "other"))
+        self.assertTrue(m.ignored(os.path.join(other, "node_modules", "x.js")))
+        self.assertFalse(m.ignored(os.path.join(other, "x.js")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from support import DBTestCase
+import data.meta_data as meta_data
+import sql.db_tools as db_tools
+from sql import maintenance
+
+# 维护任务 cache：cache_size 的总预算均分到连接池的各连接
+# 运行方式见 test_scanner.py
+
+MB = maintenance.MB
+
+
+class IndexSize:
+    """包装连接：dbstat 查询返回给定的索引大小，其余语句照常执行"""
+
+    def __init__(self, conn, nbytes: int):
+        self.conn, self.nbytes = conn, nbytes
+
+    def execute(self, sql, *args):
+        if "dbstat" in sql:
+            return self.conn.execute("SELECT ?", (self.nbytes,))
+        return self.conn.execute(sql, *args)
+
+
+class TuneCacheTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = db_tools.get_pool()
+
+    def cache_mb(self, index_mb: float) -> float:
+        maintenance.tune_cache(IndexSize(self.db.conn, int(index_mb * MB)), lambda: True)
+        return -self.pool._pragmas["cache_size"] / 1024     # 负值单位为 KiB
+
+    def test_budget_is_shared_by_all_connections(self):
+        per_conn = self.cache_mb(500)
+        self.assertEqual(per_conn, meta_data._DEFAULTS["MAINT_CACHE_MAX_MB"] / self.pool.max_connections)
+        self.assertLessEqual(per_conn * self.pool.max_connections, meta_data._DEFAULTS["MAINT_CACHE_MAX_MB"])
+
+    def test_fewer_connections_get_larger_share(self):
+        self.pool.max_connections = 4
+        meta_data._cache["MAINT_CACHE_MAX_MB"] = 32
+        self.assertEqual(self.cache_mb(500), 8)
+        self.assertEqual(self.cache_mb(8), 2.5)         # 索引 × 1.25 低于预算时按索引大小
+
+    def test_small_index_keeps_sqlite_default(self):
+        self.assertEqual(self.cache_mb(1), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os, unittest
+from unittest import mock
+
+from support import DBTestCase
+from sql.ignore import IgnoreMatcher
+from sql import sync_rebuild
+from sql.sync_rebuild import rebuild_files_table, SHADOW_TABLES
+
+# 全量重建：在 files_new 上建好后短暂持锁换表；重建期间 files 上的写入记入 rebuild_touched，换表前重放
+# 运行方式见 test_scanner.py
+
+
+class RebuildTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a/1.txt", "a/b/2.txt", "c.txt", "d/")
+        self.index("a/", "a/1.txt", "a/b/", "a/b/2.txt", "c.txt", "d/", root_id=1)
+        self.db.cur.execute("UPDATE files SET note = 'keep' WHERE path = ?", (self.p("c.txt"),))
+        self.db.conn.commit()
+        self.ignored = IgnoreMatcher(self.root, [], []).ignored
+
+    def rebuild(self, **kw):
+        with mock.patch("builtins.print"):
+            return rebuild_files_table(self.root, self.ignored, root_id=1, **kw)
+
+    def note(self, rel: str):
+        row = self.db.cur.execute("SELECT note FROM files WHERE path = ?", (self.p(rel),)).fetchone()
+        return row and row[0]
+
+    def assert_swapped(self):
+        left = [t for t in SHADOW_TABLES
+                if self.db.cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (t,)).fetchone()]
+        self.assertEqual(left, [])
+        triggers = {n for (n,) in self.db.cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        self.assertIn("trg_files_updated_at", triggers)
+        self.assertFalse([n for n in triggers if n.startswith("trg_rebuild_")])
+        self.assert_tree_consistent()
+
+    def test_swap_matches_disk_and_keeps_notes(self):
+        os.remove(self.p("a/1.txt"))
+        self.make("d/3.txt")
+        stats = self.rebuild(chunk_size=2)
+        self.assertEqual(stats["scanned"], 7)       # 根目录 + 6 项
+        self.assertEqual(self.paths(), ["a/", "a/b/", "a/b/2.txt", "c.txt", "d/", "d/3.txt"])
+        self.assertEqual(self.note("c.txt"), "keep")
+        self.assertEqual(self.db.dir_stats(self.root)["files"], 3)
+        self.assert_swapped()
+
+    def test_writes_during_rebuild_are_replayed(self):
+        done = []
+
+        def write_once(stats):
+            # 扫描写入到一半时：监听器落库一次新增、一次删除，用户改了备注
+            if done:
+                return
+            done.append(stats["chunks"])
+            self.make("d/new.txt")
+            os.remove(self.p("a/b/2.txt"))
+            self.db.upsert_many([self.p("d/new.txt")], 1)
+            self.db.delete_many([self.p("a/b/2.txt")])
+            self.db.cur.execute("UPDATE files SET note = 'late' WHERE path = ?", (self.p("a/1.txt"),))
+            self.db.conn.commit()
+
+        with mock.patch.object(sync_rebuild, "PROGRESS_EVERY", 1):
+            stats = self.rebuild(chunk_size=1, progress=write_once)
+        self.assertEqual(done, [1])
+        self.assertGreater(stats["replayed"], 0)
+        self.assertEqual(self.paths(), ["a/", "a/1.txt", "a/b/", "c.txt", "d/", "d/new.txt"])
+        self.assertEqual(self.note("a/1.txt"), "late")
+        self.assertEqual(self.note("c.txt"), "keep")
+        self.assert_swapped()
+
+    def test_other_roots_are_kept(self):
+        other = os.path.join(self.tmp, "other")
+        os.makedirs(os.path.join(other, "x"))
+        with open(os.path.join(other, "x", "y.txt"), "w") as f:
+            f.write("y")
+        self.db.upsert_many([other, os.path.join(other, "x"), os.path.join(other, "x", "y.txt")], 2)
+        self.rebuild()
+        rows = self.db.cur.execute("""
+        SELECT c.path, p.path FROM files c LEFT JOIN files p ON p.id = c.parent_id WHERE c.root_id = 2 ORDER BY c.path
+        """).fetchall()
+        self.assertEqual(rows, [(other, None), (os.path.join(other, "x"), other),
+                                (os.path.join(other, "x", "y.txt"), os.path.join(other, "x"))])
+        self.assert_swapped()
+
+
+if __name__ == "__main__":
+    unittest.main()
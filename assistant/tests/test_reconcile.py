@@ -0,0 +1,93 @@
+import os, time, shutil, unittest
+
+from support import DBTestCase
+from sql.sync_rebuild import reconcile_files_table
+from sql.writer import get_writer
+
+# 增量对账：逐目录对比磁盘与库，差异按块经由写线程写入
+# 运行方式见 test_scanner.py
+
+PAST = time.time() - 3600
+
+
+class ReconcileTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a/1.txt", "a/b/2.txt", "a/b/c/3.txt", "d/4.txt", "5.txt")
+        self.age()
+        self.jobs = []
+
+    def age(self):
+        # 目录 mtime 精确到秒：先调旧，之后的改动一定能被看出来
+        for dirpath, dirnames, _ in os.walk(self.root):
+            for d in [dirpath] + [os.path.join(dirpath, n) for n in dirnames]:
+                os.utime(d, (PAST, PAST))
+
+    def submit(self, fn):
+        self.jobs.append(fn)
+        return get_writer().submit(fn)
+
+    def reconcile(self, ignore=lambda p: False, root_id=None, chunk_size=3):
+        return reconcile_files_table(self.root, ignore, root_id, submit=self.submit, chunk_size=chunk_size)
+
+    def test_fresh_index_is_written_in_chunks(self):
+        stats = self.reconcile()
+        self.assertEqual(stats["inserted"], 10)
+        self.assertEqual(self.paths(), ["5.txt", "a/", "a/1.txt", "a/b/", "a/b/2.txt", "a/b/c/", "a/b/c/3.txt",
+                                        "d/", "d/4.txt"])
+        self.assertGreaterEqual(len(self.jobs), 10 // 3)
+        self.assert_tree_consistent()
+
+    def test_second_run_skips_unchanged_dirs(self):
+        self.reconcile()
+        stats = self.reconcile()
+        self.assertEqual((stats["inserted"], stats["updated"], stats["deleted"]), (0, 0, 0))
+        self.assertEqual(stats["listed_dirs"], 0)
+
+    def test_changes_are_applied(self):
+        self.reconcile()
+        shutil.rmtree(self.p("a/b"))
+        self.make("d/6.txt")
+        with open(self.p("5.txt"), "w") as f:
+            f.write("longer")
+        os.utime(self.root)     # 原地修改不改变目录 mtime：这里让根目录被重新列举
+        stats = self.reconcile()
+        self.assertEqual((stats["inserted"], stats["updated"]), (1, 4))     # 6.txt；5.txt 与 根目录、a/、d/ 的 mtime
+        self.assertEqual(stats["deleted"], 4)                               # a/b 连同子树
+        self.assertEqual(self.paths(), ["5.txt", "a/", "a/1.txt", "d/", "d/4.txt", "d/6.txt"])
+        self.assert_tree_consistent()
+
+    def test_newly_ignored_subtree_is_dropped(self):
+        self.reconcile()
+        self.reconcile(ignore=lambda p: os.path.basename(p) == "b")
+        self.assertEqual(self.paths(), ["5.txt", "a/", "a/1.txt", "d/", "d/4.txt"])
+        self.assert_tree_consistent()
+
+    def test_dir_replaced_by_file(self):
+        self.reconcile()
+        shutil.rmtree(self.p("d"))
+        self.make("d")
+        self.reconcile()
+        self.assertEqual(self.paths(), ["5.txt", "a/", "a/1.txt", "a/b/", "a/b/2.txt", "a/b/c/", "a/b/c/3.txt", "d"])
+        self.assert_tree_consistent()
+
+    def test_stale_and_other_root_rows(self):
+        other = os.path.join(self.tmp, "other")
+        os.makedirs(other)
+        self.db.upsert_many([other], root_id=2)
+        self.reconcile(root_id=1)
+        # 孤立记录：父目录不在库中，磁盘上已不存在
+        self.db.cur.execute("BEGIN")
+        self.db.cur.execute("""
+        INSERT INTO files (path, name, case_key, ext, size, mtime, ctime, deleted, root_id, depth)
+        VALUES (?, 'x.txt', 'x.txt', '.txt', 0, 0, 0, 0, 1, 9)
+        """, (self.p("gone/x.txt"),))
+        self.db.conn.commit()
+        stats = self.reconcile(root_id=1)
+        self.assertEqual(stats["deleted"], 1)
+        self.assertNotIn("gone/x.txt", self.paths())
+        self.assertIsNotNone(self.db.cur.execute("SELECT 1 FROM files WHERE path = ?", (other,)).fetchone())
+
+
+if __name__ == "__main__":
+    unittest.main()
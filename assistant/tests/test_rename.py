@@ -0,0 +1,59 @@
+import os, unittest
+
+from support import DBTestCase
+from sql.event_queue import FileEvent, MOVED
+
+# 目录改名/移动：子树一条范围 UPDATE 改写前缀，id 与 parent_id 不变，深度整体平移，
+# 前缀相同的兄弟（a.txt、a-b/、ab.txt、a0/）不受影响
+# 运行方式见 test_scanner.py
+
+SIBLINGS = ["a-b/", "a-b/5.txt", "a.txt", "a0/", "a0/4.txt", "ab.txt"]
+
+
+class RenameDirTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a/b/1.txt", "a/b/c/2.txt", "a/3.txt", "a-b/5.txt", "a.txt", "ab.txt", "a0/4.txt", "x/")
+        self.index("a/", "a/b/", "a/b/1.txt", "a/b/c/", "a/b/c/2.txt", "a/3.txt",
+                   "a-b/", "a-b/5.txt", "a.txt", "ab.txt", "a0/", "a0/4.txt", "x/")
+
+    def ids(self) -> dict:
+        return dict(self.db.cur.execute("SELECT id, parent_id FROM files").fetchall())
+
+    def depth(self, rel: str) -> int:
+        return self.db.cur.execute("SELECT depth FROM files WHERE path = ?", (self.p(rel),)).fetchone()[0]
+
+    def test_rename_rewrites_subtree_only(self):
+        before = self.ids()
+        os.rename(self.p("a"), self.p("z"))
+        self.assertTrue(self.db.rename_dir(self.p("a"), self.p("z")))
+        self.assertEqual(self.paths(), sorted(SIBLINGS + ["x/", "z/", "z/3.txt", "z/b/", "z/b/1.txt",
+                                                          "z/b/c/", "z/b/c/2.txt"]))
+        self.assertEqual(self.ids(), before)        # 原地改名：id 与 parent_id 都不变
+        self.assertEqual(self.db.dir_stats(self.p("z"))["files"], 3)
+        self.assert_tree_consistent()
+
+    def test_move_into_deeper_dir_shifts_depth(self):
+        d = self.depth("a/b/c/2.txt")
+        os.rename(self.p("a"), self.p("x/a"))
+        self.assertTrue(self.db.rename_dir(self.p("a"), self.p("x/a")))
+        self.assertEqual(self.depth("x/a/b/c/2.txt"), d + 1)
+        self.assertEqual(self.db.dir_stats(self.p("x"))["files"], 3)
+        parent, x_id = (self.db.cur.execute("SELECT parent_id, id FROM files WHERE path = ?", (self.p(r),)).fetchone()
+                        for r in ("x/a", "x"))
+        self.assertEqual(parent[0], x_id[1])       # 目录本身挂到新的父目录下
+        self.assert_tree_consistent()
+
+    def test_moved_event_renames_subtree(self):
+        os.rename(self.p("a/b"), self.p("a0/b"))
+        stats = self.db.apply_events([FileEvent(MOVED, self.p("a/b"), True, self.p("a0/b"))])
+        self.assertEqual(stats["skipped"], 0)
+        self.assertIn("a0/b/c/2.txt", self.paths())
+        self.assertNotIn("a/b/", self.paths())
+        self.assertEqual(self.db.dir_stats(self.p("a"))["files"], 1)
+        self.assertEqual(self.db.dir_stats(self.p("a0"))["files"], 3)
+        self.assert_tree_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os, shutil, unittest
+
+from support import DBTestCase
+from sql.event_queue import FileEvent, CREATED, DELETED, MODIFIED, MOVED
+
+# 目录汇总：dir_stats / dir_ext_stats 由触发器记增量、提交前沿祖先链累加，结果与从 files 全量重算一致
+# 运行方式见 test_scanner.py
+
+
+class RollupTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a/1.txt", "a/b/2.txt", "a/b/3.pdf", data="12345")
+        self.make("c/4.TXT", data="xy")
+        self.index("a/", "a/1.txt", "a/b/", "a/b/2.txt", "a/b/3.pdf", "c/", "c/4.TXT", root_id=1)
+
+    def stats(self, rel: str) -> tuple:
+        s = self.db.dir_stats(self.p(rel))
+        return s["files"], s["dirs"], s["size"], sorted(s["exts"])
+
+    def snapshot(self) -> tuple:
+        return (self.db.cur.execute("SELECT * FROM dir_stats ORDER BY dir_id").fetchall(),
+                self.db.cur.execute("SELECT * FROM dir_ext_stats ORDER BY dir_id, ext").fetchall())
+
+    def assert_matches_recompute(self):
+        before = self.snapshot()
+        self.db.rebuild_rollup()
+        self.assertEqual(self.snapshot(), before)
+        self.assert_tree_consistent()
+
+    def test_recursive_totals(self):
+        self.assertEqual(self.stats("a/b"), (2, 0, 10, [(".pdf", 1, 5), (".txt", 1, 5)]))
+        self.assertEqual(self.stats("a"), (3, 1, 15, [(".pdf", 1, 5), (".txt", 2, 10)]))
+        self.assertEqual(self.stats(""), (4, 3, 17, [(".pdf", 1, 5), (".txt", 3, 12)]))     # 扩展名已转小写
+        self.assertIsNone(self.db.dir_stats(self.p("a/1.txt")))
+        self.assert_matches_recompute()
+
+    def test_events_update_ancestors(self):
+        with open(self.p("a/b/2.txt"), "w") as f:
+            f.write("1234567890")
+        self.make("c/d/5.pdf", data="abc")
+        os.remove(self.p("a/1.txt"))
+        self.db.apply_events([FileEvent(MODIFIED, self.p("a/b/2.txt")),
+                              FileEvent(CREATED, self.p("c/d"), True), FileEvent(CREATED, self.p("c/d/5.pdf")),
+                              FileEvent(DELETED, self.p("a/1.txt"))])
+        self.assertEqual(self.stats("a"), (2, 1, 15, [(".pdf", 1, 5), (".txt", 1, 10)]))
+        self.assertEqual(self.stats("c"), (2, 1, 5, [(".pdf", 1, 3), (".txt", 1, 2)]))
+        self.assertEqual(self.stats("")[:3], (4, 4, 20))
+        self.assert_matches_recompute()
+
+    def test_moving_dir_moves_its_totals(self):
+        os.rename(self.p("a/b"), self.p("c/b"))
+        self.db.apply_events([FileEvent(MOVED, self.p("a/b"), True, self.p("c/b"))])
+        self.assertEqual(self.stats("a"), (1, 0, 5, [(".txt", 1, 5)]))
+        self.assertEqual(self.stats("c"), (3, 1, 12, [(".pdf", 1, 5), (".txt", 2, 7)]))
+        self.assertEqual(self.stats("")[:3], (4, 3, 17))
+        self.assert_matches_recompute()
+
+    def test_deleting_dir_removes_its_totals(self):
+        shutil.rmtree(self.p("a/b"))
+        self.db.apply_events([FileEvent(DELETED, self.p("a/b"), True)])
+        self.assertEqual(self.stats("a"), (1, 0, 5, [(".txt", 1, 5)]))
+        self.assertEqual(self.stats("")[:3], (2, 2, 7))
+        self.assert_matches_recompute()
+
+    def test_renaming_file_moves_ext(self):
+        os.rename(self.p("a/1.txt"), self.p("a/1.md"))
+        self.db.apply_events([FileEvent(MOVED, self.p("a/1.txt"), False, self.p("a/1.md"))])
+        self.assertEqual(self.stats("a")[3], [(".md", 1, 5), (".pdf", 1, 5), (".txt", 1, 5)])
+        self.assert_matches_recompute()
+
+
+if __name__ == "__main__":
+    unittest.main()
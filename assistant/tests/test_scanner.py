@@ -0,0 +1,61 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql.ignore import IgnoreMatcher
+from sql.scanner import scan_tree, check_predicate
+
+# 扫描器：线程模式与进程模式产出相同的行；进程模式下不能 pickle 的谓词在调用时就报错
+# 运行：assistant/ 下 python -m pytest tests（或 python -m unittest discover tests），仓库根目录下 python -m pytest assistant/tests
+# （assistant/cmd 与标准库 cmd 同名，pytest 需要的 pdb 由 tests/conftest.py 先行导入）
+
+
+class ScanTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="scan_")
+        for d in ("a/b", "c", "node_modules/x"):
+            os.makedirs(os.path.join(self.root, d))
+        for f in ("a/1.txt", "a/b/2.PDF", "c/3.md", "node_modules/x/4.js", "5.log"):
+            open(os.path.join(self.root, f), "w").close()
+        self.matcher = IgnoreMatcher(self.root, [], [])
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _paths(self, processes):
+        rows = scan_tree(self.root, self.matcher.ignored, workers=2, processes=processes)
+        return sorted(os.path.relpath(r[0], self.root) for r in rows)
+
+    def test_processes_match_threads(self):
+        threads = self._paths(False)
+        self.assertEqual(threads, self._paths(True))
+        self.assertIn(os.path.join("a", "b", "2.PDF"), threads)
+        self.assertFalse(any(p.startswith("node_modules") or p.endswith(".log") for p in threads))
+
+    def test_ext_is_lowercase(self):
+        # 与 db_tools.cracker（监听器写入）一致，否则 ext = '.pdf' 查询与 dir_ext_stats 会按大小写分裂
+        exts = {r[1]: r[3] for r in scan_tree(self.root, self.matcher.ignored, processes=False)}
+        self.assertEqual(exts["2.PDF"], ".pdf")
+        self.assertEqual(exts["b"], "")
+
+    def test_unpicklable_predicate_fails_on_call(self):
+        import threading
+        lock = threading.Lock()
+        with self.assertRaises(TypeError):
+            scan_tree(self.root, lambda p: lock.locked(), processes=True)     # 未迭代即抛出
+        with self.assertRaises(TypeError):
+            check_predicate(lambda p: lock.locked(), processes=True)
+        check_predicate(lambda p: lock.locked(), processes=False)           # 线程模式不要求 pickle
+
+    def test_watch_root_matcher_is_picklable(self):
+        from sql.tracker import WatchRoot
+        root = WatchRoot(1, self.root)
+        self.assertTrue(self._paths(True))
+        with self.assertRaises(TypeError):
+            scan_tree(root.path, root.should_ignore, processes=True)
+        rows = list(scan_tree(root.path, root.matcher.ignored, workers=2, processes=True))
+        self.assertEqual(len(rows), len(self._paths(False)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from support import DBTestCase
+import sql.db_tools as db_tools
+
+# 建表检查：一次性迁移按 PRAGMA user_version 只执行一次
+# 运行方式见 test_scanner.py
+
+
+class SchemaMigrationTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a.PDF")
+        self.index("a.PDF")
+        # 模拟旧版全量扫描写入的大写扩展名
+        self.db.cur.execute("UPDATE files SET ext = '.PDF' WHERE path = ?", (self.p("a.PDF"),))
+        self.db.conn.commit()
+
+    def ext(self) -> str:
+        return self.db.cur.execute("SELECT ext FROM files WHERE path = ?", (self.p("a.PDF"),)).fetchone()[0]
+
+    def version(self) -> int:
+        return self.db.cur.execute("PRAGMA user_version").fetchone()[0]
+
+    def test_new_db_is_current(self):
+        self.assertEqual(self.version(), db_tools.SCHEMA_VERSION)
+
+    def test_migrated_db_skips_ext_rewrite(self):
+        self.db._ensure_schema()
+        self.assertEqual(self.ext(), ".PDF")
+
+    def test_old_db_lowercases_ext_once(self):
+        self.db.cur.execute("PRAGMA user_version = 0")
+        self.db._ensure_schema()
+        self.assertEqual(self.ext(), ".pdf")
+        self.assertEqual(self.version(), db_tools.SCHEMA_VERSION)
+        self.assertFalse(self.db.conn.in_transaction)
+        self.assert_tree_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os, shutil, unittest
+
+from support import DBTestCase
+from sql.event_queue import FileEvent, DELETED
+
+# 删除目录：原生监听只发目录本身的删除事件，子树记录一起删除，parent_id 与目录汇总保持一致
+# 运行方式见 test_scanner.py
+
+
+class SubtreeDeleteTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a/b/1.txt", "a/b/c/2.txt", "a/3.txt", "ab.txt", "a0/4.txt")
+        self.index("a/", "a/b/", "a/b/1.txt", "a/b/c/", "a/b/c/2.txt", "a/3.txt", "ab.txt", "a0/", "a0/4.txt")
+
+    def test_deleting_dir_removes_children(self):
+        shutil.rmtree(self.p("a/b"))
+        stats = self.db.apply_events([FileEvent(DELETED, self.p("a/b"), True)])
+        self.assertEqual(stats["applied"], 1)
+        self.assertEqual(self.paths(), ["a/", "a/3.txt", "a0/", "a0/4.txt", "ab.txt"])
+        self.assertEqual(self.db.dir_stats(self.p("a"))["files"], 1)
+        self.assert_tree_consistent()
+
+    def test_siblings_sharing_prefix_are_kept(self):
+        # 'a' 的范围是 'a/' ~ 'a0'（不含）：'ab.txt'、'a0/' 不在其中
+        shutil.rmtree(self.p("a"))
+        self.db.apply_events([FileEvent(DELETED, self.p("a"), True)])
+        self.assertEqual(self.paths(), ["a0/", "a0/4.txt", "ab.txt"])
+        self.assert_tree_consistent()
+
+    def test_child_events_after_dir_delete_are_harmless(self):
+        # 轮询监听会为子项逐个补发删除事件
+        shutil.rmtree(self.p("a/b"))
+        stats = self.db.apply_events([FileEvent(DELETED, self.p(r)) for r in ("a/b/1.txt", "a/b/c/2.txt")]
+                                     + [FileEvent(DELETED, self.p("a/b/c"), True), FileEvent(DELETED, self.p("a/b"), True)])
+        self.assertEqual(stats["skipped"], 0)
+        self.assertEqual(self.paths(), ["a/", "a/3.txt", "a0/", "a0/4.txt", "ab.txt"])
+        self.assert_tree_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
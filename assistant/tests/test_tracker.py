@@ -0,0 +1,55 @@
+import sqlite3, unittest
+from unittest import mock
+
+from support import DBTestCase
+import sql.tracker as tracker
+from sql.event_queue import EventQueue, FileEvent, CREATED
+
+# 监听根目录的整批落库：写线程整批失败时重试，仍失败则放回事件队列，不丢弃事件
+# 运行方式见 test_scanner.py
+
+
+class ApplyBatchRetryTest(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make("a.txt")
+        self.root_obj = tracker.WatchRoot(1, self.root)
+        self.root_obj.event_queue = EventQueue(self.root_obj.apply_batch, flush_ms=0, batch_size=1 << 30)
+        self.events = [FileEvent(CREATED, self.p("a.txt"))]
+        patches = [mock.patch.object(tracker, "APPLY_RETRY_DELAY", 0), mock.patch.object(tracker, "error"),
+                   mock.patch.object(tracker, "_enqueue_background")]
+        for pt in patches:
+            pt.start()
+            self.addCleanup(pt.stop)
+
+    def flaky_writer(self, failures: int):
+        real = tracker.get_writer()
+        calls = []
+
+        def result(events, root_id):
+            calls.append(len(events))
+            if len(calls) <= failures:
+                raise sqlite3.OperationalError("database is locked")
+            return real.submit_events(events, root_id).result()
+
+        writer = mock.Mock()
+        writer.submit_events.side_effect = lambda events, root_id: mock.Mock(result=lambda: result(events, root_id))
+        return writer, calls
+
+    def test_transient_failure_is_retried(self):
+        writer, calls = self.flaky_writer(2)
+        with mock.patch.object(tracker, "get_writer", return_value=writer):
+            self.root_obj.apply_batch(self.events)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.paths(), ["a.txt"])
+
+    def test_persistent_failure_is_requeued(self):
+        writer, calls = self.flaky_writer(tracker.APPLY_RETRIES + 1)
+        with mock.patch.object(tracker, "get_writer", return_value=writer):
+            self.root_obj.apply_batch(self.events)
+        self.assertEqual(self.paths(), [])
+        self.assertEqual([ev.src for ev in self.root_obj.event_queue._take()], [self.p("a.txt")])
+
+
+if __name__ == "__main__":
+    unittest.main()
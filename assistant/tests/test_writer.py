@@ -0,0 +1,30 @@
+import os, sys, threading, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql import writer
+
+# 写线程：连接/建表失败时 start() 抛出异常，而不是一直等待就绪
+# 运行方式见 test_scanner.py
+
+
+class WriterStartTest(unittest.TestCase):
+    def test_start_raises_when_connect_fails(self):
+        w = writer.DBWriter()
+        done = threading.Event()
+
+        def start():
+            with self.assertRaises(RuntimeError):
+                w.start()
+            done.set()
+
+        with mock.patch.object(writer, "DBTools", side_effect=RuntimeError("no db")):
+            t = threading.Thread(target=start, daemon=True)
+            t.start()
+            self.assertTrue(done.wait(5), "start() 未返回")
+        self.assertFalse(w.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()